@@ -0,0 +1,485 @@
+"""
+Benchmark of the separation pipeline.
+
+Measures, for each model, the time spent in every stage of
+AudioSeparator.separate_stems on synthetic audio fixtures:
+
+- load: getting the model from the model registry
+- decode: reading the input file into a tensor
+- inference: running the model (apply_model)
+- postprocess: extracting the stem tensors (instrumental mix, CPU copies)
+- encode: MP3 encoding of every stem
+
+No network access is needed for the fixtures; model weights must already be
+in the torch hub cache (run the application once per model to download them).
+
+Each (model, backend, duration) case runs in its own process, so model
+loading is cold and the peak RSS of every case is measured independently.
+The fixtures are mixes of known components, so every case also reports the
+SDR of each stem, and non-eager inference backends (--backends) are compared
+with eager on speed and SDR. Results are written
+as JSON that can be diffed or compared with a previous run (--compare), and
+can be turned into calibration data for estimate_processing_time (--calibrate).
+
+Usage:
+    python benchmarks/benchmark_separation.py
+    python benchmarks/benchmark_separation.py --models mdx_extra_q --durations 10 60 --output new.json
+    python benchmarks/benchmark_separation.py --compare baseline.json
+    python benchmarks/benchmark_separation.py --models mdx_extra_q --backends eager int8
+    python benchmarks/benchmark_separation.py --calibrate
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+import numpy as np
+
+# Add project root to Python path for imports
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+logger = logging.getLogger("benchmark")
+
+STAGES = ['load', 'decode', 'inference', 'postprocess', 'encode']
+# Stages that scale with the input duration (used for real-time factors)
+PROCESSING_STAGES = ['decode', 'inference', 'postprocess', 'encode']
+
+DEFAULT_DURATIONS = [10, 30, 60]
+DEFAULT_STEMS = ['vocals', 'instrumental']
+SAMPLE_RATE = 44100
+
+
+def make_fixture(path: str, seconds: float, sample_rate: int = SAMPLE_RATE, seed: int = 0) -> str:
+    """
+    Writes a deterministic synthetic song as a 16-bit stereo WAV file.
+
+    The signal mixes a voice-like tone with vibrato and syllable envelopes,
+    a bass line, decaying noise bursts (drums) and a chord pad, so every
+    source of the model has something to separate. The components are saved
+    as float32 [channels, length] arrays next to the fixture (see
+    reference_path) to measure the separation quality.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+
+    # Voice: harmonics with vibrato, gated in syllables
+    pitch = 220 * (1 + 0.01 * np.sin(2 * np.pi * 5 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    voice *= 0.5 + 0.5 * np.sin(2 * np.pi * 2 * t).clip(0)
+
+    # Bass: root notes changing every second
+    roots = np.array([55.0, 65.41, 73.42, 49.0])[(t // 1).astype(int) % 4]
+    bass = np.sin(2 * np.pi * np.cumsum(roots) / sample_rate)
+
+    # Drums: noise bursts on every beat (120 bpm)
+    beat_position = t % 0.5
+    drums = rng.standard_normal(len(t)) * np.exp(-beat_position * 30)
+
+    # Pad: a sustained chord
+    pad = sum(np.sin(2 * np.pi * f * t) for f in (261.63, 329.63, 392.0)) / 3
+
+    components = {
+        'vocals': np.stack([0.3 * voice, 0.3 * voice]),
+        'bass': np.stack([0.3 * bass, 0.2 * bass]),
+        'drums': np.stack([0.2 * drums, 0.3 * drums]),
+        'other': np.stack([0.2 * pad, 0.2 * np.roll(pad, sample_rate // 100)]),
+    }
+    stereo = sum(components.values())
+    scale = 0.9 / max(1e-9, np.abs(stereo).max())
+
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes((stereo.T * scale * 32767).astype('<i2').tobytes())
+    np.savez(reference_path(path), **{
+        name: (component * scale).astype(np.float32) for name, component in components.items()
+    })
+    return path
+
+
+def reference_path(fixture: str) -> str:
+    """File with the components of a fixture written by make_fixture."""
+    return os.path.splitext(fixture)[0] + ".stems.npz"
+
+
+def reference_stem(references, stem: str) -> np.ndarray:
+    """Expected audio of a stem ('instrumental' is everything but the vocals)."""
+    if stem == 'instrumental':
+        return references['drums'] + references['bass'] + references['other']
+    return references[stem]
+
+
+def signal_to_distortion(reference: np.ndarray, estimate: np.ndarray) -> float:
+    """SDR in dB of an estimated stem: 10 log10(|reference|^2 / |reference - estimate|^2)."""
+    length = min(reference.shape[-1], estimate.shape[-1])
+    reference, estimate = reference[..., :length], estimate[..., :length]
+    error = np.sum((reference - estimate) ** 2)
+    return float(10 * np.log10((np.sum(reference ** 2) + 1e-9) / (error + 1e-9)))
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of the current process in MB."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_case(
+    model_name: str,
+    fixture: str,
+    duration: float,
+    device: str = 'cpu',
+    preset: Optional[str] = None,
+    stems: Optional[List[str]] = None,
+    repeat: int = 1,
+    threads: Optional[int] = None,
+    backend: str = 'eager'
+) -> dict:
+    """
+    Runs every stage of the pipeline on a fixture and times it.
+
+    Returns:
+        Dict with the median seconds per stage, real-time factors, peak RSS
+        and the SDR of each stem
+    """
+    import torch
+    from src.core.encoder import encode_stems
+    from src.core.model_registry import get_model_registry
+    from src.core.runtime import configure_runtime, get_runtime_profile
+    from src.core.separator import AudioSeparator, OUTPUT_BITRATE, OUTPUT_FORMAT
+
+    if threads:
+        configure_runtime(threads=threads)
+    get_model_registry().set_backend(backend)
+    torch.manual_seed(0)
+    stems = stems or DEFAULT_STEMS
+
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as output_dir:
+        start = time.perf_counter()
+        separator = AudioSeparator(output_dir=output_dir, model_name=model_name, device=device)
+        load_seconds = time.perf_counter() - start
+        settings = separator.get_separation_settings(stems, preset=preset)
+
+        timings: Dict[str, List[float]] = {stage: [] for stage in PROCESSING_STAGES}
+        references = np.load(reference_path(fixture))
+        sdr: Dict[str, float] = {}
+        for _ in range(max(1, repeat)):
+            start = time.perf_counter()
+            wav_data = separator._load_audio(fixture)
+            timings['decode'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            sources = separator._separate(wav_data, settings)
+            timings['inference'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            audio = {stem: separator._get_stem_audio(sources, stem) for stem in stems}
+            timings['postprocess'].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            outputs = {stem: os.path.join(output_dir, f"{stem}.{OUTPUT_FORMAT}") for stem in stems}
+            encode_stems(outputs, audio.__getitem__, separator.samplerate, OUTPUT_FORMAT, OUTPUT_BITRATE)
+            timings['encode'].append(time.perf_counter() - start)
+
+            sdr = {
+                stem: round(signal_to_distortion(reference_stem(references, stem), audio[stem].numpy()), 2)
+                for stem in stems if stem == 'instrumental' or stem in references
+            }
+            del wav_data, sources, audio
+
+    stages = {stage: statistics.median(values) for stage, values in timings.items()}
+    stages['load'] = load_seconds
+    processing = sum(stages[stage] for stage in PROCESSING_STAGES)
+    return {
+        'model': model_name,
+        'backend': separator.backend,
+        'device': device,
+        'duration_seconds': duration,
+        'stems': stems,
+        'settings': settings,
+        'repeat': max(1, repeat),
+        'torch_threads': torch.get_num_threads(),
+        'runtime': get_runtime_profile().to_dict(),
+        'stages': {stage: round(stages[stage], 4) for stage in STAGES},
+        'processing_seconds': round(processing, 4),
+        'rtf': round(processing / duration, 4),
+        'inference_rtf': round(stages['inference'] / duration, 4),
+        'peak_rss_mb': _peak_rss_mb(),
+        'sdr_db': sdr,
+    }
+
+
+def _run_isolated(args: tuple, in_process: bool) -> dict:
+    """Runs a case in a fresh process (or in this one when in_process is set)."""
+    if in_process:
+        return run_case(*args)
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(run_case, *args).result()
+
+
+def collect_metadata() -> dict:
+    """Describes the environment the benchmark ran on."""
+    import torch
+    try:
+        import demucs
+        demucs_version = getattr(demucs, '__version__', 'unknown')
+    except ImportError:
+        demucs_version = None
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=project_root, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'timestamp': time.time(),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'demucs': demucs_version,
+        'cuda_available': torch.cuda.is_available(),
+    }
+
+
+def run_benchmark(
+    models: List[str],
+    durations: List[float],
+    device: str = 'cpu',
+    preset: Optional[str] = None,
+    stems: Optional[List[str]] = None,
+    repeat: int = 1,
+    threads: Optional[int] = None,
+    in_process: bool = False,
+    backends: Optional[List[str]] = None
+) -> dict:
+    """
+    Benchmarks every (model, backend, duration) combination.
+
+    Returns:
+        Dict with environment metadata, one result per case (failed cases
+        carry an 'error' instead of timings) and the comparison of each
+        backend with eager
+    """
+    backends = backends or ['eager']
+    results = []
+    with tempfile.TemporaryDirectory(prefix="benchmark-fixtures-") as fixtures_dir:
+        fixtures = {
+            duration: make_fixture(os.path.join(fixtures_dir, f"fixture_{duration:g}s.wav"), duration)
+            for duration in durations
+        }
+        for model_name in models:
+            for backend in backends:
+                for duration in durations:
+                    logger.info(f"⏱️ {model_name} ({backend}) on {duration:g}s of audio...")
+                    args = (model_name, fixtures[duration], duration, device, preset, stems, repeat, threads, backend)
+                    try:
+                        result = _run_isolated(args, in_process)
+                    except Exception as e:
+                        logger.error(f"❌ {model_name} ({backend}, {duration:g}s) failed: {e}")
+                        result = {
+                            'model': model_name, 'backend': backend, 'device': device,
+                            'duration_seconds': duration, 'error': str(e)
+                        }
+                    results.append(result)
+    report = {'meta': collect_metadata(), 'results': results}
+    report['backends'] = compare_backends(report)
+    return report
+
+
+def compare_backends(report: dict) -> List[dict]:
+    """
+    Compares every non-eager case with the eager case of the same model and duration.
+
+    Returns:
+        One entry per case with the inference speed-up over eager and the
+        SDR delta in dB of each stem (negative = less accurate than eager)
+    """
+    eager = {
+        (result['model'], result['duration_seconds']): result
+        for result in report['results'] if 'error' not in result and result.get('backend', 'eager') == 'eager'
+    }
+    comparisons = []
+    for result in report['results']:
+        baseline = eager.get((result['model'], result['duration_seconds']))
+        if 'error' in result or result.get('backend', 'eager') == 'eager' or baseline is None:
+            continue
+        sdr_delta = {
+            stem: round(value - baseline['sdr_db'][stem], 2)
+            for stem, value in result.get('sdr_db', {}).items() if stem in baseline.get('sdr_db', {})
+        }
+        comparisons.append({
+            'model': result['model'],
+            'backend': result['backend'],
+            'duration_seconds': result['duration_seconds'],
+            'inference_speedup': round(baseline['stages']['inference'] / max(1e-9, result['stages']['inference']), 3),
+            'sdr_delta_db': sdr_delta,
+        })
+    return comparisons
+
+
+def print_results(report: dict):
+    """Prints a summary table of a benchmark report."""
+    header = (
+        f"{'model':<14}{'backend':<9}{'audio':>8}" + "".join(f"{stage:>13}" for stage in STAGES)
+        + f"{'RTF':>9}{'RSS MB':>9}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in report['results']:
+        line = f"{result['model']:<14}{result.get('backend', 'eager'):<9}{result['duration_seconds']:>7g}s"
+        if 'error' in result:
+            print(f"{line}  error: {result['error']}")
+            continue
+        line += "".join(f"{result['stages'][stage]:>12.3f}s" for stage in STAGES)
+        rss = result['peak_rss_mb']
+        line += f"{result['rtf']:>9.3f}" + (f"{rss:>9.0f}" if rss is not None else f"{'-':>9}")
+        print(line)
+
+    if report.get('backends'):
+        print(f"\n{'model':<14}{'backend':<9}{'audio':>8}{'speed-up':>10}  SDR delta vs eager (dB)")
+        for comparison in report['backends']:
+            deltas = ", ".join(f"{stem} {delta:+.2f}" for stem, delta in comparison['sdr_delta_db'].items())
+            print(
+                f"{comparison['model']:<14}{comparison['backend']:<9}{comparison['duration_seconds']:>7g}s"
+                f"{comparison['inference_speedup']:>9.2f}x  {deltas}"
+            )
+
+
+def compare_results(baseline: dict, current: dict):
+    """Prints the per-stage change between two benchmark reports."""
+    def index(report):
+        return {
+            (result['model'], result.get('backend', 'eager'), result['duration_seconds']): result
+            for result in report['results'] if 'error' not in result
+        }
+
+    old, new = index(baseline), index(current)
+    print(f"{'model':<14}{'backend':<9}{'audio':>8}{'stage':>13}{'baseline':>11}{'current':>11}{'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        for stage in STAGES + ['processing']:
+            if stage == 'processing':
+                before, after = old[key]['processing_seconds'], new[key]['processing_seconds']
+            else:
+                before, after = old[key]['stages'][stage], new[key]['stages'][stage]
+            change = (after - before) / before * 100 if before else 0.0
+            print(f"{key[0]:<14}{key[1]:<9}{key[2]:>7g}s{stage:>13}{before:>10.3f}s{after:>10.3f}s{change:>+8.1f}%")
+
+
+def calibration_from_results(report: dict, backend: str = 'eager') -> dict:
+    """
+    Derives real-time factors per model and device from benchmark results.
+
+    Args:
+        report: Benchmark report
+        backend: Only use the results of this inference backend (the one the server runs)
+
+    Returns:
+        Dict of model -> device -> {rtf, encode_rtf_per_stem, load_seconds}
+    """
+    grouped: Dict[tuple, List[dict]] = {}
+    for result in report['results']:
+        if 'error' not in result and result.get('backend', 'eager') == backend:
+            grouped.setdefault((result['model'], result['device']), []).append(result)
+
+    models: Dict[str, dict] = {}
+    for (model_name, device), results in grouped.items():
+        rtf = statistics.median(
+            (r['stages']['decode'] + r['stages']['inference'] + r['stages']['postprocess']) / r['duration_seconds']
+            for r in results
+        )
+        encode_rtf = statistics.median(
+            r['stages']['encode'] / r['duration_seconds'] / len(r['stems']) for r in results
+        )
+        models.setdefault(model_name, {})[device] = {
+            'rtf': round(rtf, 4),
+            'encode_rtf_per_stem': round(encode_rtf, 5),
+            'load_seconds': round(statistics.median(r['stages']['load'] for r in results), 3),
+            'settings': results[0]['settings'],
+        }
+    return models
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.core.backends import BACKENDS, DEFAULT_BACKEND
+    from src.core.model_registry import SUPPORTED_MODELS
+    from src.core.presets import PRESETS
+
+    parser = argparse.ArgumentParser(description="Benchmark the separation pipeline stage by stage.")
+    parser.add_argument("--models", nargs="+", default=SUPPORTED_MODELS, choices=SUPPORTED_MODELS)
+    parser.add_argument("--durations", nargs="+", type=float, default=DEFAULT_DURATIONS,
+                        help="Fixture durations in seconds")
+    parser.add_argument("--device", default="cpu", help="Torch device (default: cpu)")
+    parser.add_argument("--preset", choices=list(PRESETS), default=None,
+                        help="Speed/quality preset (default: the application default)")
+    parser.add_argument("--stems", default=",".join(DEFAULT_STEMS), help="Comma separated stems to encode")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case (the median is reported)")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--backends", nargs="+", default=["eager"], choices=list(BACKENDS),
+                        help="Inference backends to run (include eager to get SDR deltas)")
+    parser.add_argument("--output", default="benchmark-results.json", help="Where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="Previous results to compare against")
+    parser.add_argument("--calibrate", nargs="?", const="", metavar="PATH",
+                        help="Write calibration data for processing time estimates "
+                             "(default path: VOICE_SEPARATOR_CALIBRATION)")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Run every case in this process (faster, but peak RSS accumulates)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for name in ("src", "demucs"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    stems = [stem.strip() for stem in args.stems.split(",") if stem.strip()]
+    report = run_benchmark(
+        args.models, args.durations, args.device, args.preset, stems,
+        args.repeat, args.threads, args.in_process, args.backends
+    )
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print_results(report)
+    print(f"\n📄 Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        compare_results(baseline, report)
+
+    if args.calibrate is not None:
+        from src.core.calibration import save_calibration
+        models = calibration_from_results(report, DEFAULT_BACKEND)
+        if not models:
+            print("No successful results, calibration not written.")
+            return 1
+        path = save_calibration(models, report['meta'], args.calibrate or None)
+        print(f"📏 Calibration written to {path}")
+
+    return 1 if any('error' in result for result in report['results']) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -59,7 +59,7 @@ echo "🔍 Verificando instalação..."
 python3 -c "import torch; print('✅ PyTorch instalado:', torch.__version__)"
 python3 -c "import demucs; print('✅ Demucs instalado')"
 python3 -c "import fastapi; print('✅ FastAPI instalado')"
-python3 -c "from pydub import AudioSegment; print('✅ pydub instalado')"
+python3 -c "import yt_dlp; print('✅ yt-dlp instalado')"
 
 echo ""
 echo "🎉 Configuração concluída com sucesso!"
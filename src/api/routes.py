@@ -1,17 +1,32 @@
+import asyncio
+import json
 import os
+import shutil
 import tempfile
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
 from typing import List, Optional
 from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Form
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 import logging
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Starts the worker processes or connects to the broker (if enabled) before the first request."""
+    from src.core import get_job_manager
+    
+    get_job_manager()
+    yield
+
+
 # Create FastAPI instance
 app = FastAPI(
     title="Voice Separator by Fernando Paladini", 
@@ -20,7 +35,8 @@ app = FastAPI(
     contact={
         "name": "Fernando Paladini",
         "url": "https://github.com/paladini",
-    }
+    },
+    lifespan=lifespan
 )
 
 # Create output directory if it doesn't exist (relative to project root)
@@ -34,6 +50,26 @@ app.mount("/static", StaticFiles(directory=str(project_root / "static")), name="
 # Configure templates
 templates = Jinja2Templates(directory=str(project_root / "templates"))
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Counts requests and observes their latency per route."""
+    from src.core import HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+    
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template (e.g. /api/jobs/{job_id}) to keep cardinality bounded
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        HTTP_REQUESTS.inc(method=request.method, route=path, status=str(status))
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start_time, method=request.method, route=path)
+
+
 # Accepted audio formats
 ALLOWED_AUDIO_FORMATS = {
     "audio/mpeg",  # MP3
@@ -47,6 +83,43 @@ ALLOWED_AUDIO_FORMATS = {
 # Accepted file extensions
 ALLOWED_EXTENSIONS = {".mp3", ".wav", ".flac", ".m4a", ".aac"}
 
+# Upload settings: each uploaded file is rejected above the size limit
+MAX_UPLOAD_BYTES = int(float(os.environ.get("VOICE_SEPARATOR_MAX_UPLOAD_MB", "500")) * 1024 * 1024)
+# Where uploads wait for their job (default: the system temp directory; must be
+# storage shared with the separation nodes when jobs go through a broker)
+UPLOAD_DIR = os.environ.get("VOICE_SEPARATOR_UPLOAD_DIR") or None
+# Room for the other form fields and multipart headers
+UPLOAD_FORM_OVERHEAD = 64 * 1024
+
+# Progressive streaming settings
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_POLL_INTERVAL = 0.25
+
+# Largest number of tracks accepted by POST /api/batch (use the CLI for bigger backfills)
+MAX_BATCH_ITEMS = int(os.environ.get("VOICE_SEPARATOR_MAX_BATCH_ITEMS", "100"))
+
+# Server-Sent Events settings
+EVENTS_KEEPALIVE_INTERVAL = 15.0
+
+
+@app.middleware("http")
+async def limit_upload_size(request: Request, call_next):
+    """
+    Rejects uploads announcing a body larger than their files may add up to, before it is received.
+    
+    The limit applies per file (see _save_upload): a batch may carry MAX_BATCH_ITEMS of them.
+    """
+    content_length = request.headers.get("content-length")
+    max_files = MAX_BATCH_ITEMS if request.url.path == "/api/batch" else 1
+    if request.method == "POST" and content_length and content_length.isdigit() \
+            and int(content_length) > max_files * MAX_UPLOAD_BYTES + UPLOAD_FORM_OVERHEAD:
+        return JSONResponse(status_code=413, content={"detail": _upload_too_large_message()})
+    return await call_next(request)
+
+
+def _upload_too_large_message() -> str:
+    return f"File too large. Limit: {MAX_UPLOAD_BYTES / (1024 * 1024):.0f} MB"
+
 
 @app.get("/", response_class=HTMLResponse)
 async def read_root(request: Request):
@@ -62,11 +135,14 @@ async def get_available_stems():
     Returns:
         JSON with available stems information
     """
-    from src.core import AVAILABLE_STEMS, AudioSeparator
+    from src.core import AVAILABLE_STEMS, DEFAULT_PRESET, PRESETS, SEPARATION_MODES
     
     return {
         "success": True,
         "stems": AVAILABLE_STEMS,
+        "modes": list(SEPARATION_MODES),
+        "presets": PRESETS,
+        "default_preset": DEFAULT_PRESET,
         "default_selection": ["vocals"],
         "recommendations": {
             "fast": ["vocals"],
@@ -76,111 +152,471 @@ async def get_available_stems():
     }
 
 
+@app.get("/api/models")
+async def get_models():
+    """
+    Endpoint to get supported models and model registry statistics.
+    
+    Returns:
+        JSON with supported models, inference backends, loaded models and cache hit/miss/load-time stats
+    """
+    from src.core import BACKENDS, SUPPORTED_MODELS, get_model_registry
+    
+    return {
+        "success": True,
+        "models": SUPPORTED_MODELS,
+        "backends": BACKENDS,
+        "registry": get_model_registry().get_stats()
+    }
+
+
+def _validate_model(model: str):
+    """Raises HTTP 400 if the model is not supported."""
+    from src.core import SUPPORTED_MODELS
+    
+    if model not in SUPPORTED_MODELS:
+        raise HTTPException(status_code=400, detail=f"Invalid model: {model}. Supported: {SUPPORTED_MODELS}")
+
+
+def _validate_mode(mode: Optional[str]):
+    """Raises HTTP 400 if the separation mode is not supported."""
+    from src.core import SEPARATION_MODES
+    
+    if mode is not None and mode not in SEPARATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Invalid mode: {mode}. Available: {list(SEPARATION_MODES)}")
+
+
+def _resolve_model(model: Optional[str], preset: Optional[str]) -> str:
+    """
+    Validates the preset and returns the model to use (explicit model or the preset's).
+    
+    Raises:
+        HTTPException: If the preset or the model is invalid
+    """
+    from src.core import PRESETS, resolve_preset_model
+    
+    if preset is not None and preset not in PRESETS:
+        raise HTTPException(status_code=400, detail=f"Invalid preset: {preset}. Available: {list(PRESETS)}")
+    model = resolve_preset_model(preset, model)
+    _validate_model(model)
+    return model
+
+
+def _check_device(model: str):
+    """Rejects (HTTP 400) a GPU model on a host without GPU, unless jobs run on separation nodes."""
+    from src.core import get_job_manager, resolve_device
+    
+    if get_job_manager().backend.name == 'broker':
+        # The nodes run it on their own devices
+        return
+    try:
+        resolve_device(model)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _validate_upload(file: UploadFile):
+    """Raises HTTP 400 if the uploaded file is not a supported audio format."""
+    if file.content_type not in ALLOWED_AUDIO_FORMATS:
+        # Also check by extension as fallback
+        file_extension = Path(file.filename).suffix.lower()
+        if file_extension not in ALLOWED_EXTENSIONS:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file format. Use: {', '.join(ALLOWED_EXTENSIONS)}"
+            )
+
+
+def _parse_stems(stems: str) -> List[str]:
+    """
+    Parses and validates the comma separated stems list.
+    
+    Raises:
+        HTTPException: If any stem is invalid
+    """
+    from src.core import AVAILABLE_STEMS
+    
+    selected_stems = [stem.strip() for stem in stems.split(",") if stem.strip()]
+    if not selected_stems:
+        selected_stems = ["vocals"]  # Default
+    
+    invalid_stems = [stem for stem in selected_stems if stem not in AVAILABLE_STEMS]
+    if invalid_stems:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid stems: {invalid_stems}. Available: {list(AVAILABLE_STEMS.keys())}"
+        )
+    return selected_stems
+
+
+async def _get_separator(model: str):
+    """Gets a separator without blocking the event loop while the model loads."""
+    from src.core import get_audio_separator
+    
+    try:
+        return await run_in_threadpool(get_audio_separator, model)
+    except Exception as e:
+        logger.error(f"Model/device error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _admission_error(error) -> HTTPException:
+    """Converts an AdmissionRejected error into HTTP 429/503 with a Retry-After header."""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": error.retry_after_header}
+    )
+
+
+def _check_admission(model: str):
+    """Rejects the request right away (HTTP 429) if too many separations are waiting."""
+    from src.core import AdmissionRejected, get_admission_controller
+    
+    try:
+        get_admission_controller().check(model)
+    except AdmissionRejected as e:
+        raise _admission_error(e)
+
+
+def _separate_admitted(
+    separator,
+    source,
+    selected_stems: List[str],
+    duration: Optional[float],
+    estimated_seconds: float,
+    mode: Optional[str],
+    preset: Optional[str],
+    downloader=None
+):
+    """
+    Separates a file or a resolved YouTube video once the admission controller grants a slot (blocking).
+    
+    Args:
+        source: Path of the input file, or a YouTubeSource when downloader is given
+        downloader: YouTubeDownloader the source was resolved with
+    
+    Raises:
+        AdmissionRejected: If the server is too busy
+    """
+    from src.core import WINDOW_SECONDS, estimate_request_bytes, get_admission_controller, separate_youtube
+    
+    streamed = downloader is not None and source.stream_url is not None
+    memory_bytes = estimate_request_bytes(
+        separator.model_name, separator.device, duration, WINDOW_SECONDS if streamed else None
+    )
+    with get_admission_controller().slot(separator.model_name, memory_bytes, estimated_seconds):
+        logger.info("Slot granted, starting separation...")
+        if downloader is not None:
+            return separate_youtube(separator, downloader, source, selected_stems, mode=mode, preset=preset)
+        return separator.separate_stems(source, selected_stems, mode=mode, preset=preset)
+
+
+async def _run_once(key: str, func, *args):
+    """
+    Runs a blocking function off the event loop, sharing the call with identical in-flight requests.
+    
+    Requests joining a running call wait on the event loop, not on a threadpool thread.
+    
+    Returns:
+        Tuple with (result, coalesced)
+        
+    Raises:
+        HTTPException: 429/503 with Retry-After if the server is too busy
+    """
+    from src.core import AdmissionRejected, get_single_flight
+    
+    try:
+        return await get_single_flight().do_async(key, func, *args, run_in_thread=run_in_threadpool)
+    except AdmissionRejected as e:
+        raise _admission_error(e)
+
+
+def _check_job_queue(manager, dedup_key: str):
+    """Rejects a new job (HTTP 429/503) if the job queue is too long; identical requests join the running job."""
+    from src.core import AdmissionRejected, get_admission_controller
+    
+    if manager.find_in_flight(dedup_key) is not None:
+        return
+    try:
+        queued_jobs = manager.get_stats()['jobs']['queued']
+        get_admission_controller().check_job_queue(queued_jobs, manager.estimate_wait_seconds())
+    except AdmissionRejected as e:
+        raise _admission_error(e)
+
+
+def _jobs_run_remotely() -> bool:
+    """Whether separations run in worker processes or on separation nodes instead of the API process."""
+    from src.core import get_job_manager
+    
+    return get_job_manager().backend.remote
+
+
+async def _separate_in_worker(
+    selected_stems: List[str],
+    model: str,
+    mode: Optional[str],
+    preset: Optional[str],
+    source_id: str,
+    input_path: Optional[str] = None,
+    url: Optional[str] = None,
+    duration: Optional[float] = None
+) -> dict:
+    """
+    Runs a synchronous separation as a job on the worker processes or separation nodes and waits for it.
+    
+    The model is only loaded by the workers, so the API process does not hold
+    a copy of the weights. The job takes over input_path (and removes it).
+    
+    Args:
+        source_id: Content hash of the upload or video id, identifying identical requests
+        input_path: Path of an uploaded file
+        url: YouTube URL (used when input_path is None)
+        duration: Duration of the audio in seconds, if known
+    
+    Returns:
+        Same response as the in-process separation
+    """
+    from src.core import (
+        AudioSeparator, estimate_separation_seconds, get_job_manager, request_key, resolve_separation_settings,
+        run_separation_job
+    )
+    
+    manager = get_job_manager()
+    settings = resolve_separation_settings(selected_stems, mode, preset)
+    dedup_key = request_key(source_id, model, settings, selected_stems, progressive=False)
+    try:
+        _check_job_queue(manager, dedup_key)
+        estimated_seconds = estimate_separation_seconds(model, selected_stems, duration, mode, preset)
+    except BaseException:
+        if input_path is not None:
+            os.unlink(input_path)
+        raise
+    params = {"stems": selected_stems, "model": model, "mode": mode, "preset": preset, "progressive": False}
+    job, coalesced = manager.submit_once(
+        dedup_key, "upload" if input_path is not None else "youtube", run_separation_job, selected_stems, model,
+        input_path=input_path, url=url, mode=mode, preset=preset,
+        params=params, estimated_seconds=estimated_seconds
+    )
+    if coalesced and input_path is not None:
+        # The running job separates its own copy of the file
+        os.unlink(input_path)
+    
+    while not job.finished:
+        await asyncio.sleep(0.25)
+    if job.error is not None:
+        raise Exception(job.error)
+    
+    logger.info("Separation completed successfully!")
+    response = {
+        "success": True,
+        "message": "Separation completed successfully!",
+        "files": job.result["files"],
+        "processing_time": AudioSeparator._describe_processing_time(estimated_seconds),
+        "estimated_seconds": round(estimated_seconds, 1),
+        "stems_processed": selected_stems,
+        "model": model,
+        "settings": job.result["settings"],
+        "coalesced": coalesced
+    }
+    if "video_info" in job.result:
+        response["video_info"] = job.result["video_info"]
+    return response
+
+
+def _copy_spooled_upload(spooled, destination: str) -> int:
+    """
+    Copies the file Starlette spooled an upload to into destination, returning its size.
+    
+    The copy is done by the kernel (sendfile), without passing the data through Python.
+    """
+    # fileno() moves an upload still held in memory (under 1 MB) to its temporary file
+    source_fd = spooled.fileno()
+    size = os.fstat(source_fd).st_size
+    with open(destination, 'wb') as target:
+        if size > MAX_UPLOAD_BYTES:
+            return size
+        if not hasattr(os, 'sendfile'):
+            spooled.seek(0)
+            shutil.copyfileobj(spooled, target)
+            return size
+        offset = 0
+        while offset < size:
+            sent = os.sendfile(target.fileno(), source_fd, offset, size - offset)
+            if sent == 0:
+                break
+            offset += sent
+    return size
+
+
+async def _save_upload(file: UploadFile) -> str:
+    """
+    Moves an uploaded file to a temporary file of UPLOAD_DIR and returns its path.
+    
+    The first bytes are checked before anything is written, so files that are
+    not audio are rejected early. Starlette has already spooled the upload to
+    disk; it is copied in the kernel, not read back through Python.
+    
+    Raises:
+        HTTPException: 400 if the content is not a supported audio format,
+            413 if the file is larger than MAX_UPLOAD_BYTES
+    """
+    from src.core import SNIFF_BYTES, sniff_audio_format
+    
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=_upload_too_large_message())
+    head = await file.read(SNIFF_BYTES)
+    detected_format = sniff_audio_format(head)
+    if detected_format not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"The file content is not a supported audio format. Use: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+        )
+    
+    # Keep the extension of the detected format, so decoders never rely on a misleading name
+    suffix = Path(file.filename or "").suffix.lower()
+    if suffix not in ALLOWED_EXTENSIONS:
+        suffix = detected_format
+    
+    fd, temp_file_path = tempfile.mkstemp(suffix=suffix, dir=UPLOAD_DIR)
+    os.close(fd)
+    try:
+        size = await run_in_threadpool(_copy_spooled_upload, file.file, temp_file_path)
+        if size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail=_upload_too_large_message())
+    except BaseException:
+        os.unlink(temp_file_path)
+        raise
+    return temp_file_path
+
+
+@app.get("/api/cache")
+async def get_cache_stats():
+    """
+    Endpoint to get result cache statistics.
+    
+    Returns:
+        JSON with hits, misses, hit rate and disk usage of the result and source caches
+    """
+    from src.core import get_result_cache, get_source_cache
+    
+    return {
+        "success": True,
+        "result_cache": get_result_cache(str(output_dir)).get_stats(),
+        "source_cache": get_source_cache().get_stats()
+    }
+
+
+@app.get("/api/admission")
+async def get_admission_stats():
+    """
+    Endpoint to get admission control statistics.
+    
+    Returns:
+        JSON with running and waiting separations per model, reserved memory and rejections
+    """
+    from src.core import get_admission_controller
+    
+    return {
+        "success": True,
+        "admission": get_admission_controller().get_stats()
+    }
+
+
 @app.post("/api/separate")
 async def separate_audio(
     file: UploadFile = File(...),
     stems: str = Form(default="vocals"),  # String with stems separated by comma
-    model: str = Form(default="mdx_extra_q")
+    model: Optional[str] = Form(default=None),
+    mode: Optional[str] = Form(default=None),
+    preset: Optional[str] = Form(default=None)
 ):
     """
     Endpoint for audio upload and separation with stem selection.
     
+    The separation runs in a worker thread so the event loop stays responsive.
+    For long files prefer POST /api/jobs, which returns immediately.
+    
     Args:
         file: Audio file sent by user
         stems: String with stems separated by comma (ex: "vocals,instrumental")
+        model: Demucs model name (default: the model of the preset)
+        mode: Separation mode ("full" or "fast"; fast only applies to vocals/instrumental)
+        preset: Speed/quality preset ("preview", "fast", "balanced" or "max")
         
     Returns:
         JSON with URLs for downloading processed files
     """
     try:
-        # Import after ensuring module is available
-        from src.core import separate_audio as core_separate_audio, AVAILABLE_STEMS, get_audio_separator
-        # Supported models
-        SUPPORTED_MODELS = ["mdx_extra_q", "mdx", "htdemucs", "htdemucs_ft"]
-        if model not in SUPPORTED_MODELS:
-            raise HTTPException(status_code=400, detail=f"Invalid model: {model}. Supported: {SUPPORTED_MODELS}")
+        from src.core import build_stem_files, hash_file, probe_duration, request_key
         
-        # Validate file type
-        if file.content_type not in ALLOWED_AUDIO_FORMATS:
-            # Also check by extension as fallback
-            file_extension = Path(file.filename).suffix.lower()
-            if file_extension not in ALLOWED_EXTENSIONS:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Unsupported file format. Use: {', '.join(ALLOWED_EXTENSIONS)}"
-                )
-        
-        # Process stems list
-        selected_stems = [stem.strip() for stem in stems.split(",") if stem.strip()]
-        if not selected_stems:
-            selected_stems = ["vocals"]  # Default
-        
-        # Validate stems
-        invalid_stems = [stem for stem in selected_stems if stem not in AVAILABLE_STEMS]
-        if invalid_stems:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid stems: {invalid_stems}. Available: {list(AVAILABLE_STEMS.keys())}"
-            )
+        model = _resolve_model(model, preset)
+        _check_device(model)
+        _validate_mode(mode)
+        _validate_upload(file)
+        selected_stems = _parse_stems(stems)
+        in_worker = _jobs_run_remotely()
+        if not in_worker:
+            _check_admission(model)
         
         logger.info(f"Processing file: {file.filename} with stems: {selected_stems}")
         
-        # Get singleton separator
+        # Save uploaded file to temporary file (rejects non-audio content and oversized files)
+        temp_file_path = await _save_upload(file)
+        if in_worker:
+            try:
+                content_hash = await run_in_threadpool(hash_file, temp_file_path)
+                duration = await run_in_threadpool(probe_duration, temp_file_path)
+            except BaseException:
+                os.unlink(temp_file_path)
+                raise
+            # The job removes the temporary file
+            return await _separate_in_worker(
+                selected_stems, model, mode, preset, content_hash, input_path=temp_file_path, duration=duration
+            )
         try:
-            separator = get_audio_separator(model)
-        except Exception as e:
-            logger.error(f"Model/device error: {e}")
-            raise HTTPException(status_code=400, detail=str(e))
-        
-        # Estimate processing time
-        processing_time = separator.estimate_processing_time(selected_stems)
-        logger.info(f"Estimated processing time: {processing_time}")
-        
-        # Create temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=Path(file.filename).suffix) as temp_file:
+            # Get separator (model weights are shared through the model registry)
+            separator = await _get_separator(model)
+            
+            settings = separator.get_separation_settings(selected_stems, mode, preset)
+            
+            # Estimate processing time from the actual duration
+            duration = await run_in_threadpool(probe_duration, temp_file_path)
+            estimated_seconds = separator.estimate_processing_seconds(selected_stems, duration, mode, preset)
+            processing_time = separator.estimate_processing_time(selected_stems, duration, mode, preset)
+            logger.info(f"Estimated processing time: {processing_time} ({estimated_seconds:.0f}s)")
+            
+            logger.info("File saved temporarily, waiting for a separation slot...")
+            
+            # Identical uploads being separated right now share one separation
+            content_hash = await run_in_threadpool(hash_file, temp_file_path)
+            result_paths, coalesced = await _run_once(
+                request_key(content_hash, model, settings, selected_stems),
+                _separate_admitted,
+                separator, temp_file_path, selected_stems, duration, estimated_seconds, mode, preset
+            )
+            
+            logger.info("Separation completed successfully!")
+            
+            return {
+                "success": True,
+                "message": "Separation completed successfully!",
+                "files": build_stem_files(result_paths),
+                "processing_time": processing_time,
+                "estimated_seconds": round(estimated_seconds, 1),
+                "stems_processed": selected_stems,
+                "model": model,
+                "settings": settings,
+                "coalesced": coalesced
+            }
+            
+        finally:
+            # Clean up temporary file
             try:
-                # Save uploaded file to temporary file
-                content = await file.read()
-                temp_file.write(content)
-                temp_file.flush()
-                
-                temp_file_path = temp_file.name
-                
-                logger.info("File saved temporarily, starting separation...")
-                
-                # Process audio separation using the separator
-                result_paths = separator.separate_stems(temp_file_path, selected_stems)
-                
-                logger.info("Separation completed successfully!")
-                
-                # Build response
-                base_url = "/"
-                files_data = {}
-                
-                for stem, path in result_paths.items():
-                    stem_info = AVAILABLE_STEMS[stem]
-                    files_data[stem] = {
-                        "url": f"{base_url}{path}",
-                        "filename": Path(path).name,
-                        "name": stem_info["name"],
-                        "icon": stem_info["icon"]
-                    }
-                
-                return {
-                    "success": True,
-                    "message": "Separation completed successfully!",
-                    "files": files_data,
-                    "processing_time": processing_time,
-                    "stems_processed": selected_stems
-                }
-                
-            finally:
-                # Clean up temporary file
-                try:
-                    os.unlink(temp_file_path)
-                    logger.info("Temporary file removed")
-                except OSError as e:
-                    logger.warning(f"Error removing temporary file: {e}")
+                os.unlink(temp_file_path)
+                logger.info("Temporary file removed")
+            except OSError as e:
+                logger.warning(f"Error removing temporary file: {e}")
                     
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -197,30 +633,35 @@ async def separate_audio(
 async def separate_youtube_audio(
     url: str = Form(...),
     stems: str = Form(default="vocals"),  # String with stems separated by comma
-    model: str = Form(default="mdx_extra_q")
+    model: Optional[str] = Form(default=None),
+    mode: Optional[str] = Form(default=None),
+    preset: Optional[str] = Form(default=None)
 ):
     """
     Endpoint for YouTube audio download and separation with stem selection.
     
+    Download and separation run in worker threads so the event loop stays responsive.
+    For long videos prefer POST /api/jobs, which returns immediately.
+    
     Args:
         url: YouTube video URL
         stems: String with stems separated by comma (ex: "vocals,instrumental")
+        model: Demucs model name (default: the model of the preset)
+        mode: Separation mode ("full" or "fast"; fast only applies to vocals/instrumental)
+        preset: Speed/quality preset ("preview", "fast", "balanced" or "max")
         
     Returns:
         JSON with URLs for downloading processed files
     """
     try:
-        # Import after ensuring module is available
-        from src.core import (
-            separate_audio as core_separate_audio, 
-            download_youtube_audio, 
-            AVAILABLE_STEMS, 
-            get_audio_separator,
-            YouTubeDownloader
-        )
-        SUPPORTED_MODELS = ["mdx_extra_q", "mdx", "htdemucs", "htdemucs_ft"]
-        if model not in SUPPORTED_MODELS:
-            raise HTTPException(status_code=400, detail=f"Invalid model: {model}. Supported: {SUPPORTED_MODELS}")
+        from src.core import YouTubeDownloader, build_stem_files, request_key, MAX_DURATION_SECONDS
+        
+        model = _resolve_model(model, preset)
+        _check_device(model)
+        _validate_mode(mode)
+        in_worker = _jobs_run_remotely()
+        if not in_worker:
+            _check_admission(model)
         
         # Create downloader instance
         youtube_downloader = YouTubeDownloader()
@@ -232,85 +673,71 @@ async def separate_youtube_audio(
                 detail="Invalid YouTube URL. Use links like: https://www.youtube.com/watch?v=..."
             )
         
-        # Process stems list
-        selected_stems = [stem.strip() for stem in stems.split(",") if stem.strip()]
-        if not selected_stems:
-            selected_stems = ["vocals"]  # Default
-        
-        # Validate stems
-        invalid_stems = [stem for stem in selected_stems if stem not in AVAILABLE_STEMS]
-        if invalid_stems:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid stems: {invalid_stems}. Available: {list(AVAILABLE_STEMS.keys())}"
-            )
+        selected_stems = _parse_stems(stems)
         
         logger.info(f"Processing YouTube URL: {url} with stems: {selected_stems}")
         
-        # Get singleton separator
+        if in_worker:
+            # The worker fetches the video information and checks the duration limit
+            video_id = youtube_downloader.extract_video_id(url) or url
+            return await _separate_in_worker(selected_stems, model, mode, preset, video_id, url=url)
+        
+        # Get separator (model weights are shared through the model registry)
+        separator = await _get_separator(model)
+        
+        # Get video information and the audio URL in a single request
         try:
-            separator = get_audio_separator(model)
+            source = await run_in_threadpool(youtube_downloader.resolve, url)
         except Exception as e:
-            logger.error(f"Model/device error: {e}")
-            raise HTTPException(status_code=400, detail=str(e))
-        
-        # Get video information first
-        video_info = youtube_downloader.get_video_info(url)
-        if not video_info:
+            logger.error(f"Error getting video information: {e}")
             raise HTTPException(
                 status_code=400,
                 detail="Could not access video. Check if it's public and accessible."
             )
+        video_info = source.video_info
         
-        # Check duration (10 minute limit)
-        if video_info['duration'] > 600:
+        # Check duration limit (videos longer than the streaming threshold are separated window by window)
+        if video_info['duration'] > MAX_DURATION_SECONDS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Video too long ({video_info['duration']//60}:{video_info['duration']%60:02d}). Limit: 10 minutes."
+                detail=f"Video too long ({video_info['duration']//60}:{video_info['duration']%60:02d}). Limit: {MAX_DURATION_SECONDS / 60:.0f} minutes."
             )
         
-        # Estimate processing time
-        processing_time = separator.estimate_processing_time(selected_stems)
-        logger.info(f"Estimated processing time: {processing_time}")
+        settings = separator.get_separation_settings(selected_stems, mode, preset)
         
-        logger.info(f"Downloading audio: {video_info['title']}")
+        # Estimate processing time from the video duration
+        estimated_seconds = separator.estimate_processing_seconds(selected_stems, video_info['duration'], mode, preset)
+        processing_time = separator.estimate_processing_time(selected_stems, video_info['duration'], mode, preset)
+        logger.info(f"Estimated processing time: {processing_time} ({estimated_seconds:.0f}s)")
         
-        # Download audio from YouTube
-        temp_audio_path, video_data = download_youtube_audio(url)
+        def download_and_separate():
+            # The audio is decoded while it downloads when the format allows it
+            logger.info(f"Separating video: {video_info['title']}")
+            return _separate_admitted(
+                separator, source, selected_stems, video_info['duration'], estimated_seconds, mode, preset,
+                downloader=youtube_downloader
+            )
         
-        try:
-            logger.info("File downloaded, starting separation...")
-            
-            # Process audio separation using the created separator
-            result_paths = separator.separate_stems(temp_audio_path, selected_stems)
-            
-            logger.info("Separation completed successfully!")
-            
-            # Build response
-            base_url = "/"
-            files_data = {}
-            
-            for stem, path in result_paths.items():
-                stem_info = AVAILABLE_STEMS[stem]
-                files_data[stem] = {
-                    "url": f"{base_url}{path}",
-                    "filename": Path(path).name,
-                    "name": stem_info["name"],
-                    "icon": stem_info["icon"]
-                }
-            
-            return {
-                "success": True,
-                "message": "Separation completed successfully!",
-                "files": files_data,
-                "processing_time": processing_time,
-                "stems_processed": selected_stems,
-                "video_info": video_data
-            }
-            
-        finally:
-            # Clean up temporary YouTube file
-            youtube_downloader.cleanup_file(temp_audio_path)
+        # Concurrent requests for the same video share one download and separation
+        result_paths, coalesced = await _run_once(
+            request_key(source.video_id, model, settings, selected_stems),
+            download_and_separate
+        )
+        
+        logger.info("Separation completed successfully!")
+        
+        return {
+            "success": True,
+            "message": "Separation completed successfully!",
+            "files": build_stem_files(result_paths),
+            "processing_time": processing_time,
+            "estimated_seconds": round(estimated_seconds, 1),
+            "stems_processed": selected_stems,
+            "model": model,
+            "settings": settings,
+            "video_info": video_info,
+            "coalesced": coalesced
+        }
             
     except HTTPException:
         # Re-raise HTTP exceptions
@@ -323,10 +750,408 @@ async def separate_youtube_audio(
         )
 
 
+@app.post("/api/jobs")
+async def create_job(
+    file: Optional[UploadFile] = File(default=None),
+    url: Optional[str] = Form(default=None),
+    stems: str = Form(default="vocals"),  # String with stems separated by comma
+    model: Optional[str] = Form(default=None),
+    progressive: bool = Form(default=False),
+    mode: Optional[str] = Form(default=None),
+    preset: Optional[str] = Form(default=None)
+):
+    """
+    Endpoint to queue a separation job for an uploaded file or a YouTube URL.
+    
+    Returns immediately with a job id; poll GET /api/jobs/{job_id} or follow
+    GET /api/jobs/{job_id}/events for state, progress and result URLs.
+    
+    Args:
+        file: Audio file sent by user (either file or url is required)
+        url: YouTube video URL
+        stems: String with stems separated by comma (ex: "vocals,instrumental")
+        model: Demucs model name (default: the model of the preset)
+        progressive: Separate in short windows so each stem can be played from
+            GET /api/jobs/{job_id}/stream/{stem} while the job is still running
+        mode: Separation mode ("full" or "fast"; fast only applies to vocals/instrumental)
+        preset: Speed/quality preset ("preview", "fast", "balanced" or "max")
+        
+    Returns:
+        JSON with the job id, its status URL and the estimated seconds until it completes
+    """
+    from src.core import (
+        YouTubeDownloader, estimate_separation_seconds, get_job_manager, hash_file, probe_duration, request_key,
+        resolve_separation_settings, run_separation_job
+    )
+    
+    if (file is None) == (not url):
+        raise HTTPException(status_code=400, detail="Send either an audio file or a YouTube URL.")
+    
+    model = _resolve_model(model, preset)
+    _check_device(model)
+    _validate_mode(mode)
+    selected_stems = _parse_stems(stems)
+    settings = resolve_separation_settings(selected_stems, mode, preset)
+    params = {"stems": selected_stems, "model": model, "mode": mode, "preset": preset, "progressive": progressive}
+    manager = get_job_manager()
+    
+    if file is not None:
+        _validate_upload(file)
+        temp_file_path = await _save_upload(file)
+        params["filename"] = file.filename
+        try:
+            content_hash = await run_in_threadpool(hash_file, temp_file_path)
+            dedup_key = request_key(content_hash, model, settings, selected_stems, progressive=progressive)
+            _check_job_queue(manager, dedup_key)
+            duration = await run_in_threadpool(probe_duration, temp_file_path)
+            estimated_seconds = estimate_separation_seconds(model, selected_stems, duration, mode, preset)
+        except BaseException:
+            os.unlink(temp_file_path)
+            raise
+        queue_wait_seconds = manager.estimate_wait_seconds()
+        job, coalesced = manager.submit_once(
+            dedup_key, "upload", run_separation_job, selected_stems, model,
+            input_path=temp_file_path, progressive=progressive, mode=mode, preset=preset,
+            params=params, estimated_seconds=estimated_seconds
+        )
+        if coalesced:
+            # The running job separates its own copy of the file
+            os.unlink(temp_file_path)
+    else:
+        youtube_downloader = YouTubeDownloader()
+        if not youtube_downloader.validate_youtube_url(url):
+            raise HTTPException(
+                status_code=400,
+                detail="Invalid YouTube URL. Use links like: https://www.youtube.com/watch?v=..."
+            )
+        params["url"] = url
+        video_id = youtube_downloader.extract_video_id(url) or url
+        dedup_key = request_key(video_id, model, settings, selected_stems, progressive=progressive)
+        _check_job_queue(manager, dedup_key)
+        # The video duration is unknown until the job fetches it; assume a typical track
+        estimated_seconds = estimate_separation_seconds(model, selected_stems, None, mode, preset)
+        queue_wait_seconds = manager.estimate_wait_seconds()
+        job, coalesced = manager.submit_once(
+            dedup_key, "youtube", run_separation_job, selected_stems, model,
+            url=url, progressive=progressive, mode=mode, preset=preset,
+            params=params, estimated_seconds=estimated_seconds
+        )
+    
+    if coalesced:
+        logger.info(f"Request attached to in-flight job {job.id} ({job.requests} requests)")
+        if job.state == "queued":
+            # The wait estimate already includes the shared job itself
+            queue_wait_seconds = max(queue_wait_seconds - (job.estimated_seconds or 0.0), 0.0)
+            estimated_seconds = job.estimated_seconds or estimated_seconds
+        else:
+            queue_wait_seconds = 0.0
+            estimated_seconds = job.eta_seconds or 0.0
+    else:
+        logger.info(f"Job {job.id} created with stems: {selected_stems}")
+    
+    response = {
+        "success": True,
+        "job_id": job.id,
+        "state": job.state,
+        "coalesced": coalesced,
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events",
+        "queue_wait_seconds": round(queue_wait_seconds, 1),
+        "estimated_seconds": round(queue_wait_seconds + estimated_seconds, 1)
+    }
+    if progressive:
+        response["streams"] = {stem: f"/api/jobs/{job.id}/stream/{stem}" for stem in selected_stems}
+    return response
+
+
+@app.post("/api/batch")
+async def create_batch_job(
+    files: List[UploadFile] = File(default=[]),
+    urls: str = Form(default=""),  # YouTube URLs separated by newlines or commas
+    stems: str = Form(default="vocals"),  # String with stems separated by comma
+    model: Optional[str] = Form(default=None),
+    mode: Optional[str] = Form(default=None),
+    preset: Optional[str] = Form(default=None)
+):
+    """
+    Endpoint to queue one job that separates many files and YouTube videos.
+    
+    All tracks use the same model, stems and settings. The model stays loaded
+    for the whole batch and tracks are pipelined, so one is in the model while
+    others are decoded or encoded. Progress and the results manifest are
+    reported through GET /api/jobs/{job_id}.
+    
+    Args:
+        files: Audio files sent by user
+        urls: YouTube video URLs separated by newlines or commas
+        stems: String with stems separated by comma (ex: "vocals,instrumental")
+        model: Demucs model name (default: the model of the preset)
+        mode: Separation mode ("full" or "fast"; fast only applies to vocals/instrumental)
+        preset: Speed/quality preset ("preview", "fast", "balanced" or "max")
+        
+    Returns:
+        JSON with the job id, its status URL, the number of tracks and the estimated seconds until it completes
+    """
+    from src.core import (
+        AdmissionRejected, YouTubeDownloader, estimate_separation_seconds, get_admission_controller,
+        get_job_manager, make_items, probe_duration, run_batch_job
+    )
+    
+    url_list = [url.strip() for url in urls.replace(",", "\n").splitlines() if url.strip()]
+    if not files and not url_list:
+        raise HTTPException(status_code=400, detail="Send audio files and/or YouTube URLs.")
+    if len(files) + len(url_list) > MAX_BATCH_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many tracks. Limit: {MAX_BATCH_ITEMS} per batch")
+    
+    model = _resolve_model(model, preset)
+    _check_device(model)
+    _validate_mode(mode)
+    selected_stems = _parse_stems(stems)
+    youtube_downloader = YouTubeDownloader()
+    invalid_urls = [url for url in url_list if not youtube_downloader.validate_youtube_url(url)]
+    if invalid_urls:
+        raise HTTPException(status_code=400, detail=f"Invalid YouTube URLs: {invalid_urls}")
+    
+    manager = get_job_manager()
+    try:
+        get_admission_controller().check_job_queue(manager.get_stats()['jobs']['queued'], manager.estimate_wait_seconds())
+    except AdmissionRejected as e:
+        raise _admission_error(e)
+    
+    uploads = []
+    try:
+        for file in files:
+            _validate_upload(file)
+            temp_file_path = await _save_upload(file)
+            uploads.append({"source": temp_file_path, "filename": file.filename})
+            uploads[-1]["duration"] = await run_in_threadpool(probe_duration, temp_file_path)
+        items = make_items(uploads + [{"source": url} for url in url_list])
+        estimated_seconds = sum(
+            estimate_separation_seconds(model, selected_stems, item.get("duration"), mode, preset) for item in items
+        )
+    except BaseException:
+        for item in uploads:
+            os.unlink(item["source"])
+        raise
+    queue_wait_seconds = manager.estimate_wait_seconds()
+    params = {
+        "stems": selected_stems, "model": model, "mode": mode, "preset": preset,
+        "filenames": [file.filename for file in files], "urls": url_list
+    }
+    job = manager.submit(
+        "batch", run_batch_job, items, selected_stems, model, mode=mode, preset=preset,
+        params=params, estimated_seconds=estimated_seconds
+    )
+    logger.info(f"Batch job {job.id} created with {len(items)} tracks and stems: {selected_stems}")
+    
+    return {
+        "success": True,
+        "job_id": job.id,
+        "state": job.state,
+        "tracks": len(items),
+        "status_url": f"/api/jobs/{job.id}",
+        "events_url": f"/api/jobs/{job.id}/events",
+        "queue_wait_seconds": round(queue_wait_seconds, 1),
+        "estimated_seconds": round(queue_wait_seconds + estimated_seconds, 1)
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Endpoint to get the state, progress and result of a separation job.
+    
+    Returns:
+        JSON with job information (result contains file URLs when completed)
+    """
+    from src.core import get_job_manager
+    
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    return {"success": True, "job": _job_data(job)}
+
+
+def _job_data(job) -> dict:
+    """Returns the public view of a job, including its stream URLs."""
+    job_data = job.to_dict()
+    job_data["streams"] = {stem: f"/api/jobs/{job.id}/stream/{stem}" for stem in job.outputs}
+    return job_data
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Formats a Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _job_events(request: Request, job):
+    """
+    Yields Server-Sent Events for a job until it finishes.
+    
+    A 'progress' event is sent whenever the job is updated, a comment line
+    keeps idle connections open, and a final 'completed' or 'failed' event
+    carries the result or the error.
+    """
+    last_update = None
+    last_sent = asyncio.get_running_loop().time()
+    while True:
+        if await request.is_disconnected():
+            return
+        
+        if job.finished:
+            yield _sse_event(job.state, _job_data(job))
+            return
+        
+        now = asyncio.get_running_loop().time()
+        if job.updated_at != last_update:
+            last_update = job.updated_at
+            last_sent = now
+            yield _sse_event("progress", _job_data(job))
+        elif now - last_sent >= EVENTS_KEEPALIVE_INTERVAL:
+            last_sent = now
+            yield ": keepalive\n\n"
+        
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    """
+    Endpoint to follow a separation job with Server-Sent Events.
+    
+    Each event carries the same job information as GET /api/jobs/{job_id},
+    including progress, ETA and whether the job looks stalled.
+    
+    Returns:
+        text/event-stream response
+    """
+    from src.core import get_job_manager
+    
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    
+    return StreamingResponse(
+        _job_events(request, job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _tail_output(request: Request, job, output_path: str):
+    """
+    Yields the bytes of an output file while it is being encoded.
+    
+    Reads the partial file as it grows and stops once the job finishes and the
+    whole file has been sent, or as soon as the client disconnects.
+    
+    Args:
+        output_path: Temporary file the job is encoding to (see final_output_path),
+            or the final file of a stem that was already available
+    """
+    from src.core import final_output_path
+    
+    part_path = Path(output_path)
+    final_path = final_output_path(output_path)
+    
+    # Wait for the encoder to create the file
+    while not part_path.exists() and not final_path.exists():
+        if job.finished or await request.is_disconnected():
+            return
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
+    
+    try:
+        stream = open(part_path, 'rb')
+        complete = part_path == final_path
+    except FileNotFoundError:
+        # Already moved into place: the file is complete
+        stream = open(final_path, 'rb')
+        complete = True
+    
+    with stream:
+        while True:
+            data = stream.read(STREAM_CHUNK_SIZE)
+            if data:
+                yield data
+                continue
+            if complete:
+                break
+            if job.finished:
+                # Send whatever was flushed between the last read and completion
+                complete = True
+                continue
+            if await request.is_disconnected():
+                return
+            await asyncio.sleep(STREAM_POLL_INTERVAL)
+
+
+@app.get("/api/jobs/{job_id}/stream/{stem}")
+async def stream_job_stem(request: Request, job_id: str, stem: str):
+    """
+    Endpoint to play a stem of a progressive job while it is being separated.
+    
+    The MP3 is sent with chunked transfer encoding as each window of the track
+    is separated and encoded; completed jobs redirect to the final file.
+    
+    Returns:
+        Streaming audio/mpeg response
+    """
+    from src.core import get_job_manager, JOB_COMPLETED
+    
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    if stem not in job.params.get("stems", []):
+        raise HTTPException(status_code=404, detail=f"Stem not requested by this job: {stem}")
+    
+    # Wait until the job starts writing its files
+    while stem not in job.outputs and not job.finished:
+        if await request.is_disconnected():
+            # Nobody is listening anymore: stop without an error response
+            return Response(status_code=204)
+        await asyncio.sleep(STREAM_POLL_INTERVAL)
+    
+    if job.state == JOB_COMPLETED and stem in job.result["files"]:
+        return RedirectResponse(job.result["files"][stem]["url"])
+    if stem not in job.outputs:
+        raise HTTPException(status_code=500, detail=f"Job failed: {job.error}")
+    
+    return StreamingResponse(
+        _tail_output(request, job, job.outputs[stem]),
+        media_type="audio/mpeg",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+
 @app.get("/health")
 async def health_check():
-    """Application health check endpoint"""
-    return {"status": "healthy", "message": "Voice Separator API is running"}
+    """Application health check endpoint, with the inference runtime profile (threads, precision)"""
+    from src.core import get_job_manager, get_runtime_profile
+    
+    health = {
+        "status": "healthy",
+        "message": "Voice Separator API is running",
+        "runtime": get_runtime_profile().to_dict()
+    }
+    backend = get_job_manager().backend
+    if backend.remote:
+        # Worker processes or separation nodes, and the models they share
+        health["workers"] = await run_in_threadpool(backend.get_stats)
+    return health
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Prometheus scrape endpoint.
+    
+    Returns:
+        Pipeline, job queue, cache and model registry metrics in the Prometheus text format
+    """
+    from src.core import METRICS_CONTENT_TYPE, get_metrics_registry
+    
+    return Response(get_metrics_registry().render(), media_type=METRICS_CONTENT_TYPE)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,112 @@
+"""
+Command-line batch separation.
+
+Separates every track of a list of files, directories, YouTube URLs and/or
+a manifest with the same model and stems, keeping the model loaded and
+pipelining decode/encode of one track with inference of another. A JSON
+results manifest (one entry per track, failures included) is written at
+the end.
+
+Usage:
+    python -m src.cli songs/ --stems vocals,instrumental
+    python -m src.cli track1.mp3 https://www.youtube.com/watch?v=... --preset fast
+    python -m src.cli --manifest backfill.txt --output-dir separated/ --results results.json
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+from typing import List, Optional
+import logging
+
+logger = logging.getLogger("voice-separator")
+
+
+def collect_sources(inputs: List[str], recursive: bool = True) -> List[str]:
+    """
+    Expands command-line inputs to track sources.
+
+    Args:
+        inputs: Files, directories (scanned for audio files) and URLs
+        recursive: Scan subdirectories of the given directories
+
+    Returns:
+        Paths and URLs, in the given order
+    """
+    from src.core import find_audio_files
+
+    sources = []
+    for value in inputs:
+        if '://' in value:
+            sources.append(value)
+        elif os.path.isdir(value):
+            found = find_audio_files(value, recursive)
+            if not found:
+                logger.warning(f"No audio files found in {value}")
+            sources.extend(found)
+        else:
+            sources.append(value)
+    return sources
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.core import (
+        BATCH_WORKERS, PRESETS, BatchSeparator, load_manifest, make_items, resolve_preset_model, write_manifest
+    )
+
+    parser = argparse.ArgumentParser(description="Separate many tracks at once with a resident Demucs model.")
+    parser.add_argument("inputs", nargs="*", help="Audio files, directories or YouTube URLs")
+    parser.add_argument("--manifest", help="Text file with one path/URL per line, or a JSON list of tracks")
+    parser.add_argument("--stems", default="vocals", help="Comma separated stems (default: vocals)")
+    parser.add_argument("--model", default=None, help="Demucs model (default: the model of the preset)")
+    parser.add_argument("--preset", choices=list(PRESETS), default=None,
+                        help="Speed/quality preset (default: the application default)")
+    parser.add_argument("--mode", choices=["full", "fast"], default=None, help="Separation mode")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS,
+                        help=f"Tracks processed at the same time (default: {BATCH_WORKERS})")
+    parser.add_argument("--output-dir", default="static/output", help="Directory for the stem files")
+    parser.add_argument("--results", default=None,
+                        help="Where to write the results manifest (default: <output dir>/batch-results.json)")
+    parser.add_argument("--no-cache", action="store_true", help="Do not reuse or store cached results")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not scan subdirectories")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    for name in ("src", "demucs"):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    sources = collect_sources(args.inputs, not args.no_recursive)
+    items = make_items(sources)
+    if args.manifest:
+        items = make_items(items + load_manifest(args.manifest))
+    if not items:
+        parser.error("no tracks to separate (pass files, directories, URLs or --manifest)")
+
+    stems = [stem.strip() for stem in args.stems.split(",") if stem.strip()]
+    model = resolve_preset_model(args.preset, args.model)
+    logger.info(f"🎵 Separating {len(items)} tracks with {model} (stems: {', '.join(stems)})")
+
+    batch = BatchSeparator(
+        model, stems, args.mode, args.preset,
+        workers=args.workers, output_dir=args.output_dir, use_cache=not args.no_cache
+    )
+
+    def on_result(entry: dict, done: int, total: int):
+        status = "✅" if entry['status'] == 'completed' else f"❌ {entry.get('error')}"
+        logger.info(f"[{done}/{total}] {entry['source']} ({entry['seconds']:.1f}s) {status}")
+
+    manifest = batch.run(items, on_result)
+    results_path = args.results or str(Path(args.output_dir) / "batch-results.json")
+    write_manifest(manifest, results_path)
+
+    summary = manifest['summary']
+    logger.info(
+        f"📄 {summary['completed']}/{summary['total']} tracks separated in {summary['seconds']:.1f}s, "
+        f"results: {results_path}"
+    )
+    return 0 if summary['failed'] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,8 +3,27 @@ Módulo principal do Voice Separator.
 
 Este módulo contém as classes e funções principais para:
 - Separação de áudio usando Demucs
-- Download de áudio do YouTube
+- Download de áudio do YouTube (com separação iniciada enquanto o áudio é baixado)
 - Processamento de stems individuais
+- Modo rápido para vocais/instrumental (instrumental = mix - vocais)
+- Presets de velocidade/qualidade (segmento, sobreposição, shifts, precisão e modelo)
+- Calibração das estimativas de tempo a partir de benchmarks
+- Estimativa do tempo de processamento aprendida com separações anteriores
+- Cache de modelos carregados (registry)
+- Cache de resultados por conteúdo
+- Cache de informações e áudio de vídeos do YouTube (por id do vídeo, com TTL)
+- Separação em janelas (streaming) para áudios longos
+- Fila de jobs de separação em segundo plano
+- Separação em lote (API e linha de comando) com o modelo residente
+- Controle de admissão (limite por modelo, orçamento de memória e fila limitada)
+- Deduplicação de requisições idênticas em andamento (single-flight)
+- Progresso em tempo real (decodificação, inferência e codificação)
+- Perfil de execução em CPU (threads por separação, inference mode e bfloat16)
+- Backends de inferência opcionais (quantização int8 dinâmica e torch.compile)
+- Micro-batching dos segmentos de separações simultâneas do mesmo modelo
+- Pool de processos de separação com pesos dos modelos compartilhados (copy-on-write)
+- Nós de separação distribuídos que consomem jobs de um broker compatível com Redis
+- Métricas no formato Prometheus (etapas, fila, caches e modelos)
 """
 
 from .separator import (
@@ -12,11 +31,130 @@ from .separator import (
     get_audio_separator,
     separate_audio, 
     separate_vocals,
-    AVAILABLE_STEMS
+    estimate_separation_seconds,
+    resolve_device,
+    resolve_separation_settings,
+    AVAILABLE_STEMS,
+    SEPARATION_MODES
+)
+from .presets import (
+    DEFAULT_PRESET,
+    PRESETS,
+    get_preset,
+    resolve_preset_model
+)
+from .model_registry import (
+    ModelRegistry,
+    get_model_registry,
+    SUPPORTED_MODELS
 )
 from .youtube_downloader import (
     YouTubeDownloader,
-    download_youtube_audio
+    YouTubeSource,
+    download_youtube_audio,
+    extract_with_yt_dlp
+)
+from .cache import (
+    DiskCache,
+    ResultCache,
+    SourceCache,
+    get_result_cache,
+    get_source_cache,
+    get_youtube_cache,
+    hash_file,
+    YouTubeCache
+)
+from .calibration import (
+    load_calibration,
+    save_calibration
+)
+from .estimator import (
+    ProcessingTimeEstimator,
+    get_processing_time_estimator
+)
+from .decoder import (
+    SNIFF_BYTES,
+    decode_audio,
+    probe_duration,
+    sniff_audio_format
+)
+from .streaming import (
+    MAX_DURATION_SECONDS,
+    STREAMING_THRESHOLD_SECONDS,
+    WINDOW_SECONDS
+)
+from .encoder import final_output_path, partial_output_path
+from .progress import (
+    PROGRESS_PHASES,
+    ProgressReporter
+)
+from .metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS,
+    MetricsRegistry,
+    get_metrics_registry
+)
+from .admission import (
+    AdmissionController,
+    AdmissionRejected,
+    estimate_request_bytes,
+    get_admission_controller
+)
+from .singleflight import (
+    SingleFlight,
+    get_single_flight,
+    request_key
+)
+from .backends import (
+    BACKENDS,
+    DEFAULT_BACKEND,
+    prepare_model
+)
+from .microbatch import (
+    MICRO_BATCH_SIZE,
+    MicroBatcher,
+    install_micro_batching
+)
+from .runtime import (
+    RuntimeProfile,
+    configure_runtime,
+    get_runtime_profile
+)
+from .jobs import (
+    DEFAULT_JOB_WORKERS,
+    JOB_COMPLETED,
+    Job,
+    JobBackend,
+    JobManager,
+    get_job_manager
+)
+from .worker_pool import (
+    WORKER_PROCESSES,
+    WorkerPool,
+    get_worker_pool
+)
+from .broker import (
+    BROKER_URL,
+    BrokerBackend,
+    LocalBrokerServer,
+    SeparationNode,
+    connect_broker,
+    get_broker_backend
+)
+from .tasks import (
+    build_stem_files,
+    run_batch_job,
+    run_separation_job,
+    separate_youtube
+)
+from .batch import (
+    BATCH_WORKERS,
+    BatchSeparator,
+    find_audio_files,
+    load_manifest,
+    make_items,
+    write_manifest
 )
 
 __all__ = [
@@ -24,7 +162,89 @@ __all__ = [
     'get_audio_separator',
     'separate_audio', 
     'separate_vocals',
+    'estimate_separation_seconds',
+    'resolve_device',
+    'resolve_separation_settings',
     'AVAILABLE_STEMS',
+    'SEPARATION_MODES',
+    'DEFAULT_PRESET',
+    'PRESETS',
+    'get_preset',
+    'resolve_preset_model',
+    'ModelRegistry',
+    'get_model_registry',
+    'SUPPORTED_MODELS',
     'YouTubeDownloader',
-    'download_youtube_audio'
+    'YouTubeSource',
+    'download_youtube_audio',
+    'extract_with_yt_dlp',
+    'DiskCache',
+    'ResultCache',
+    'SourceCache',
+    'get_result_cache',
+    'get_source_cache',
+    'get_youtube_cache',
+    'hash_file',
+    'YouTubeCache',
+    'load_calibration',
+    'save_calibration',
+    'ProcessingTimeEstimator',
+    'get_processing_time_estimator',
+    'SNIFF_BYTES',
+    'decode_audio',
+    'probe_duration',
+    'sniff_audio_format',
+    'MAX_DURATION_SECONDS',
+    'STREAMING_THRESHOLD_SECONDS',
+    'WINDOW_SECONDS',
+    'final_output_path',
+    'partial_output_path',
+    'PROGRESS_PHASES',
+    'ProgressReporter',
+    'METRICS_CONTENT_TYPE',
+    'HTTP_REQUEST_SECONDS',
+    'HTTP_REQUESTS',
+    'MetricsRegistry',
+    'get_metrics_registry',
+    'AdmissionController',
+    'AdmissionRejected',
+    'estimate_request_bytes',
+    'get_admission_controller',
+    'SingleFlight',
+    'get_single_flight',
+    'request_key',
+    'BACKENDS',
+    'DEFAULT_BACKEND',
+    'prepare_model',
+    'MICRO_BATCH_SIZE',
+    'MicroBatcher',
+    'install_micro_batching',
+    'RuntimeProfile',
+    'configure_runtime',
+    'get_runtime_profile',
+    'DEFAULT_JOB_WORKERS',
+    'JOB_COMPLETED',
+    'Job',
+    'JobBackend',
+    'JobManager',
+    'get_job_manager',
+    'WORKER_PROCESSES',
+    'WorkerPool',
+    'get_worker_pool',
+    'BROKER_URL',
+    'BrokerBackend',
+    'LocalBrokerServer',
+    'SeparationNode',
+    'connect_broker',
+    'get_broker_backend',
+    'build_stem_files',
+    'run_batch_job',
+    'run_separation_job',
+    'separate_youtube',
+    'BATCH_WORKERS',
+    'BatchSeparator',
+    'find_audio_files',
+    'load_manifest',
+    'make_items',
+    'write_manifest'
 ]
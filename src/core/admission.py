@@ -0,0 +1,373 @@
+"""
+Admission control for separations.
+
+Every separation holds a slot of its model for as long as it runs. Slots are
+limited per model, and the memory a separation is expected to need (model
+weights, audio buffers and inference working set) must fit in a global
+budget. Requests that cannot start wait in a bounded queue; when the queue is
+full, or the expected wait is too long, they are rejected immediately with a
+Retry-After hint instead of piling up until the machine runs out of memory.
+"""
+
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import logging
+
+from .metrics import get_metrics_registry
+from .microbatch import MICRO_BATCH_SIZE
+from .model_registry import get_model_registry
+from .streaming import STREAMING_THRESHOLD_SECONDS, WINDOW_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Limits (overridable through environment variables). Micro-batching only batches
+# separations running in the same process, so it needs at least two of them
+MAX_CONCURRENT_PER_MODEL = int(os.environ.get("VOICE_SEPARATOR_MAX_CONCURRENT", "2" if MICRO_BATCH_SIZE > 1 else "1"))
+MAX_QUEUE = int(os.environ.get("VOICE_SEPARATOR_MAX_QUEUE", "8"))
+MAX_QUEUE_WAIT = float(os.environ.get("VOICE_SEPARATOR_MAX_QUEUE_WAIT", "600"))
+# Background jobs queued but not started yet
+MAX_QUEUED_JOBS = int(os.environ.get("VOICE_SEPARATOR_MAX_QUEUED_JOBS", "32"))
+# 0 = 80% of the physical memory
+MEMORY_BUDGET_MB = float(os.environ.get("VOICE_SEPARATOR_MEMORY_BUDGET_MB", "0"))
+
+# Rough memory model of a separation
+SAMPLE_RATE = 44100
+BYTES_PER_AUDIO_SECOND = SAMPLE_RATE * 2 * 4  # stereo float32
+# Input, four sources, padded copies and the per-model accumulator of apply_model
+AUDIO_BUFFER_FACTOR = 8
+# Activations of the model for one segment
+INFERENCE_OVERHEAD_BYTES = int(float(os.environ.get("VOICE_SEPARATOR_INFERENCE_OVERHEAD_MB", "1024")) * 1024 * 1024)
+# Weights of a model that is not loaded yet
+DEFAULT_MODEL_BYTES = 1024 * 1024 * 1024
+DEFAULT_DURATION_SECONDS = 240
+
+
+class AdmissionRejected(Exception):
+    """Raised when a separation cannot be admitted."""
+
+    def __init__(self, message: str, status_code: int = 429, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        """Value for the Retry-After HTTP header (whole seconds)."""
+        return str(max(1, math.ceil(self.retry_after or 1)))
+
+
+def default_memory_budget() -> int:
+    """Returns 80% of the physical memory in bytes, or 0 (no budget) if unknown."""
+    try:
+        return int(os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') * 0.8)
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def estimate_request_bytes(
+    model_name: str,
+    device: str,
+    duration: Optional[float] = None,
+    window_seconds: Optional[float] = None
+) -> int:
+    """
+    Estimates the memory a separation needs.
+
+    Long inputs are separated window by window (see streaming.py), so their
+    audio buffers are bounded by the window length.
+
+    Args:
+        model_name: Model to use
+        device: Device the model runs on
+        duration: Input duration in seconds (default: a typical track)
+        window_seconds: Window length when the input is separated window by window
+
+    Returns:
+        Estimated bytes (weights are only counted if the model is not loaded yet)
+    """
+    audio_seconds = duration or DEFAULT_DURATION_SECONDS
+    if window_seconds is None and audio_seconds > STREAMING_THRESHOLD_SECONDS:
+        window_seconds = WINDOW_SECONDS
+    if window_seconds is not None:
+        audio_seconds = min(audio_seconds, window_seconds)
+
+    estimated = int(audio_seconds * BYTES_PER_AUDIO_SECOND * AUDIO_BUFFER_FACTOR) + INFERENCE_OVERHEAD_BYTES
+    if not get_model_registry().is_loaded(model_name, device):
+        estimated += DEFAULT_MODEL_BYTES
+    return estimated
+
+
+class Ticket:
+    """A separation admitted (or waiting to be admitted)."""
+
+    def __init__(self, model_name: str, memory_bytes: int, estimated_seconds: float):
+        self.model_name = model_name
+        self.memory_bytes = memory_bytes
+        self.estimated_seconds = estimated_seconds
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+
+    @property
+    def remaining_seconds(self) -> float:
+        if self.started_at is None:
+            return self.estimated_seconds
+        return max(self.estimated_seconds - (time.time() - self.started_at), 0.0)
+
+
+class AdmissionController:
+    """
+    Limits concurrent separations per model and by estimated memory.
+
+    Waiting requests of the same model are admitted in arrival order. A
+    request that does not fit the memory budget even on an idle server still
+    runs, alone.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_PER_MODEL,
+        max_queue: int = MAX_QUEUE,
+        max_wait: float = MAX_QUEUE_WAIT,
+        memory_budget_bytes: Optional[int] = None,
+        max_queued_jobs: int = MAX_QUEUED_JOBS
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait = max_wait
+        self.max_queued_jobs = max(0, max_queued_jobs)
+        if memory_budget_bytes is None:
+            memory_budget_bytes = int(MEMORY_BUDGET_MB * 1024 * 1024) if MEMORY_BUDGET_MB > 0 else default_memory_budget()
+        self.memory_budget_bytes = memory_budget_bytes
+        self._active: List[Ticket] = []
+        self._waiting: List[Ticket] = []
+        self._condition = threading.Condition()
+        self._stats = {'admitted': 0, 'rejected_queue_full': 0, 'rejected_wait': 0, 'timeouts': 0}
+
+    def _can_start(self, ticket: Ticket) -> bool:
+        """Whether a ticket can start now. Caller must hold the lock."""
+        if sum(1 for active in self._active if active.model_name == ticket.model_name) >= self.max_concurrent:
+            return False
+        # Requests of the same model start in arrival order
+        for waiting in self._waiting:
+            if waiting is ticket:
+                break
+            if waiting.model_name == ticket.model_name:
+                return False
+        if not self._active or not self.memory_budget_bytes:
+            return True
+        reserved = sum(active.memory_bytes for active in self._active)
+        return reserved + ticket.memory_bytes <= self.memory_budget_bytes
+
+    def _estimate_wait(self, model_name: str) -> float:
+        """Estimated seconds before a new request of a model starts. Caller must hold the lock."""
+        pending = [ticket for ticket in self._active + self._waiting if ticket.model_name == model_name]
+        if sum(1 for ticket in self._active if ticket.model_name == model_name) < self.max_concurrent \
+                and len(pending) < self.max_concurrent:
+            return 0.0
+        return sum(ticket.remaining_seconds for ticket in pending) / self.max_concurrent
+
+    def estimate_wait(self, model_name: str) -> float:
+        """Returns the estimated seconds before a new request of a model can start."""
+        with self._condition:
+            return self._estimate_wait(model_name)
+
+    def check(self, model_name: str):
+        """
+        Rejects early, before the request does any work, if the queue is full.
+
+        Raises:
+            AdmissionRejected: With status 429 if the wait queue is full
+        """
+        with self._condition:
+            if len(self._waiting) >= self.max_queue:
+                self._stats['rejected_queue_full'] += 1
+                raise AdmissionRejected(
+                    "Server busy: too many separations waiting. Try again later.",
+                    status_code=429,
+                    retry_after=self._estimate_wait(model_name)
+                )
+
+    def check_job_queue(self, queued_jobs: int, wait_seconds: float):
+        """
+        Rejects a new background job if too many jobs are already queued.
+
+        Args:
+            queued_jobs: Jobs waiting for a worker
+            wait_seconds: Estimated wait of a new job (see JobManager.estimate_wait_seconds)
+
+        Raises:
+            AdmissionRejected: With status 429 if the job queue is full
+        """
+        if queued_jobs >= self.max_queued_jobs:
+            with self._condition:
+                self._stats['rejected_queue_full'] += 1
+            raise AdmissionRejected(
+                f"Server busy: {queued_jobs} jobs already queued. Try again later.",
+                status_code=429,
+                retry_after=wait_seconds
+            )
+
+    def acquire(
+        self,
+        model_name: str,
+        memory_bytes: int,
+        estimated_seconds: float,
+        reject: bool = True
+    ) -> Ticket:
+        """
+        Waits until a separation can start.
+
+        Args:
+            model_name: Model the separation uses
+            memory_bytes: Estimated memory (see estimate_request_bytes)
+            estimated_seconds: Estimated run time, used for wait estimates
+            reject: Reject when the queue is full or the wait is too long.
+                Background jobs pass False: they are already queued and wait as long as needed
+
+        Returns:
+            Ticket to pass to release()
+
+        Raises:
+            AdmissionRejected: 429 if the queue is full, 503 if the estimated
+                or actual wait exceeds max_wait
+        """
+        ticket = Ticket(model_name, memory_bytes, estimated_seconds)
+        with self._condition:
+            if reject:
+                if len(self._waiting) >= self.max_queue and not self._can_start(ticket):
+                    self._stats['rejected_queue_full'] += 1
+                    raise AdmissionRejected(
+                        "Server busy: too many separations waiting. Try again later.",
+                        status_code=429,
+                        retry_after=self._estimate_wait(model_name)
+                    )
+                wait = self._estimate_wait(model_name)
+                if wait > self.max_wait:
+                    self._stats['rejected_wait'] += 1
+                    raise AdmissionRejected(
+                        f"Server busy: estimated wait of {wait:.0f}s exceeds {self.max_wait:.0f}s. Try again later.",
+                        status_code=503,
+                        retry_after=wait
+                    )
+
+            self._waiting.append(ticket)
+            deadline = time.monotonic() + self.max_wait if reject else None
+            try:
+                while not self._can_start(ticket):
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise AdmissionRejected(
+                            "Server busy: timed out waiting for a free slot. Try again later.",
+                            status_code=503,
+                            retry_after=self._estimate_wait(model_name)
+                        )
+                    self._condition.wait(remaining)
+            finally:
+                self._waiting.remove(ticket)
+                # Requests queued behind this one may be able to start now
+                self._condition.notify_all()
+
+            ticket.started_at = time.time()
+            self._active.append(ticket)
+            self._stats['admitted'] += 1
+
+        waited = ticket.started_at - ticket.created_at
+        if waited > 1:
+            logger.info(f"🚦 Admitted {model_name} separation after waiting {waited:.1f}s")
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Frees the slot and memory held by a ticket."""
+        with self._condition:
+            if ticket in self._active:
+                self._active.remove(ticket)
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, model_name: str, memory_bytes: int, estimated_seconds: float, reject: bool = True):
+        """Holds a slot for the duration of the block (see acquire)."""
+        ticket = self.acquire(model_name, memory_bytes, estimated_seconds, reject)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def get_stats(self) -> dict:
+        """Returns running and waiting separations per model, memory reservations and rejections."""
+        with self._condition:
+            models: Dict[str, dict] = {}
+            for state, tickets in (('running', self._active), ('waiting', self._waiting)):
+                for ticket in tickets:
+                    counts = models.setdefault(ticket.model_name, {'running': 0, 'waiting': 0})
+                    counts[state] += 1
+            return {
+                **self._stats,
+                'max_concurrent_per_model': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'max_queued_jobs': self.max_queued_jobs,
+                'max_wait': self.max_wait,
+                'memory_budget_bytes': self.memory_budget_bytes,
+                'reserved_bytes': sum(ticket.memory_bytes for ticket in self._active),
+                'running': len(self._active),
+                'waiting': len(self._waiting),
+                'models': models,
+            }
+
+
+# Global instance
+_admission_controller = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """Returns the process-wide admission controller."""
+    global _admission_controller
+    if _admission_controller is None:
+        with _admission_controller_lock:
+            if _admission_controller is None:
+                _admission_controller = AdmissionController()
+    return _admission_controller
+
+
+def configure_admission(**kwargs) -> AdmissionController:
+    """
+    Replaces the process-wide admission controller.
+
+    Worker processes use it to take their share of the memory budget of the host.
+
+    Args:
+        **kwargs: AdmissionController arguments
+    """
+    global _admission_controller
+    with _admission_controller_lock:
+        _admission_controller = AdmissionController(**kwargs)
+        return _admission_controller
+
+
+def _collect_metrics():
+    """Exposes admitted, waiting and rejected separations."""
+    if _admission_controller is None:
+        return []
+    stats = _admission_controller.get_stats()
+    return [
+        ("voice_separator_admission_running", "gauge", "Separations holding a slot",
+         [({}, stats['running'])]),
+        ("voice_separator_admission_waiting", "gauge", "Separations waiting for a slot",
+         [({}, stats['waiting'])]),
+        ("voice_separator_admission_reserved_bytes", "gauge", "Memory reserved by running separations",
+         [({}, stats['reserved_bytes'])]),
+        ("voice_separator_admission_admitted_total", "counter", "Separations admitted",
+         [({}, stats['admitted'])]),
+        ("voice_separator_admission_rejected_total", "counter", "Separations rejected by reason",
+         [({'reason': 'queue_full'}, stats['rejected_queue_full']),
+          ({'reason': 'wait'}, stats['rejected_wait']),
+          ({'reason': 'timeout'}, stats['timeouts'])]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
@@ -0,0 +1,164 @@
+"""Inference backends for the Demucs models: eager, int8 dynamic quantization and torch.compile."""
+
+import os
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+import logging
+
+import torch
+from demucs.apply import BagOfModels
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = {
+    'eager': 'PyTorch model as loaded by demucs',
+    'int8': 'Dynamic int8 quantization of the LSTM and Linear layers (CPU only)',
+    'compile': 'torch.compile of every model of the bag',
+}
+
+# Backend used by the model registry (overridable through environment variables)
+DEFAULT_BACKEND = os.environ.get("VOICE_SEPARATOR_BACKEND", "eager").lower()
+# Quantized models and compiled kernels, next to the weights downloaded by torch.hub
+BACKEND_CACHE_DIR = os.environ.get(
+    "VOICE_SEPARATOR_BACKEND_CACHE_DIR", str(Path(torch.hub.get_dir()) / "checkpoints" / "voice-separator")
+)
+
+# Layers replaced by their dynamically quantized versions
+QUANTIZED_LAYERS = {torch.nn.LSTM, torch.nn.Linear}
+
+
+def validate_backend(backend: str) -> str:
+    """
+    Normalizes a backend name.
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    backend = (backend or 'eager').lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Invalid backend '{backend}'. Available: {list(BACKENDS)}")
+    return backend
+
+
+def artifact_path(model_name: str, backend: str) -> Path:
+    """File the weights of a transformed model are stored in (specific to the torch version that wrote it)."""
+    return Path(BACKEND_CACHE_DIR) / f"{model_name}-{backend}-torch{torch.__version__}.pt"
+
+
+def sub_models(model: torch.nn.Module) -> List[torch.nn.Module]:
+    """Models of a bag (or the model itself)."""
+    return list(model.models) if isinstance(model, BagOfModels) else [model]
+
+
+def is_quantized(model: torch.nn.Module) -> bool:
+    """
+    Whether a model contains dynamically quantized layers.
+
+    Those layers only take float32 inputs, so quantized models do not run under autocast.
+    """
+    return any(type(module).__module__.startswith('torch.ao.nn.quantized') for module in model.modules())
+
+
+def quantize_int8(model: torch.nn.Module) -> torch.nn.Module:
+    """Returns a copy of the model with int8 dynamically quantized LSTM and Linear layers."""
+    from torch.ao.quantization import quantize_dynamic
+    quantized = quantize_dynamic(model, QUANTIZED_LAYERS, dtype=torch.qint8)
+    quantized.eval()
+    return quantized
+
+
+def compile_model(model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Compiles the forward of every model of the bag with torch.compile (in place).
+
+    Compilation happens lazily on the first call; errors fall back to eager
+    execution instead of failing the separation.
+    """
+    import torch._dynamo
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(Path(BACKEND_CACHE_DIR) / "inductor"))
+    torch._dynamo.config.suppress_errors = True
+    for sub_model in sub_models(model):
+        # Micro-batching varies the batch size and the last segment of a track is
+        # shorter: shapes that change are recompiled once as dynamic, not per size
+        sub_model.forward = torch.compile(sub_model.forward, dynamic=None)
+    return model
+
+
+def _load_artifact(path: Path, model: torch.nn.Module) -> bool:
+    """Loads stored weights into a transformed model; False if there are none (or they are unreadable)."""
+    if not path.exists():
+        return False
+    try:
+        # Tensors only, plus the packed weights of quantized LSTMs (torch classes, not
+        # arbitrary Python objects): no code is unpickled from the cache directory
+        with torch.serialization.safe_globals([torch.ScriptObject]):
+            state = torch.load(path, map_location='cpu', weights_only=True)
+        model.load_state_dict(state)
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ Could not load {path.name} ({e}), rebuilding it")
+        return False
+
+
+def save_artifact(model: torch.nn.Module, path: Path):
+    """Stores the weights of a transformed model (atomically)."""
+    temp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        torch.save(model.state_dict(), temp_path)
+        os.replace(temp_path, path)
+    except OSError as e:
+        # The model is still usable, it will just be quantized again on the next start
+        logger.warning(f"⚠️ Could not save {path.name}: {e}")
+        return
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    logger.info(f"💾 Saved {path.name} ({path.stat().st_size / 1024 / 1024:.1f} MB)")
+
+
+def prepare_model(
+    model_name: str,
+    device: str,
+    loader: Callable[[], torch.nn.Module],
+    backend: str = DEFAULT_BACKEND
+) -> Tuple[torch.nn.Module, str]:
+    """
+    Gets a model ready to run with an inference backend.
+
+    Args:
+        model_name: Demucs pretrained model name
+        device: Torch device string ('cpu' or 'cuda')
+        loader: Returns the eager model on the device (only called when needed)
+        backend: Backend to use (see BACKENDS)
+
+    Returns:
+        Tuple with (model, backend actually used), the backend being 'eager'
+        when the requested one is not available for this model or device
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    backend = validate_backend(backend)
+    if backend == 'eager':
+        return loader(), 'eager'
+    if backend == 'int8' and device != 'cpu':
+        logger.warning(f"⚠️ The int8 backend only runs on CPU, using eager for {model_name} on {device}")
+        return loader(), 'eager'
+
+    model = loader()
+    try:
+        if backend == 'int8':
+            prepared = quantize_int8(model)
+            path = artifact_path(model_name, backend)
+            if _load_artifact(path, prepared):
+                logger.info(f"⚡ Loaded {backend} {model_name} weights from {path}")
+                return prepared, backend
+            save_artifact(prepared, path)
+        else:
+            prepared = compile_model(model)
+    except Exception as e:
+        logger.warning(f"⚠️ Backend '{backend}' not available for {model_name} ({e}), using eager")
+        return model, 'eager'
+    logger.info(f"⚡ {model_name} prepared with the {backend} backend")
+    return prepared, backend
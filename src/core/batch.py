@@ -0,0 +1,240 @@
+"""
+Batch separation of many tracks with a single resident model.
+
+Tracks are processed by a small pool of threads that share one
+AudioSeparator. Inference is serialized by the separator, so while one track
+runs through the model the others are being decoded or encoded by ffmpeg:
+throughput is bounded by inference instead of by the sum of all stages.
+
+Inputs are local files or YouTube URLs, given directly, found in a
+directory or listed in a manifest. Every track gets an entry in the results
+manifest, failures included, so a backfill can be resumed or retried.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+import logging
+
+from .separator import AVAILABLE_STEMS, get_audio_separator
+from .tasks import separate_youtube
+from .youtube_downloader import YouTubeDownloader
+
+logger = logging.getLogger(__name__)
+
+# Tracks in flight at once: one in inference while the others decode and encode
+BATCH_WORKERS = int(os.environ.get("VOICE_SEPARATOR_BATCH_WORKERS", "2"))
+
+# Extensions picked up when scanning a directory
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg', '.opus', '.webm'}
+
+# Called with (result entry, tracks finished, total tracks)
+ResultCallback = Callable[[dict, int, int], None]
+
+
+def find_audio_files(directory: str, recursive: bool = True) -> List[str]:
+    """
+    Lists the audio files of a directory.
+
+    Args:
+        directory: Directory to scan
+        recursive: Also scan subdirectories
+
+    Returns:
+        Sorted file paths with a supported extension
+    """
+    root = Path(directory)
+    if not root.is_dir():
+        raise ValueError(f"Not a directory: {directory}")
+    pattern = '**/*' if recursive else '*'
+    return sorted(
+        str(path) for path in root.glob(pattern)
+        if path.is_file() and path.suffix.lower() in AUDIO_EXTENSIONS
+    )
+
+
+def load_manifest(manifest_path: str) -> List[dict]:
+    """
+    Reads the tracks of a batch manifest.
+
+    The manifest is either a text file with one path or URL per line (blank
+    lines and lines starting with # are ignored) or a JSON list whose items
+    are paths/URLs or objects with a 'source' and an optional 'id'. Relative
+    paths are resolved against the manifest directory.
+
+    Returns:
+        List of items ({'source', 'id'})
+    """
+    path = Path(manifest_path)
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    if path.suffix.lower() == '.json':
+        entries = json.loads(content)
+        if isinstance(entries, dict):
+            entries = entries.get('items', [])
+    else:
+        entries = [
+            line.strip() for line in content.splitlines()
+            if line.strip() and not line.strip().startswith('#')
+        ]
+
+    items = []
+    for entry in entries:
+        item = dict(entry) if isinstance(entry, dict) else {'source': str(entry)}
+        source = item.get('source')
+        if not source:
+            raise ValueError(f"Manifest entry without source: {entry}")
+        if '://' not in source and not os.path.isabs(source):
+            item['source'] = str(path.parent / source)
+        items.append(item)
+    return make_items(items)
+
+
+def make_items(sources: Iterable) -> List[dict]:
+    """
+    Normalizes batch inputs (paths, URLs or item dicts) to items with a unique id.
+
+    Returns:
+        List of items ({'source', 'id'})
+    """
+    items = []
+    seen = set()
+    for index, source in enumerate(sources):
+        item = dict(source) if isinstance(source, dict) else {'source': str(source)}
+        item_id = str(item.get('id') or index)
+        if item_id in seen:
+            item_id = f"{item_id}-{index}"
+        seen.add(item_id)
+        item['id'] = item_id
+        items.append(item)
+    return items
+
+
+class BatchSeparator:
+    """
+    Separates many tracks with the same model, stems and settings.
+
+    The model is loaded once and stays resident for the whole batch.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        selected_stems: List[str],
+        mode: Optional[str] = None,
+        preset: Optional[str] = None,
+        workers: int = BATCH_WORKERS,
+        output_dir: Optional[str] = None,
+        use_cache: bool = True
+    ):
+        """
+        Args:
+            model_name: Demucs model name
+            selected_stems: Stems extracted from every track
+            mode: Separation mode (see SEPARATION_MODES)
+            preset: Speed/quality preset (see PRESETS)
+            workers: Tracks processed at the same time
+            output_dir: Directory for the stem files (default: the web output directory)
+            use_cache: Reuse and store cached results
+        """
+        invalid_stems = [stem for stem in selected_stems if stem not in AVAILABLE_STEMS]
+        if invalid_stems:
+            raise ValueError(f"Invalid stems: {invalid_stems}. Available: {list(AVAILABLE_STEMS.keys())}")
+        self.separator = get_audio_separator(model_name, output_dir)
+        self.selected_stems = list(selected_stems)
+        self.mode = mode
+        self.preset = preset
+        self.workers = max(1, workers)
+        self.use_cache = use_cache
+        self.settings = self.separator.get_separation_settings(self.selected_stems, mode, preset)
+        self.downloader = YouTubeDownloader()
+
+    def separate_item(self, item: dict) -> dict:
+        """
+        Separates one track.
+
+        Returns:
+            The item with its status ('completed' or 'failed'), the stem files
+            (stem -> absolute path) or the error, and the processing seconds
+        """
+        source = item['source']
+        entry = dict(item)
+        start = time.perf_counter()
+        options = {'mode': self.mode, 'preset': self.preset, 'use_cache': self.use_cache}
+        try:
+            if self.downloader.validate_youtube_url(source):
+                youtube_source = self.downloader.resolve(source)
+                entry['video_info'] = youtube_source.video_info
+                result_paths = separate_youtube(
+                    self.separator, self.downloader, youtube_source, self.selected_stems, **options
+                )
+            else:
+                result_paths = self.separator.separate_stems(source, self.selected_stems, **options)
+            entry['status'] = 'completed'
+            entry['files'] = {stem: str(Path(path).resolve()) for stem, path in result_paths.items()}
+        except Exception as e:
+            logger.error(f"❌ Batch item {item['id']} failed: {e}")
+            entry['status'] = 'failed'
+            entry['error'] = str(e)
+        entry['seconds'] = round(time.perf_counter() - start, 3)
+        return entry
+
+    def run(self, items: List[dict], on_result: Optional[ResultCallback] = None) -> dict:
+        """
+        Separates all items, overlapping the stages of different tracks.
+
+        Args:
+            items: Items to process (see make_items)
+            on_result: Called as each track finishes
+
+        Returns:
+            Results manifest: model, stems, settings, timing summary and one
+            entry per item, in input order
+        """
+        started_at = time.time()
+        start = time.perf_counter()
+        logger.info(
+            f"📚 Batch of {len(items)} tracks: model {self.separator.model_name}, "
+            f"stems {self.selected_stems}, {self.workers} workers"
+        )
+        results: Dict[str, dict] = {}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as executor:
+            futures = [executor.submit(self.separate_item, item) for item in items]
+            for future in as_completed(futures):
+                entry = future.result()
+                results[entry['id']] = entry
+                if on_result is not None:
+                    on_result(entry, len(results), len(items))
+
+        entries = [results[item['id']] for item in items]
+        completed = sum(entry['status'] == 'completed' for entry in entries)
+        elapsed = time.perf_counter() - start
+        logger.info(f"✅ Batch finished: {completed}/{len(items)} tracks in {elapsed:.1f}s")
+        return {
+            'model': self.separator.model_name,
+            'device': self.separator.device,
+            'stems': self.selected_stems,
+            'settings': self.settings,
+            'started_at': started_at,
+            'finished_at': time.time(),
+            'summary': {
+                'total': len(entries),
+                'completed': completed,
+                'failed': len(entries) - completed,
+                'seconds': round(elapsed, 3),
+            },
+            'items': entries,
+        }
+
+
+def write_manifest(manifest: dict, path: str):
+    """Writes a results manifest as JSON (atomically)."""
+    target = Path(path)
+    target.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = target.with_suffix(target.suffix + '.tmp')
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, target)
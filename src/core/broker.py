@@ -0,0 +1,832 @@
+"""Job broker shared by the API and the separation nodes (python -m src.worker)."""
+
+import fnmatch
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlparse
+import logging
+
+from .jobs import DEFAULT_JOB_WORKERS, Job, JobBackend, JobEventRelay, set_job_manager
+from .metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Broker of the separation nodes: redis://[:password@]host[:port][/db] (empty = run jobs on this host)
+BROKER_URL = os.environ.get("VOICE_SEPARATOR_BROKER_URL", "")
+# Jobs the API keeps in flight on the nodes (about the total workers of the nodes)
+BROKER_JOBS = int(os.environ.get("VOICE_SEPARATOR_BROKER_JOBS", "8"))
+# Prefix of the broker keys, so several deployments can share a server
+BROKER_PREFIX = os.environ.get("VOICE_SEPARATOR_BROKER_PREFIX", "voice-separator")
+# Seconds between node heartbeats; a node missing 3 of them is considered dead
+NODE_HEARTBEAT_SECONDS = 5
+# Longest blocking read from the broker before checking for shutdown and dead nodes
+POLL_SECONDS = 1
+# Connect and reply timeout of broker commands (blocking reads add their own wait)
+COMMAND_TIMEOUT = 10.0
+# Seconds a job may wait on the broker for a node before it fails
+QUEUE_TIMEOUT = float(os.environ.get("VOICE_SEPARATOR_BROKER_QUEUE_TIMEOUT", "1800"))
+# Times a job taken by a node that died goes back to the queue before it fails
+MAX_REQUEUES = 2
+# Seconds the events list of an API instance is kept after its last event (the API may be gone)
+EVENTS_TTL = 3600
+
+# Job functions a node runs, by the name sent over the broker (functions of tasks.py)
+JOB_FUNCTIONS = ('run_separation_job', 'run_batch_job')
+
+
+class BrokerError(Exception):
+    """Error reply of the broker."""
+
+
+def _encode_command(args) -> bytes:
+    """Encodes a command as a RESP array of bulk strings."""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+    return b"".join(parts)
+
+
+def _read_reply(stream):
+    """Reads one RESP value (bulk strings are decoded as UTF-8)."""
+    line = stream.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection to the broker closed")
+    kind, data = line[:1], line[1:-2]
+    if kind == b'+':
+        return data.decode('utf-8')
+    if kind == b'-':
+        raise BrokerError(data.decode('utf-8'))
+    if kind == b':':
+        return int(data)
+    if kind == b'$':
+        length = int(data)
+        if length < 0:
+            return None
+        value = stream.read(length + 2)
+        if len(value) != length + 2:
+            raise ConnectionError("Connection to the broker closed")
+        return value[:-2].decode('utf-8')
+    if kind == b'*':
+        count = int(data)
+        if count < 0:
+            return None
+        return [_read_reply(stream) for _ in range(count)]
+    raise BrokerError(f"Unexpected reply from the broker: {line[:80]!r}")
+
+
+class RedisBroker:
+    """
+    Minimal client for the commands of a Redis-compatible server used by the job broker.
+
+    Each thread uses its own connection, so a blocking pop does not hold up the others.
+    """
+
+    def __init__(self, url: str):
+        """
+        Args:
+            url: redis://[:password@]host[:port][/db]
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.password = parsed.password
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=COMMAND_TIMEOUT)
+        self._local.sock, self._local.stream = sock, sock.makefile('rwb')
+        if self.password:
+            self._command('AUTH', self.password)
+        if self.db:
+            self._command('SELECT', self.db)
+
+    def _close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = self._local.stream = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _command(self, *args):
+        stream = self._local.stream
+        stream.write(_encode_command(args))
+        stream.flush()
+        return _read_reply(stream)
+
+    def execute(self, *args, wait: float = 0):
+        """
+        Runs a command and returns its reply.
+
+        Args:
+            wait: Seconds the command may block on the server (BRPOP)
+
+        Raises:
+            BrokerError: If the server replied with an error
+            OSError: If the server is unreachable
+        """
+        if getattr(self._local, 'stream', None) is None:
+            self._connect()
+        try:
+            self._local.sock.settimeout(COMMAND_TIMEOUT + wait)
+            return self._command(*args)
+        except OSError:
+            # The connection is in an unknown state, reconnect on the next command
+            self._close()
+            raise
+
+    def push(self, key: str, value: str):
+        """Appends a message to a list."""
+        self.execute('LPUSH', key, value)
+
+    def pop(self, key: str, timeout: float) -> Optional[str]:
+        """Takes the oldest message of a list, waiting up to timeout seconds for one."""
+        reply = self.execute('BRPOP', key, int(max(1, timeout)), wait=timeout)
+        return reply[1] if reply else None
+
+    def pop_into(self, key: str, destination: str, timeout: float) -> Optional[str]:
+        """Moves the oldest message of a list to another list, waiting up to timeout seconds for one."""
+        return self.execute('BRPOPLPUSH', key, destination, int(max(1, timeout)), wait=timeout)
+
+    def take(self, key: str) -> Optional[str]:
+        """Takes the oldest message of a list, if any (does not wait)."""
+        return self.execute('RPOP', key)
+
+    def remove(self, key: str, value: str):
+        """Removes a message from a list."""
+        self.execute('LREM', key, 1, value)
+
+    def expire(self, key: str, ttl: int):
+        """Deletes a key after ttl seconds."""
+        self.execute('EXPIRE', key, int(ttl))
+
+    def length(self, key: str) -> int:
+        """Number of messages in a list."""
+        return self.execute('LLEN', key)
+
+    def set(self, key: str, value: str, ttl: int):
+        """Stores a value that expires after ttl seconds."""
+        self.execute('SET', key, value, 'EX', int(ttl))
+
+    def get(self, key: str) -> Optional[str]:
+        return self.execute('GET', key)
+
+    def delete(self, key: str):
+        self.execute('DEL', key)
+
+    def keys(self, pattern: str) -> List[str]:
+        """Keys matching a glob pattern (only used for the few node keys)."""
+        return self.execute('KEYS', pattern)
+
+
+class MemoryBroker:
+    """In-memory lists and expiring keys with the interface of RedisBroker (backs LocalBrokerServer)."""
+
+    def __init__(self):
+        self._lists: Dict[str, deque] = defaultdict(deque)
+        self._values: Dict[str, tuple] = {}
+        self._list_expiry: Dict[str, float] = {}
+        self._cond = threading.Condition()
+
+    def _expire_lists(self):
+        """Drops the lists whose expiry passed (lock held)."""
+        now = time.monotonic()
+        for key, expires_at in list(self._list_expiry.items()):
+            if expires_at <= now:
+                self._lists.pop(key, None)
+                del self._list_expiry[key]
+
+    def push(self, key: str, value: str):
+        with self._cond:
+            self._expire_lists()
+            self._lists[key].appendleft(value)
+            self._cond.notify_all()
+
+    def pop(self, key: str, timeout: Optional[float], destination: Optional[str] = None) -> Optional[str]:
+        """
+        Takes the oldest message of a list, waiting up to timeout seconds (None = forever).
+
+        With a destination, the message is also pushed to that list.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            self._expire_lists()
+            while not self._lists[key]:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            value = self._lists[key].pop()
+            if destination is not None:
+                self._lists[destination].appendleft(value)
+            return value
+
+    def remove(self, key: str, value: str) -> int:
+        with self._cond:
+            try:
+                self._lists[key].remove(value)
+            except ValueError:
+                return 0
+            return 1
+
+    def expire(self, key: str, ttl: float) -> int:
+        with self._cond:
+            expires_at = time.monotonic() + ttl
+            if self._lists.get(key):
+                self._list_expiry[key] = expires_at
+                return 1
+            if key in self._values:
+                self._values[key] = (self._values[key][0], expires_at)
+                return 1
+            return 0
+
+    def length(self, key: str) -> int:
+        with self._cond:
+            self._expire_lists()
+            return len(self._lists.get(key, ()))
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._cond:
+            self._values[key] = (value, None if ttl is None else time.monotonic() + ttl)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._cond:
+            value, expires_at = self._values.get(key, (None, None))
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._values[key]
+                return None
+            return value
+
+    def delete(self, key: str) -> int:
+        with self._cond:
+            self._list_expiry.pop(key, None)
+            removed = self._values.pop(key, None) is not None
+            removed = self._lists.pop(key, None) is not None or removed
+            return int(removed)
+
+    def keys(self, pattern: str) -> List[str]:
+        with self._cond:
+            self._expire_lists()
+            names = [key for key, items in self._lists.items() if items] + list(self._values)
+        return [key for key in names if fnmatch.fnmatchcase(key, pattern) and (
+            key not in self._values or self.get(key) is not None
+        )]
+
+
+# Marks a +OK status reply of the stand-in server
+_OK = object()
+
+
+def _encode_reply(value) -> bytes:
+    """Encodes a reply of the stand-in server in RESP."""
+    if value is _OK:
+        return b"+OK\r\n"
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(_encode_reply(item) for item in value)
+    data = str(value).encode('utf-8')
+    return f"${len(data)}\r\n".encode() + data + b"\r\n"
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """One client connection of the stand-in server."""
+
+    def handle(self):
+        store: MemoryBroker = self.server.store
+        while True:
+            try:
+                command = _read_reply(self.rfile)
+            except (ConnectionError, OSError, ValueError, BrokerError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            try:
+                reply = self._dispatch(store, command[0].upper(), command[1:])
+            except (IndexError, ValueError) as e:
+                reply = BrokerError(f"ERR {e or 'wrong number of arguments'}")
+            if isinstance(reply, BrokerError):
+                data = f"-{reply}\r\n".encode()
+            elif reply is None and command[0].upper() == 'BRPOP':
+                data = b"*-1\r\n"
+            else:
+                data = _encode_reply(reply)
+            try:
+                self.wfile.write(data)
+                self.wfile.flush()
+            except OSError:
+                return
+
+    @staticmethod
+    def _dispatch(store: MemoryBroker, name: str, args: List[str]):
+        if name == 'PING':
+            return 'PONG'
+        if name in ('AUTH', 'SELECT'):
+            return _OK
+        if name == 'LPUSH':
+            for value in args[1:]:
+                store.push(args[0], value)
+            return store.length(args[0])
+        if name == 'BRPOP':
+            if len(args) != 2:
+                return BrokerError("ERR the stand-in broker pops one list at a time")
+            timeout = float(args[1])
+            value = store.pop(args[0], timeout or None)
+            return None if value is None else [args[0], value]
+        if name == 'BRPOPLPUSH':
+            return store.pop(args[0], float(args[2]) or None, destination=args[1])
+        if name == 'RPOP':
+            return store.pop(args[0], 0)
+        if name == 'LREM':
+            return store.remove(args[0], args[2])
+        if name == 'EXPIRE':
+            return store.expire(args[0], float(args[1]))
+        if name == 'LLEN':
+            return store.length(args[0])
+        if name == 'SET':
+            ttl = float(args[3]) if len(args) >= 4 and args[2].upper() == 'EX' else None
+            store.set(args[0], args[1], ttl)
+            return _OK
+        if name == 'GET':
+            return store.get(args[0])
+        if name == 'DEL':
+            return sum(store.delete(key) for key in args)
+        if name == 'KEYS':
+            return store.keys(args[0])
+        return BrokerError(f"ERR unknown command '{name}'")
+
+
+class LocalBrokerServer:
+    """
+    In-memory stand-in for a Redis server, with the commands used by the job broker.
+
+    For development and tests only: nothing is persisted and there is no authentication.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 6379):
+        self.store = MemoryBroker()
+        self._server = socketserver.ThreadingTCPServer((host, port), _RespHandler, bind_and_activate=False)
+        self._server.daemon_threads = True
+        self._server.allow_reuse_address = True
+        self._server.store = self.store
+        self.host, self.port = host, port
+
+    def start(self):
+        """Starts serving on a background thread."""
+        self._server.server_bind()
+        self._server.server_activate()
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="local-broker", daemon=True).start()
+        logger.info(f"🧪 Local stand-in broker listening on {self.host}:{self.port}")
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def connect_broker(url: str) -> RedisBroker:
+    """
+    Returns a client for the broker at url.
+
+    Raises:
+        ValueError: If the URL scheme is not supported
+    """
+    scheme = urlparse(url).scheme
+    if scheme != 'redis':
+        raise ValueError(f"Unsupported broker URL '{url}'. Use redis://[:password@]host[:port][/db]")
+    return RedisBroker(url)
+
+
+def _redact(url: str) -> str:
+    """Broker URL without its password (reported by /health)."""
+    parsed = urlparse(url)
+    if parsed.password is None:
+        return url
+    return parsed._replace(netloc=parsed.netloc.replace(f":{parsed.password}@", ":***@")).geturl()
+
+
+def _job_functions() -> Dict[str, Callable[..., Any]]:
+    """The job functions nodes may run, by name."""
+    from . import tasks
+
+    return {name: getattr(tasks, name) for name in JOB_FUNCTIONS}
+
+
+def _function_name(func: Callable[..., Any]) -> str:
+    """
+    Name a node resolves a job function by.
+
+    Raises:
+        ValueError: If the function is not one of JOB_FUNCTIONS
+    """
+    for name, registered in _job_functions().items():
+        if registered is func:
+            return name
+    raise ValueError(f"Job function {getattr(func, '__qualname__', func)} cannot run on a separation node")
+
+
+def _resolve_function(name: str) -> Callable[..., Any]:
+    """
+    Looks up a job function sent by _function_name.
+
+    Raises:
+        ValueError: If the name is not one of JOB_FUNCTIONS
+    """
+    if name not in JOB_FUNCTIONS:
+        raise ValueError(f"Job function {name!r} cannot run on a separation node")
+    return _job_functions()[name]
+
+
+class _RemoteTask:
+    """A job running on a separation node, as seen from the API process."""
+
+    def __init__(self, job: Job):
+        self.job = job
+        self.node: Optional[str] = None
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[str] = None
+        # When the job was (last) queued for a node
+        self.queued_at = time.monotonic()
+
+
+class BrokerBackend(JobBackend):
+    """
+    Runs job functions on the separation nodes pulling jobs from the broker.
+
+    Job functions must be module-level functions of this package, and their
+    arguments and results JSON-serializable.
+    """
+
+    name = 'broker'
+    remote = True
+
+    def __init__(self, broker: RedisBroker, url: str = '', prefix: str = BROKER_PREFIX):
+        """
+        Args:
+            broker: Broker client
+            url: Broker URL (reported without its password)
+            prefix: Prefix of the broker keys
+        """
+        self.broker = broker
+        self.url = _redact(url)
+        self.prefix = prefix
+        # Results and progress of the jobs of this API instance come back on its own list
+        self.events_key = f"{prefix}:events:{uuid.uuid4().hex}"
+        self._tasks: Dict[str, _RemoteTask] = {}
+        self._lock = threading.Lock()
+        self._stats = {'completed': 0, 'failed': 0, 'lost': 0, 'requeued': 0, 'expired': 0}
+        self._listener: Optional[threading.Thread] = None
+
+    def start(self):
+        """Starts listening for the events of the nodes."""
+        with self._lock:
+            if self._listener is not None:
+                return
+            self._listener = threading.Thread(target=self._listen, name="broker-events", daemon=True)
+        self._listener.start()
+        logger.info(f"📮 Sending jobs to the separation nodes through {self.url}")
+
+    def run(self, job: Job, func: Callable[..., Any], args: tuple = (), kwargs: Optional[dict] = None) -> Any:
+        """
+        Sends func(job, *args, **kwargs) to the nodes and waits for its result (blocking).
+
+        Raises:
+            Exception: If the function failed, its node died or the broker is unreachable
+        """
+        self.start()
+        message = json.dumps({
+            'id': job.id,
+            'function': _function_name(func),
+            'args': list(args),
+            'kwargs': kwargs or {},
+            'job': job.to_state(),
+            'reply_to': self.events_key,
+            # Nodes skip jobs taken after this time (the API has failed them)
+            'deadline': time.time() + QUEUE_TIMEOUT,
+            'requeues': 0,
+        })
+        task = _RemoteTask(job)
+        with self._lock:
+            self._tasks[job.id] = task
+        try:
+            self.broker.push(f"{self.prefix}:tasks", message)
+            task.done.wait()
+        finally:
+            with self._lock:
+                self._tasks.pop(job.id, None)
+        if task.error is not None:
+            raise Exception(task.error)
+        return task.result
+
+    def _listen(self):
+        """Applies the events sent by the nodes and requeues the jobs of dead nodes."""
+        from .jobs import get_job_manager
+
+        last_check = time.monotonic()
+        while True:
+            try:
+                message = self.broker.pop(self.events_key, POLL_SECONDS)
+            except (BrokerError, OSError) as e:
+                logger.error(f"❌ Broker unreachable: {e}")
+                time.sleep(POLL_SECONDS)
+                continue
+            if message is not None:
+                job_id, event, payload = json.loads(message)
+                self._apply(get_job_manager(), job_id, event, payload)
+            if time.monotonic() - last_check >= NODE_HEARTBEAT_SECONDS:
+                last_check = time.monotonic()
+                try:
+                    self._requeue_lost()
+                    self._check_tasks()
+                except (BrokerError, OSError) as e:
+                    logger.error(f"❌ Broker unreachable: {e}")
+
+    def _apply(self, manager, job_id: str, event: str, payload: Any):
+        with self._lock:
+            task = self._tasks.get(job_id)
+        if task is None:
+            return
+        if event == 'started':
+            task.node = payload
+        elif event == 'update':
+            manager.update(task.job, **payload)
+        elif event == 'outputs':
+            manager.set_outputs(task.job, payload)
+        elif event in ('result', 'error'):
+            if event == 'result':
+                task.result = payload
+            else:
+                task.error = payload
+            with self._lock:
+                self._stats['completed' if event == 'result' else 'failed'] += 1
+            task.done.set()
+
+    def _requeue_lost(self):
+        """
+        Puts the jobs taken by nodes that stopped sending heartbeats back on the queue.
+
+        Any API instance may do it for any node: each job is taken off the
+        node's processing list by exactly one of them. A job whose nodes died
+        MAX_REQUEUES times fails instead, so it cannot take every node down.
+        """
+        processing = f"{self.prefix}:processing:"
+        for key in self.broker.keys(processing + '*'):
+            node_id = key[len(processing):]
+            if self.broker.get(f"{self.prefix}:nodes:{node_id}") is not None:
+                continue
+            while True:
+                message = self.broker.take(key)
+                if message is None:
+                    break
+                task = json.loads(message)
+                if task.get('requeues', 0) >= MAX_REQUEUES:
+                    logger.error(f"❌ Job {task['id']} lost with {MAX_REQUEUES + 1} separation nodes, giving up")
+                    self.broker.push(task['reply_to'], json.dumps([
+                        task['id'], 'error', f"Separation nodes stopped responding {MAX_REQUEUES + 1} times running the job"
+                    ]))
+                    self.broker.expire(task['reply_to'], EVENTS_TTL)
+                    continue
+                task['requeues'] = task.get('requeues', 0) + 1
+                task['deadline'] = time.time() + QUEUE_TIMEOUT
+                self.broker.push(f"{self.prefix}:tasks", json.dumps(task))
+                logger.warning(f"🔁 Job {task['id']} of separation node {node_id} put back on the queue")
+                with self._lock:
+                    self._stats['requeued'] += 1
+
+    def _check_tasks(self):
+        """Tracks the jobs whose node stopped sending heartbeats, and fails the jobs no node took in time."""
+        with self._lock:
+            pending = [task for task in self._tasks.values() if not task.done.is_set()]
+        for task in pending:
+            if task.node is None:
+                if time.monotonic() - task.queued_at > QUEUE_TIMEOUT:
+                    with self._lock:
+                        self._stats['expired'] += 1
+                    task.error = f"No separation node took the job within {QUEUE_TIMEOUT:.0f}s"
+                    task.done.set()
+                continue
+            if self.broker.get(f"{self.prefix}:nodes:{task.node}") is None:
+                # _requeue_lost (here or in another API instance) puts it back on the queue
+                logger.warning(f"⚠️ Separation node {task.node} stopped responding, job {task.job.id} is requeued")
+                with self._lock:
+                    self._stats['lost'] += 1
+                task.node = None
+                task.queued_at = time.monotonic()
+
+    def get_nodes(self) -> List[dict]:
+        """Returns the heartbeats of the live separation nodes."""
+        nodes = []
+        for key in self.broker.keys(f"{self.prefix}:nodes:*"):
+            value = self.broker.get(key)
+            if value is not None:
+                nodes.append(json.loads(value))
+        return nodes
+
+    def get_stats(self) -> dict:
+        """Returns the broker, the live nodes and job counts."""
+        with self._lock:
+            stats = {
+                **self._stats,
+                'backend': self.name,
+                'url': self.url,
+                'waiting': sum(task.node is None for task in self._tasks.values()),
+                'running': sum(task.node is not None for task in self._tasks.values()),
+            }
+        try:
+            stats['nodes'] = self.get_nodes()
+            stats['queued_on_broker'] = self.broker.length(f"{self.prefix}:tasks")
+        except (BrokerError, OSError) as e:
+            stats['error'] = str(e)
+        return stats
+
+
+class SeparationNode:
+    """
+    Pulls jobs from the broker and runs them on this host (python -m src.worker).
+
+    Each worker thread runs one job at a time; with VOICE_SEPARATOR_WORKER_PROCESSES
+    the jobs run on the local worker processes sharing the model weights.
+    """
+
+    def __init__(self, broker: RedisBroker, workers: int = DEFAULT_JOB_WORKERS, prefix: str = BROKER_PREFIX):
+        """
+        Args:
+            broker: Broker client
+            workers: Jobs run at the same time
+            prefix: Prefix of the broker keys
+        """
+        self.broker = broker
+        self.workers = max(1, workers)
+        self.prefix = prefix
+        self.node_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.started_at = time.time()
+        # Where the events of each running job go
+        self._replies: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._stats = {'running': 0, 'completed': 0, 'failed': 0}
+
+    @property
+    def heartbeat_key(self) -> str:
+        return f"{self.prefix}:nodes:{self.node_id}"
+
+    @property
+    def processing_key(self) -> str:
+        """List holding the jobs this node took until they finish (requeued if the node dies)."""
+        return f"{self.prefix}:processing:{self.node_id}"
+
+    def run(self):
+        """Runs the node until stop() is called (blocking); running jobs are finished first."""
+        from .worker_pool import get_worker_pool
+
+        # Job progress is forwarded to the API instance that sent the job
+        set_job_manager(JobEventRelay(self._send))
+        pool = get_worker_pool()
+        # Alive before taking jobs, or an API could requeue them
+        self._heartbeat()
+        threads = [
+            threading.Thread(target=self._work, args=(pool,), name=f"node-worker-{index}", daemon=True)
+            for index in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        logger.info(f"🛰️ Separation node {self.node_id} pulling jobs with {self.workers} workers")
+
+        while not self._stop.wait(NODE_HEARTBEAT_SECONDS):
+            self._heartbeat()
+        for thread in threads:
+            thread.join()
+        try:
+            self.broker.delete(self.heartbeat_key)
+        except (BrokerError, OSError):
+            pass
+        logger.info(f"👋 Separation node {self.node_id} stopped")
+
+    def stop(self):
+        """Stops pulling jobs."""
+        self._stop.set()
+
+    def _heartbeat(self):
+        with self._lock:
+            state = {
+                **self._stats,
+                'id': self.node_id,
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                'workers': self.workers,
+                'started_at': self.started_at,
+            }
+        try:
+            self.broker.set(self.heartbeat_key, json.dumps(state), 3 * NODE_HEARTBEAT_SECONDS)
+        except (BrokerError, OSError) as e:
+            logger.error(f"❌ Broker unreachable: {e}")
+
+    def _send(self, job_id: str, event: str, payload: Any):
+        """Sends an event of a running job to the API instance that sent it."""
+        with self._lock:
+            reply_to = self._replies.get(job_id)
+        if reply_to is None:
+            return
+        try:
+            self.broker.push(reply_to, json.dumps([job_id, event, payload], default=str))
+            self.broker.expire(reply_to, EVENTS_TTL)
+        except (BrokerError, OSError) as e:
+            logger.error(f"❌ Could not send '{event}' of job {job_id}: {e}")
+
+    def _work(self, pool):
+        """Worker loop: pulls jobs until the node stops."""
+        while not self._stop.is_set():
+            try:
+                message = self.broker.pop_into(f"{self.prefix}:tasks", self.processing_key, POLL_SECONDS)
+            except (BrokerError, OSError) as e:
+                logger.error(f"❌ Broker unreachable: {e}")
+                self._stop.wait(POLL_SECONDS)
+                continue
+            if message is None:
+                continue
+            self._execute(json.loads(message), pool)
+            try:
+                self.broker.remove(self.processing_key, message)
+            except (BrokerError, OSError) as e:
+                logger.error(f"❌ Could not release job {json.loads(message)['id']}: {e}")
+
+    def _execute(self, task: dict, pool):
+        job_id = task['id']
+        with self._lock:
+            self._replies[job_id] = task['reply_to']
+            self._stats['running'] += 1
+        if time.time() > task.get('deadline', float('inf')):
+            # The API gave up on it already
+            logger.warning(f"⏭️ Skipping job {job_id}: it waited too long for a node")
+            with self._lock:
+                self._replies.pop(job_id, None)
+                self._stats['running'] -= 1
+            return
+        self._send(job_id, 'started', self.node_id)
+        logger.info(f"▶️ Job {job_id} started on node {self.node_id}")
+        try:
+            job = Job.from_state(task['job'])
+            func = _resolve_function(task['function'])
+            if pool is not None:
+                result = pool.run(job, func, tuple(task['args']), task['kwargs'])
+            else:
+                result = func(job, *task['args'], **task['kwargs'])
+            self._send(job_id, 'result', result)
+            outcome = 'completed'
+        except Exception as e:
+            logger.error(f"❌ Job {job_id} failed: {e}")
+            self._send(job_id, 'error', str(e))
+            outcome = 'failed'
+        with self._lock:
+            self._replies.pop(job_id, None)
+            self._stats['running'] -= 1
+            self._stats[outcome] += 1
+
+
+# Global instance
+_broker_backend = None
+_broker_backend_lock = threading.Lock()
+
+
+def get_broker_backend() -> Optional[BrokerBackend]:
+    """Returns the process-wide broker backend, or None when jobs run on this host."""
+    global _broker_backend
+    if not BROKER_URL:
+        return None
+    if _broker_backend is None:
+        with _broker_backend_lock:
+            if _broker_backend is None:
+                _broker_backend = BrokerBackend(connect_broker(BROKER_URL), BROKER_URL)
+                _broker_backend.start()
+    return _broker_backend
+
+
+def _collect_metrics():
+    """Exposes the live separation nodes and the jobs waiting on the broker."""
+    if _broker_backend is None:
+        return []
+    try:
+        nodes = _broker_backend.get_nodes()
+        queued = _broker_backend.broker.length(f"{_broker_backend.prefix}:tasks")
+    except (BrokerError, OSError):
+        return []
+    return [
+        ("voice_separator_broker_nodes", "gauge", "Live separation nodes", [({}, len(nodes))]),
+        ("voice_separator_broker_queued_jobs", "gauge", "Jobs waiting on the broker for a node", [({}, queued)]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
@@ -0,0 +1,636 @@
+import atexit
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+import logging
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: processes sharing a cache directory may lose index updates
+    fcntl = None
+
+from .metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Cache locations and sizes (overridable through environment variables, 0 disables a cache)
+DEFAULT_CACHE_DIR = os.environ.get(
+    "VOICE_SEPARATOR_CACHE_DIR", str(Path.home() / ".cache" / "voice-separator")
+)
+DEFAULT_RESULT_CACHE_MB = float(os.environ.get("VOICE_SEPARATOR_RESULT_CACHE_MB", "2048"))
+DEFAULT_SOURCE_CACHE_MB = float(os.environ.get("VOICE_SEPARATOR_SOURCE_CACHE_MB", "4096"))
+DEFAULT_YOUTUBE_CACHE_MB = float(os.environ.get("VOICE_SEPARATOR_YOUTUBE_CACHE_MB", "2048"))
+# Downloaded audio is kept for a week; video information only for a few hours,
+# because the media URLs it contains are signed and expire
+DEFAULT_YOUTUBE_AUDIO_TTL = float(os.environ.get("VOICE_SEPARATOR_YOUTUBE_CACHE_TTL", str(7 * 24 * 3600)))
+DEFAULT_YOUTUBE_INFO_TTL = float(os.environ.get("VOICE_SEPARATOR_YOUTUBE_INFO_TTL", str(5 * 3600)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Seconds cache hits are batched before their recency is written to the index
+INDEX_FLUSH_SECONDS = 5.0
+
+
+def hash_file(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's bytes."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_cache_key(*parts) -> str:
+    """Builds a stable hex key from any JSON-serializable parts."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class DiskCache:
+    """
+    Size-bounded LRU index of files stored in a directory.
+
+    Each entry maps a key to one or more files (relative to the cache
+    directory). The index is persisted as JSON so the cache survives restarts.
+    When the total size exceeds max_bytes, or an entry is older than its ttl
+    (the cache ttl unless the entry was stored with its own), the entry and
+    its files are deleted.
+
+    Several processes (uvicorn or separation workers) can share a directory:
+    changes are merged into the index on disk under a file lock, and the
+    recency of hits is written in batches every INDEX_FLUSH_SECONDS.
+    """
+
+    def __init__(self, cache_dir: str, index_name: str, max_bytes: int, ttl: float = 0):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.cache_dir / index_name
+        self.lock_path = self.cache_dir / f"{index_name}.lock"
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        # Hits whose recency is not in the index file yet (key -> last access)
+        self._touched: Dict[str, float] = {}
+        self._flush_timer: Optional[threading.Timer] = None
+        # Identifies the index file last read or written (a new file replaces it on each write)
+        self._index_version: Optional[tuple] = None
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._reload_index()
+        if self._entries:
+            logger.info(f"📦 Cache index loaded: {self.index_path} ({len(self._entries)} entries)")
+        atexit.register(self.flush)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str) -> Optional[dict]:
+        """
+        Looks up an entry and marks it as recently used.
+
+        Returns:
+            Entry dict ('files', 'size', 'meta', ...) or None on a miss
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            if key not in self._entries:
+                # Another process may have stored it
+                self._reload_index()
+            entry = self._entries.get(key)
+            if entry is not None and not self._is_valid(entry):
+                self._remove(key)
+                self._sync_index(removed=[key])
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            entry['last_access'] = self._touched[key] = time.time()
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            self._schedule_flush()
+            return dict(entry)
+
+    def put(self, key: str, files: List[str], meta: Optional[dict] = None, ttl: Optional[float] = None) -> Optional[dict]:
+        """
+        Registers files (relative to the cache directory) under a key.
+
+        Args:
+            key: Entry key
+            files: File names relative to the cache directory
+            meta: Extra information stored with the entry
+            ttl: Lifetime of this entry in seconds (default: the cache ttl)
+
+        Returns:
+            The stored entry, or None if the cache is disabled
+        """
+        if not self.enabled:
+            return None
+        size = 0
+        for name in files:
+            try:
+                size += (self.cache_dir / name).stat().st_size
+            except OSError:
+                pass
+        now = time.time()
+        entry = {'files': list(files), 'size': size, 'meta': meta or {}, 'created': now, 'last_access': now}
+        if ttl is not None:
+            entry['ttl'] = ttl
+        with self._lock:
+            self._stats['stores'] += 1
+            self._sync_index(added={key: entry}, protect=key)
+        return dict(entry)
+
+    def flush(self):
+        """Writes the recency of pending cache hits to the index."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if self._touched:
+                self._sync_index()
+
+    def path(self, name: str) -> Path:
+        """Returns the absolute path of a file stored in the cache directory."""
+        return self.cache_dir / name
+
+    def get_stats(self) -> dict:
+        """Returns cache statistics (hits, misses, hit rate, size)."""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'size_bytes': sum(entry['size'] for entry in self._entries.values()),
+                'max_bytes': self.max_bytes,
+            }
+
+    def _is_expired(self, entry: dict, now: float) -> bool:
+        ttl = entry.get('ttl', self.ttl)
+        return bool(ttl) and now - entry['created'] > ttl
+
+    def _is_valid(self, entry: dict) -> bool:
+        if self._is_expired(entry, time.time()):
+            return False
+        return all((self.cache_dir / name).exists() for name in entry['files'])
+
+    def _remove(self, key: str, delete_files: bool = True):
+        """Drops an entry (and its files). Caller must hold the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is None or not delete_files:
+            return
+        for name in entry['files']:
+            try:
+                (self.cache_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Error removing cached file {name}: {e}")
+
+    def _evict(self, protect: Optional[str] = None):
+        """Evicts expired and least recently used entries. Caller must hold the lock."""
+        now = time.time()
+        for key in [k for k, e in self._entries.items() if self._is_expired(e, now) and k != protect]:
+            self._remove(key)
+            self._stats['evictions'] += 1
+        total = sum(entry['size'] for entry in self._entries.values())
+        for key in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if key == protect:
+                continue
+            total -= self._entries[key]['size']
+            self._remove(key)
+            self._stats['evictions'] += 1
+
+    def _schedule_flush(self):
+        """Writes the pending hits after INDEX_FLUSH_SECONDS. Caller must hold the lock."""
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(INDEX_FLUSH_SECONDS, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    @contextmanager
+    def _index_lock(self, shared: bool = False):
+        """Locks the index file against the other processes sharing the directory."""
+        try:
+            handle = open(self.lock_path, 'a')
+        except OSError:
+            handle = None
+        try:
+            if handle is not None and fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            yield
+        finally:
+            if handle is not None:
+                # Closing the file releases the lock
+                handle.close()
+
+    def _version(self) -> Optional[tuple]:
+        try:
+            stat = self.index_path.stat()
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_index(self) -> Dict[str, dict]:
+        """Reads the index file (index lock held)."""
+        try:
+            self._index_version = self._version()
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('entries', {})
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.warning(f"Error loading cache index {self.index_path}: {e}")
+            return {}
+
+    def _merge(self, entries: Dict[str, dict]):
+        """Replaces the entries with those of the index file plus the pending hits. Caller must hold the lock."""
+        for key, last_access in self._touched.items():
+            if key in entries:
+                entries[key]['last_access'] = max(entries[key].get('last_access', 0), last_access)
+        self._entries = OrderedDict(sorted(entries.items(), key=lambda item: item[1].get('last_access', 0)))
+
+    def _reload_index(self):
+        """Picks up the changes other processes wrote to the index. Caller must hold the lock."""
+        version = self._version()
+        if version is None or version == self._index_version:
+            return
+        with self._index_lock(shared=True):
+            self._merge(self._read_index())
+
+    def _sync_index(
+        self,
+        added: Optional[Dict[str, dict]] = None,
+        removed: Iterable[str] = (),
+        protect: Optional[str] = None
+    ):
+        """
+        Merges changes into the index on disk and writes it back atomically. Caller must hold the lock.
+
+        Args:
+            added: Entries stored by this process
+            removed: Keys dropped by this process
+            protect: Key kept by the eviction that follows a store
+        """
+        with self._index_lock():
+            entries = self._read_index()
+            for key in removed:
+                entries.pop(key, None)
+            entries.update(added or {})
+            self._merge(entries)
+            self._touched.clear()
+            if added:
+                self._evict(protect=protect)
+            temp_path = self.index_path.with_name(f"{self.index_path.name}.{os.getpid()}.tmp")
+            try:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'entries': self._entries}, f)
+                os.replace(temp_path, self.index_path)
+                self._index_version = self._version()
+            except OSError as e:
+                logger.warning(f"Error saving cache index {self.index_path}: {e}")
+
+
+class ResultCache(DiskCache):
+    """
+    Cache of encoded stem files, keyed by input content and separation settings.
+
+    Stem files live in the output directory and are served directly by the
+    static route, so a hit costs a single lookup.
+    """
+
+    def __init__(self, output_dir: str, max_mb: float = DEFAULT_RESULT_CACHE_MB):
+        super().__init__(output_dir, '.result_cache.json', int(max_mb * 1024 * 1024))
+
+    @staticmethod
+    def make_key(content_hash: str, model_name: str, settings: dict) -> str:
+        """Builds the cache key for an input and the settings that affect the output."""
+        return make_cache_key('result', content_hash, model_name, settings)
+
+    @staticmethod
+    def filename(key: str, stem: str, output_format: str) -> str:
+        """Returns the deterministic output filename of a cached stem."""
+        return f"{stem}_{key[:16]}.{output_format}"
+
+    def get_stems(self, key: str, stems: List[str]) -> Dict[str, str]:
+        """
+        Returns the cached files (names relative to the output directory) for the requested stems.
+
+        Missing stems are simply absent from the returned dict.
+        """
+        found = {}
+        for stem in stems:
+            entry = self.get(f"{key}:{stem}")
+            if entry is not None:
+                found[stem] = entry['files'][0]
+        return found
+
+    def put_stem(self, key: str, stem: str, filename: str, meta: Optional[dict] = None):
+        """Registers an encoded stem file."""
+        self.put(f"{key}:{stem}", [filename], meta)
+
+
+class SourceCache(DiskCache):
+    """
+    Cache of raw separated sources ([sources, channels, length] tensors).
+
+    Sources are stored as float16 .npy files and memory-mapped on read, so a
+    later request for a different stem combination only reads the rows it
+    needs and skips inference entirely.
+    """
+
+    def __init__(self, cache_dir: str = None, max_mb: float = DEFAULT_SOURCE_CACHE_MB):
+        cache_dir = cache_dir or str(Path(DEFAULT_CACHE_DIR) / "sources")
+        super().__init__(cache_dir, 'index.json', int(max_mb * 1024 * 1024))
+
+    @staticmethod
+    def make_key(content_hash: str, model_name: str, settings: dict) -> str:
+        """Builds the cache key for an input and the settings that affect inference."""
+        return make_cache_key('sources', content_hash, model_name, settings)
+
+    def load(self, key: str) -> Optional[np.ndarray]:
+        """
+        Returns the cached sources as a read-only memory-mapped float16 array, or None.
+        """
+        entry = self.get(key)
+        if entry is None:
+            return None
+        try:
+            return np.load(self.path(entry['files'][0]), mmap_mode='r')
+        except Exception as e:
+            logger.warning(f"Error reading cached sources {key[:16]}: {e}")
+            return None
+
+    def store(self, key: str, sources: np.ndarray, meta: Optional[dict] = None):
+        """Stores sources as float16 (written to a temporary file, then renamed)."""
+        if not self.enabled:
+            return
+        filename = f"{key}.npy"
+        # Unique per writer: processes sharing the directory may store the same key at once
+        temp_path = self.path(f"{key}.{uuid.uuid4().hex[:8]}.tmp.npy")
+        try:
+            np.save(temp_path, sources.astype(np.float16, copy=False))
+            os.replace(temp_path, self.path(filename))
+        except OSError as e:
+            logger.warning(f"Error caching sources {key[:16]}: {e}")
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+            return
+        self.put(key, [filename], meta)
+
+    def open_writer(self, key: str) -> Optional["SourceWriter"]:
+        """Starts storing sources produced window by window, or returns None if the cache is disabled."""
+        return SourceWriter(self, key) if self.enabled else None
+
+
+class SourceWriter:
+    """
+    Stores sources in a SourceCache as they are produced, window by window.
+
+    Blocks are appended to a Fortran-ordered float16 .npy file (frames are the
+    slowest axis), whose header gets the final length on commit(). np.load
+    memory-maps it like the files written by SourceCache.store. Errors only
+    disable caching, never the separation.
+    """
+
+    # Length written in the provisional header: its size does not change with the final length
+    PLACEHOLDER_FRAMES = 10 ** 13
+
+    def __init__(self, cache: SourceCache, key: str):
+        self.cache = cache
+        self.key = key
+        self.temp_path = cache.path(f"{key}.{uuid.uuid4().hex[:8]}.tmp.npy")
+        self.frames = 0
+        self._file = None
+        self._layout = None
+        self._header_size = 0
+        self._failed = False
+
+    def _header(self, frames: int) -> bytes:
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {
+            'descr': np.lib.format.dtype_to_descr(np.dtype(np.float16)),
+            'fortran_order': True,
+            'shape': (*self._layout, frames),
+        })
+        return header.getvalue()
+
+    def write(self, block: np.ndarray):
+        """Appends a [sources, channels, frames] block."""
+        if self._failed:
+            return
+        try:
+            if self._file is None:
+                self._layout = tuple(block.shape[:2])
+                self._file = open(self.temp_path, 'wb')
+                header = self._header(self.PLACEHOLDER_FRAMES)
+                self._header_size = len(header)
+                self._file.write(header)
+            self._file.write(np.asarray(block, dtype=np.float16).tobytes(order='F'))
+            self.frames += block.shape[-1]
+        except OSError as e:
+            logger.warning(f"Error caching sources {self.key[:16]}: {e}")
+            self.abort()
+
+    def commit(self, meta: Optional[dict] = None):
+        """Completes the file and registers it in the cache."""
+        if self._failed or self._file is None:
+            self.abort()
+            return
+        filename = f"{self.key}.npy"
+        try:
+            header = self._header(self.frames)
+            if len(header) != self._header_size:
+                raise OSError("unexpected header size")
+            self._file.seek(0)
+            self._file.write(header)
+            self._file.close()
+            self._file = None
+            os.replace(self.temp_path, self.cache.path(filename))
+        except OSError as e:
+            logger.warning(f"Error caching sources {self.key[:16]}: {e}")
+            self.abort()
+            return
+        self.cache.put(self.key, [filename], meta)
+
+    def abort(self):
+        """Drops what was written."""
+        self._failed = True
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            self.temp_path.unlink()
+        except OSError:
+            pass
+
+
+class YouTubeCache(DiskCache):
+    """
+    Cache of YouTube video information and downloaded audio, keyed by video id.
+
+    Repeated requests for a video (other stems, models or presets) skip the
+    metadata request and the download. Information entries expire sooner than
+    audio entries because they contain signed media URLs.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = None,
+        max_mb: float = DEFAULT_YOUTUBE_CACHE_MB,
+        audio_ttl: float = DEFAULT_YOUTUBE_AUDIO_TTL,
+        info_ttl: float = DEFAULT_YOUTUBE_INFO_TTL
+    ):
+        cache_dir = cache_dir or str(Path(DEFAULT_CACHE_DIR) / "youtube")
+        super().__init__(cache_dir, 'index.json', int(max_mb * 1024 * 1024), audio_ttl)
+        self.info_ttl = info_ttl
+
+    @staticmethod
+    def _safe_id(video_id: str) -> str:
+        return "".join(c if c.isalnum() or c in '-_' else '_' for c in video_id)
+
+    def get_info(self, video_id: str) -> Optional[dict]:
+        """Returns the cached extractor information of a video, or None."""
+        entry = self.get(f"info:{video_id}")
+        if entry is None:
+            return None
+        try:
+            with open(self.path(entry['files'][0]), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Error reading cached video information {video_id}: {e}")
+            return None
+
+    def put_info(self, video_id: str, info: dict):
+        """Stores the extractor information of a video."""
+        if not self.enabled or not self.info_ttl:
+            return
+        filename = f"info_{self._safe_id(video_id)}.json"
+        temp_path = self.path(f"{filename}.{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(info, f, default=str)
+            os.replace(temp_path, self.path(filename))
+        except OSError as e:
+            logger.warning(f"Error caching video information {video_id}: {e}")
+            return
+        self.put(f"info:{video_id}", [filename], ttl=self.info_ttl)
+
+    def get_audio(self, video_id: str) -> Optional[str]:
+        """Returns the path of the cached audio of a video, or None."""
+        entry = self.get(f"audio:{video_id}")
+        return str(self.path(entry['files'][0])) if entry is not None else None
+
+    def audio_path(self, video_id: str, ext: str) -> Optional[str]:
+        """Returns a temporary path inside the cache directory to write the audio of a video to, or None."""
+        if not self.enabled:
+            return None
+        return str(self.path(f"audio_{self._safe_id(video_id)}.{uuid.uuid4().hex[:8]}.partial.{ext}"))
+
+    def store_audio(self, video_id: str, file_path: str) -> str:
+        """
+        Moves a downloaded audio file into the cache.
+
+        Returns:
+            Path of the cached file (file_path itself if the cache is disabled or storing failed)
+        """
+        if not self.enabled or not os.path.exists(file_path):
+            return file_path
+        filename = f"audio_{self._safe_id(video_id)}{Path(file_path).suffix}"
+        try:
+            shutil.move(file_path, self.path(filename))
+        except OSError as e:
+            logger.warning(f"Error caching audio of {video_id}: {e}")
+            return file_path
+        self.put(f"audio:{video_id}", [filename])
+        return str(self.path(filename))
+
+    def contains(self, file_path: str) -> bool:
+        """Whether a path belongs to the cache directory (cached files must not be deleted by callers)."""
+        try:
+            return Path(file_path).resolve().parent == self.cache_dir.resolve()
+        except OSError:
+            return False
+
+
+# Global instances, one per output directory
+_result_caches: Dict[str, ResultCache] = {}
+_result_caches_lock = threading.Lock()
+
+
+def get_result_cache(output_dir: str = "static/output") -> ResultCache:
+    """Returns the result cache for an output directory."""
+    key = str(Path(output_dir).resolve())
+    with _result_caches_lock:
+        if key not in _result_caches:
+            _result_caches[key] = ResultCache(output_dir)
+        return _result_caches[key]
+
+
+_source_cache = None
+
+
+def get_source_cache() -> SourceCache:
+    """Returns the process-wide source cache."""
+    global _source_cache
+    with _result_caches_lock:
+        if _source_cache is None:
+            _source_cache = SourceCache()
+        return _source_cache
+
+
+_youtube_cache = None
+
+
+def get_youtube_cache() -> YouTubeCache:
+    """Returns the process-wide YouTube information and audio cache."""
+    global _youtube_cache
+    with _result_caches_lock:
+        if _youtube_cache is None:
+            _youtube_cache = YouTubeCache()
+        return _youtube_cache
+
+
+def _collect_metrics():
+    """Exposes hit/miss counters and disk usage of the caches created so far."""
+    with _result_caches_lock:
+        caches = [('result', cache) for cache in _result_caches.values()]
+        if _source_cache is not None:
+            caches.append(('source', _source_cache))
+        if _youtube_cache is not None:
+            caches.append(('youtube', _youtube_cache))
+    totals: Dict[str, Dict[str, float]] = {}
+    for name, cache in caches:
+        stats = cache.get_stats()
+        total = totals.setdefault(name, {'hits': 0, 'misses': 0, 'evictions': 0, 'size_bytes': 0})
+        for field in total:
+            total[field] += stats[field]
+    return [
+        ("voice_separator_cache_hits_total", "counter", "Cache hits by cache (result, source, youtube)",
+         [({'cache': name}, total['hits']) for name, total in totals.items()]),
+        ("voice_separator_cache_misses_total", "counter", "Cache misses by cache (result, source, youtube)",
+         [({'cache': name}, total['misses']) for name, total in totals.items()]),
+        ("voice_separator_cache_evictions_total", "counter", "Cache entries evicted by cache (result, source, youtube)",
+         [({'cache': name}, total['evictions']) for name, total in totals.items()]),
+        ("voice_separator_cache_size_bytes", "gauge", "Disk usage by cache (result, source, youtube)",
+         [({'cache': name}, total['size_bytes']) for name, total in totals.items()]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
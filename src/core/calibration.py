@@ -0,0 +1,96 @@
+"""
+Measured processing speed used to estimate processing times.
+
+The benchmark suite (benchmarks/benchmark_separation.py --calibrate) writes
+the real-time factors it measures for each model and device to a JSON file.
+When that file exists, estimates are derived from it instead of the built-in
+speed factors.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional
+import logging
+
+from .cache import DEFAULT_CACHE_DIR
+
+logger = logging.getLogger(__name__)
+
+CALIBRATION_PATH = os.environ.get(
+    "VOICE_SEPARATOR_CALIBRATION", str(Path(DEFAULT_CACHE_DIR) / "calibration.json")
+)
+
+_calibration = None
+_calibration_lock = threading.Lock()
+
+
+def load_calibration(path: Optional[str] = None, reload: bool = False) -> dict:
+    """
+    Returns the calibration data, or an empty dict if none was recorded.
+
+    Args:
+        path: Calibration file (default CALIBRATION_PATH)
+        reload: Read the file again instead of using the loaded copy
+    """
+    global _calibration
+    if path is not None:
+        return _read_calibration(path)
+    with _calibration_lock:
+        if _calibration is None or reload:
+            _calibration = _read_calibration(CALIBRATION_PATH)
+        return _calibration
+
+
+def _read_calibration(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Error loading calibration {path}: {e}")
+        return {}
+
+
+def save_calibration(models: dict, meta: Optional[dict] = None, path: Optional[str] = None) -> str:
+    """
+    Writes calibration data atomically.
+
+    Args:
+        models: Dict of model -> device -> measured factors
+            (rtf, encode_rtf_per_stem, load_seconds)
+        meta: Environment the measurements were taken on
+        path: Calibration file (default CALIBRATION_PATH)
+
+    Returns:
+        Path of the written file
+    """
+    path = Path(path or CALIBRATION_PATH)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Per-writer name: processes sharing the cache directory may write it concurrently
+    temp_path = path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'meta': meta or {}, 'models': models}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            temp_path.unlink()
+    load_calibration(reload=True)
+    logger.info(f"📏 Calibration saved: {path}")
+    return str(path)
+
+
+def get_calibrated_factors(model_name: str, device: str) -> Optional[dict]:
+    """
+    Returns the measured factors of a model on a device.
+
+    Returns:
+        Dict with rtf (processing seconds per audio second), encode_rtf_per_stem
+        and load_seconds, or None if the model was not calibrated
+    """
+    return load_calibration().get('models', {}).get(model_name, {}).get(device)
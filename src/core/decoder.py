@@ -0,0 +1,192 @@
+import subprocess
+from typing import Dict, Iterator, Optional
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bytes per float32 sample
+SAMPLE_BYTES = 4
+
+
+class DecodeError(Exception):
+    """ffmpeg could not read or decode an input (for URLs, including HTTP errors)."""
+
+    @property
+    def http_error(self) -> bool:
+        """Whether the server of an input URL refused the request (e.g. an expired signed URL)."""
+        message = str(self)
+        return 'HTTP error' in message or 'Server returned' in message
+
+
+def is_remote_source(source: str) -> bool:
+    """Whether the source is a network URL rather than a local file."""
+    return str(source).startswith(('http://', 'https://'))
+
+
+def decoder_command(
+    source: str,
+    sample_rate: int,
+    channels: int,
+    headers: Optional[Dict[str, str]] = None,
+    copy_to: Optional[str] = None
+) -> list:
+    """
+    Returns the ffmpeg command that decodes any supported input to float32 PCM on stdout.
+    
+    Network sources are read as they download, reconnecting on dropped connections;
+    headers are sent with the HTTP requests. With copy_to, the original audio
+    stream is also saved (without re-encoding) to that file while it is read.
+    """
+    input_options = []
+    if is_remote_source(source):
+        input_options += ['-reconnect', '1', '-reconnect_streamed', '1', '-reconnect_delay_max', '5']
+        if headers:
+            input_options += ['-headers', ''.join(f"{name}: {value}\r\n" for name, value in headers.items())]
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-nostdin',
+        *input_options,
+        '-i', str(source),
+        '-vn', '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', str(channels), '-ar', str(sample_rate),
+        'pipe:1',
+        *(['-map', '0:a:0', '-c:a', 'copy', '-y', str(copy_to)] if copy_to else []),
+    ]
+
+
+def decode_audio(
+    source: str,
+    sample_rate: int,
+    channels: int,
+    headers: Optional[Dict[str, str]] = None
+) -> np.ndarray:
+    """
+    Decodes a whole input to float32 PCM in a single ffmpeg pass.
+
+    Any container ffmpeg reads (webm/opus, m4a, flac, mp3, wav...) is decoded
+    and resampled straight to the model's format, without intermediate files.
+
+    Args:
+        source: Path (or URL) of the input
+        sample_rate: Output sample rate (resampled by ffmpeg)
+        channels: Output channel count (up/down-mixed by ffmpeg)
+        headers: HTTP headers for network sources
+
+    Returns:
+        float32 array with format [channels, frames]
+
+    Raises:
+        DecodeError: If ffmpeg fails to decode the input
+    """
+    process = subprocess.run(decoder_command(source, sample_rate, channels, headers), capture_output=True)
+    if process.returncode != 0:
+        raise DecodeError(f"ffmpeg failed to decode audio: {process.stderr.decode(errors='replace').strip()}")
+    data = process.stdout
+    usable = len(data) - len(data) % (channels * SAMPLE_BYTES)
+    samples = np.frombuffer(data, dtype=np.float32, count=usable // SAMPLE_BYTES)
+    return np.ascontiguousarray(samples.reshape(-1, channels).T)
+
+
+# Bytes needed to recognize every supported container
+SNIFF_BYTES = 12
+
+
+def sniff_audio_format(header: bytes) -> Optional[str]:
+    """
+    Recognizes an audio container from the first bytes of a file.
+    
+    Args:
+        header: At least the first SNIFF_BYTES bytes of the file
+        
+    Returns:
+        File extension of the format ('.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg'),
+        or None if the bytes do not start a supported audio file
+    """
+    if header.startswith(b'ID3'):
+        return '.mp3'
+    if header[:4] == b'RIFF' and header[8:12] == b'WAVE':
+        return '.wav'
+    if header.startswith(b'fLaC'):
+        return '.flac'
+    if header[4:8] == b'ftyp':
+        return '.m4a'
+    if header.startswith(b'OggS'):
+        return '.ogg'
+    if len(header) >= 2 and header[0] == 0xFF:
+        # ADTS (AAC) frames have layer bits 00, MPEG audio frames use layers I-III
+        if header[1] & 0xF6 == 0xF0:
+            return '.aac'
+        if header[1] & 0xE0 == 0xE0 and header[1] & 0x06:
+            return '.mp3'
+    return None
+
+
+def probe_duration(source: str) -> Optional[float]:
+    """
+    Returns the duration of an audio file in seconds using ffprobe.
+
+    Returns:
+        Duration in seconds, or None if it cannot be determined
+    """
+    try:
+        output = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', str(source)],
+            capture_output=True, text=True, timeout=30
+        )
+        return float(output.stdout.strip())
+    except (ValueError, OSError, subprocess.SubprocessError) as e:
+        logger.warning(f"Could not probe duration of {source}: {e}")
+        return None
+
+
+def iter_audio_chunks(
+    source: str,
+    sample_rate: int,
+    channels: int,
+    chunk_frames: int,
+    headers: Optional[Dict[str, str]] = None,
+    copy_to: Optional[str] = None
+) -> Iterator[np.ndarray]:
+    """
+    Decodes audio incrementally through an ffmpeg pipe.
+
+    Args:
+        source: Path (or URL) of any container ffmpeg can read
+        sample_rate: Output sample rate (resampled by ffmpeg)
+        channels: Output channel count (up/down-mixed by ffmpeg)
+        chunk_frames: Frames per yielded chunk (the last one may be shorter)
+        headers: HTTP headers for network sources
+        copy_to: File to save the original audio stream to while decoding
+            (complete only if the iteration finishes without errors)
+
+    Yields:
+        float32 arrays with format [channels, frames]
+
+    Raises:
+        DecodeError: If ffmpeg fails to decode the input
+    """
+    chunk_bytes = chunk_frames * channels * SAMPLE_BYTES
+    process = subprocess.Popen(
+        decoder_command(source, sample_rate, channels, headers, copy_to),
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=chunk_bytes
+    )
+    try:
+        while True:
+            data = process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            # Drop a trailing partial frame, if any
+            usable = len(data) - len(data) % (channels * SAMPLE_BYTES)
+            samples = np.frombuffer(data[:usable], dtype=np.float32)
+            yield np.ascontiguousarray(samples.reshape(-1, channels).T)
+        stderr = process.stderr.read()
+        if process.wait() != 0:
+            raise DecodeError(f"ffmpeg failed to decode audio: {stderr.decode(errors='replace').strip()}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
@@ -0,0 +1,234 @@
+import os
+import subprocess
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional, Union
+import logging
+
+import numpy as np
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Number of stems encoded concurrently (each one runs its own ffmpeg process)
+DEFAULT_ENCODE_WORKERS = int(os.environ.get("VOICE_SEPARATOR_ENCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Encoder arguments per output format
+FORMAT_ARGS = {
+    'mp3': ['-codec:a', 'libmp3lame', '-q:a', '4'],
+}
+
+AudioData = Union[torch.Tensor, np.ndarray]
+
+
+def _to_interleaved_pcm(audio: AudioData) -> np.ndarray:
+    """Converts [channels, length] audio to contiguous interleaved float32 samples."""
+    if isinstance(audio, torch.Tensor):
+        audio = audio.detach().cpu().float().numpy()
+    return np.ascontiguousarray(audio.T, dtype=np.float32)
+
+
+def partial_output_path(output_path: str) -> Path:
+    """Returns a temporary name, unique to the caller, a file is encoded to before being moved into place."""
+    output_path = Path(output_path)
+    return output_path.with_name(f".{output_path.name}.{uuid.uuid4().hex[:8]}.part")
+
+
+def final_output_path(path: str) -> Path:
+    """Returns the file a partial output is moved to once encoded (the path itself for other files)."""
+    path = Path(path)
+    if not (path.name.startswith('.') and path.name.endswith('.part')):
+        return path
+    return path.with_name(path.name[1:].rsplit('.', 2)[0])
+
+
+def encoder_command(
+    sample_rate: int,
+    channels: int,
+    output_path: str,
+    output_format: str = 'mp3',
+    bitrate: str = '192k'
+) -> list:
+    """Returns the ffmpeg command that encodes raw float32 PCM read from stdin."""
+    if output_format not in FORMAT_ARGS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    return [
+        'ffmpeg', '-hide_banner', '-loglevel', 'error', '-y',
+        '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels), '-i', 'pipe:0',
+        '-b:a', bitrate, *FORMAT_ARGS[output_format],
+        '-f', output_format, str(output_path),
+    ]
+
+
+def encode_audio(
+    audio: AudioData,
+    sample_rate: int,
+    output_path: str,
+    output_format: str = 'mp3',
+    bitrate: str = '192k',
+    temp_path: Optional[str] = None
+) -> str:
+    """
+    Encodes audio by piping PCM straight from memory to ffmpeg.
+
+    Args:
+        audio: Tensor or array with format [channels, length]
+        sample_rate: Sample rate of the audio
+        output_path: Destination file
+        output_format: Output container/codec (currently 'mp3')
+        bitrate: Target bitrate
+        temp_path: File written before being moved into place (default: a new partial_output_path)
+
+    Returns:
+        The output path
+
+    Raises:
+        Exception: If ffmpeg fails
+    """
+    pcm = _to_interleaved_pcm(audio)
+    channels = pcm.shape[1] if pcm.ndim == 2 else 1
+    command = encoder_command(sample_rate, channels, output_path, output_format, bitrate)
+
+    # Write to a temporary name so readers never see a partially encoded file
+    temp_path = Path(temp_path) if temp_path else partial_output_path(output_path)
+    command[-1] = str(temp_path)
+
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, stderr = process.communicate(input=memoryview(pcm).cast('B'))
+    if process.returncode != 0:
+        try:
+            temp_path.unlink()
+        except OSError:
+            pass
+        raise Exception(f"ffmpeg failed to encode {Path(output_path).name}: {stderr.decode(errors='replace').strip()}")
+    os.replace(temp_path, output_path)
+    return str(output_path)
+
+
+_encode_executor = None
+_encode_executor_lock = threading.Lock()
+
+
+def get_encode_executor() -> ThreadPoolExecutor:
+    """Returns the shared pool used to run encoders concurrently."""
+    global _encode_executor
+    with _encode_executor_lock:
+        if _encode_executor is None:
+            _encode_executor = ThreadPoolExecutor(max_workers=max(1, DEFAULT_ENCODE_WORKERS), thread_name_prefix="encoder")
+        return _encode_executor
+
+
+def encode_stems(
+    outputs: Dict[str, str],
+    get_audio: Callable[[str], AudioData],
+    sample_rate: int,
+    output_format: str = 'mp3',
+    bitrate: str = '192k',
+    on_progress: Optional[Callable[[float], None]] = None,
+    partials: Optional[Dict[str, str]] = None
+) -> Dict[str, str]:
+    """
+    Encodes several stems concurrently.
+
+    The audio of each stem is produced by get_audio inside the worker, so only
+    as many stems as there are workers are held in memory at once.
+
+    Args:
+        outputs: Dict of stem -> output path
+        get_audio: Callable returning the [channels, length] audio of a stem
+        sample_rate: Sample rate of the audio
+        output_format: Output container/codec
+        bitrate: Target bitrate
+        on_progress: Called with the fraction of stems encoded so far
+        partials: Dict of stem -> temporary file (default: a new partial_output_path per stem)
+
+    Returns:
+        Dict of stem -> output path
+    """
+    done = []
+    done_lock = threading.Lock()
+
+    def encode(stem: str) -> str:
+        temp_path = partials.get(stem) if partials else None
+        path = encode_audio(get_audio(stem), sample_rate, outputs[stem], output_format, bitrate, temp_path)
+        logger.info(f"✅ Stem {stem} encoded: {Path(path).name}")
+        if on_progress is not None:
+            with done_lock:
+                done.append(stem)
+                fraction = len(done) / len(outputs)
+            on_progress(fraction)
+        return path
+
+    if len(outputs) == 1:
+        stem = next(iter(outputs))
+        return {stem: encode(stem)}
+
+    executor = get_encode_executor()
+    futures = {stem: executor.submit(encode, stem) for stem in outputs}
+    return {stem: future.result() for stem, future in futures.items()}
+
+
+class StreamingEncoder:
+    """
+    Incremental encoder: audio blocks are piped to a long-running ffmpeg process.
+
+    Used when separating long inputs window by window, so the full stem never
+    has to be held in memory. The file is written under a temporary name and
+    renamed by close().
+    """
+
+    def __init__(
+        self,
+        output_path: str,
+        sample_rate: int,
+        channels: int,
+        output_format: str = 'mp3',
+        bitrate: str = '192k',
+        temp_path: Optional[str] = None
+    ):
+        self.output_path = Path(output_path)
+        self.temp_path = Path(temp_path) if temp_path else partial_output_path(output_path)
+        command = encoder_command(sample_rate, channels, str(self.temp_path), output_format, bitrate)
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        self.frames_written = 0
+
+    def write(self, audio: AudioData):
+        """Appends a [channels, frames] block."""
+        pcm = _to_interleaved_pcm(audio)
+        try:
+            self._process.stdin.write(memoryview(pcm).cast('B'))
+        except BrokenPipeError:
+            self.abort()
+            raise Exception(f"ffmpeg stopped while encoding {self.output_path.name}")
+        self.frames_written += pcm.shape[0]
+
+    def close(self) -> str:
+        """Finishes encoding and moves the file into place."""
+        self._process.stdin.close()
+        stderr = self._process.stderr.read()
+        self._process.stderr.close()
+        if self._process.wait() != 0:
+            self._remove_temp()
+            raise Exception(f"ffmpeg failed to encode {self.output_path.name}: {stderr.decode(errors='replace').strip()}")
+        os.replace(self.temp_path, self.output_path)
+        return str(self.output_path)
+
+    def abort(self):
+        """Stops the encoder and removes the partial file."""
+        if self._process.poll() is None:
+            self._process.kill()
+        self._process.wait()
+        for stream in (self._process.stdin, self._process.stderr):
+            try:
+                stream.close()
+            except (OSError, ValueError):
+                pass
+        self._remove_temp()
+
+    def _remove_temp(self):
+        try:
+            self.temp_path.unlink()
+        except OSError:
+            pass
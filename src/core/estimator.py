@@ -0,0 +1,276 @@
+"""
+Processing time estimates learned from completed separations.
+
+Every separation reports how long decoding, inference and encoding took for
+the amount of audio it processed. The estimator keeps an exponentially
+weighted moving average (EWMA) of these real-time factors per model, device
+and separation mode, and persists them so estimates survive restarts.
+
+Until a combination has been observed, factors come from the benchmark
+calibration (see calibration.py) or, failing that, from built-in defaults.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Callable, Optional
+import logging
+
+from .cache import DEFAULT_CACHE_DIR
+from .calibration import get_calibrated_factors
+
+logger = logging.getLogger(__name__)
+
+ESTIMATES_PATH = os.environ.get(
+    "VOICE_SEPARATOR_ESTIMATES", str(Path(DEFAULT_CACHE_DIR) / "estimates.json")
+)
+# Weight of the newest observation in the moving averages
+EWMA_ALPHA = float(os.environ.get("VOICE_SEPARATOR_ESTIMATE_ALPHA", "0.3"))
+
+# Built-in real-time factors (processing seconds per audio second) of the
+# default settings on GPU, used until a model is measured on this machine
+DEFAULT_RTF = {
+    'mdx_extra_q': 0.125,
+    'mdx': 0.19,
+    'htdemucs': 0.31,
+    'htdemucs_ft': 0.5,
+}
+UNKNOWN_MODEL_RTF = 0.25
+CPU_RTF_FACTOR = 2.0
+DEFAULT_ENCODE_RTF_PER_STEM = 0.02
+DEFAULT_LOAD_SECONDS = 10.0
+
+# Settings the real-time factors are normalized to (the balanced preset)
+REFERENCE_OVERLAP = 0.25
+REFERENCE_SHIFTS = 1
+
+
+def settings_cost(settings: Optional[dict]) -> float:
+    """
+    Relative inference cost of separation settings.
+
+    Every random shift runs the model again over the whole input, and the
+    overlap makes consecutive segments share audio, so the amount of model
+    work grows with shifts / (1 - overlap).
+
+    Returns:
+        Cost relative to the reference settings (1.0 for the balanced preset)
+    """
+    settings = settings or {}
+    shifts = max(1, int(settings.get('shifts', REFERENCE_SHIFTS)))
+    overlap = min(float(settings.get('overlap', REFERENCE_OVERLAP)), 0.95)
+    reference = max(1, REFERENCE_SHIFTS) / (1 - REFERENCE_OVERLAP)
+    return shifts / (1 - overlap) / reference
+
+
+class ProcessingTimeEstimator:
+    """
+    Estimates separation time from observed real-time factors.
+
+    Factors are stored normalized to the reference settings (see
+    settings_cost) so observations made with one preset also improve the
+    estimates of the others.
+    """
+
+    def __init__(self, path: Optional[str] = None, alpha: float = EWMA_ALPHA):
+        self.path = Path(path or ESTIMATES_PATH)
+        self.alpha = min(max(alpha, 0.01), 1.0)
+        # Worker processes only keep their observations in memory and forward them
+        # (method name, arguments) to the API process, which owns the file
+        self.persist = True
+        self.forwarder: Optional[Callable[[str, dict], None]] = None
+        self._lock = threading.Lock()
+        self._data = self._read()
+
+    def _read(self) -> dict:
+        data = {'separations': {}, 'loads': {}}
+        if not self.path.exists():
+            return data
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            data['separations'].update(stored.get('separations', {}))
+            data['loads'].update(stored.get('loads', {}))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Error loading processing time estimates {self.path}: {e}")
+        return data
+
+    def _save(self):
+        """Writes the estimates atomically. Caller must hold the lock."""
+        if not self.persist:
+            return
+        # Per-writer name: processes sharing the cache directory save concurrently
+        temp_path = self.path.with_suffix(f".{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, indent=2, sort_keys=True)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Error saving processing time estimates: {e}")
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+
+    def _average(self, entry: dict, field: str, value: float):
+        previous = entry.get(field)
+        entry[field] = value if previous is None else previous + self.alpha * (value - previous)
+
+    @staticmethod
+    def _key(model_name: str, device: str, mode: str = 'full') -> str:
+        return f"{model_name}/{device}/{mode}"
+
+    def observe(
+        self,
+        model_name: str,
+        device: str,
+        settings: dict,
+        audio_seconds: float,
+        processing_seconds: Optional[float] = None,
+        encode_seconds: Optional[float] = None,
+        num_stems: int = 0
+    ):
+        """
+        Records the timings of a completed separation.
+
+        Args:
+            model_name: Model used
+            device: Device the model ran on
+            settings: Separation settings (see AudioSeparator.get_separation_settings)
+            audio_seconds: Duration of the separated audio
+            processing_seconds: Decode and inference time (None if the sources came from cache)
+            encode_seconds: Time spent encoding the stems
+            num_stems: Number of stems encoded
+        """
+        if audio_seconds <= 0:
+            return
+        if self.forwarder is not None:
+            self.forwarder('observe', {
+                'model_name': model_name, 'device': device, 'settings': settings, 'audio_seconds': audio_seconds,
+                'processing_seconds': processing_seconds, 'encode_seconds': encode_seconds, 'num_stems': num_stems,
+            })
+        key = self._key(model_name, device, settings.get('mode', 'full'))
+        with self._lock:
+            entry = self._data['separations'].setdefault(key, {'samples': 0})
+            if processing_seconds is not None:
+                rtf = processing_seconds / audio_seconds / settings_cost(settings)
+                self._average(entry, 'rtf', rtf)
+                entry['samples'] += 1
+            if encode_seconds is not None and num_stems > 0:
+                self._average(entry, 'encode_rtf_per_stem', encode_seconds / audio_seconds / num_stems)
+            entry['updated_at'] = time.time()
+            self._save()
+
+    def observe_load(self, model_name: str, device: str, seconds: float):
+        """Records how long loading a model took."""
+        if self.forwarder is not None:
+            self.forwarder('observe_load', {'model_name': model_name, 'device': device, 'seconds': seconds})
+        with self._lock:
+            entry = self._data['loads'].setdefault(f"{model_name}/{device}", {})
+            self._average(entry, 'seconds', seconds)
+            entry['updated_at'] = time.time()
+            self._save()
+
+    def get_factors(self, model_name: str, device: str, mode: str = 'full') -> dict:
+        """
+        Returns the factors used to estimate a separation.
+
+        Observed averages win over the benchmark calibration, which wins over
+        the built-in defaults. Fast mode uses the full mode factors until it
+        has been observed itself.
+
+        Returns:
+            Dict with rtf (normalized to the reference settings),
+            encode_rtf_per_stem, load_seconds and source
+            ('observed', 'calibrated' or 'default')
+        """
+        rtf = DEFAULT_RTF.get(model_name, UNKNOWN_MODEL_RTF) * (1.0 if device == 'cuda' else CPU_RTF_FACTOR)
+        factors = {
+            'rtf': rtf,
+            'encode_rtf_per_stem': DEFAULT_ENCODE_RTF_PER_STEM,
+            'load_seconds': DEFAULT_LOAD_SECONDS,
+            'source': 'default',
+        }
+
+        calibrated = get_calibrated_factors(model_name, device)
+        if calibrated:
+            factors.update({
+                'rtf': calibrated['rtf'] / settings_cost(calibrated.get('settings')),
+                'encode_rtf_per_stem': calibrated.get('encode_rtf_per_stem', factors['encode_rtf_per_stem']),
+                'load_seconds': calibrated.get('load_seconds', factors['load_seconds']),
+                'source': 'calibrated',
+            })
+
+        with self._lock:
+            observed = [
+                self._data['separations'].get(self._key(model_name, device, candidate))
+                for candidate in dict.fromkeys([mode, 'full'])
+            ]
+            load = self._data['loads'].get(f"{model_name}/{device}")
+        for entry in observed:
+            if entry and 'rtf' in entry:
+                factors['rtf'] = entry['rtf']
+                factors['source'] = 'observed'
+                break
+        for entry in observed:
+            if entry and 'encode_rtf_per_stem' in entry:
+                factors['encode_rtf_per_stem'] = entry['encode_rtf_per_stem']
+                break
+        if load and 'seconds' in load:
+            factors['load_seconds'] = load['seconds']
+        return factors
+
+    def estimate(
+        self,
+        model_name: str,
+        device: str,
+        settings: dict,
+        num_stems: int,
+        duration: float,
+        include_load: bool = False
+    ) -> float:
+        """
+        Estimates the seconds needed to separate an input.
+
+        Args:
+            model_name: Model to use
+            device: Device the model runs on
+            settings: Separation settings (see AudioSeparator.get_separation_settings)
+            num_stems: Number of stems to encode
+            duration: Input duration in seconds
+            include_load: Add the model load time (model not resident yet)
+
+        Returns:
+            Estimated processing time in seconds
+        """
+        factors = self.get_factors(model_name, device, settings.get('mode', 'full'))
+        seconds = duration * (
+            factors['rtf'] * settings_cost(settings) + factors['encode_rtf_per_stem'] * num_stems
+        )
+        if include_load:
+            seconds += factors['load_seconds']
+        return seconds
+
+    def get_stats(self) -> dict:
+        """Returns the observed factors per model/device/mode and model load times."""
+        with self._lock:
+            return json.loads(json.dumps(self._data))
+
+
+# Global instance
+_estimator = None
+_estimator_lock = threading.Lock()
+
+
+def get_processing_time_estimator() -> ProcessingTimeEstimator:
+    """Returns the process-wide processing time estimator."""
+    global _estimator
+    if _estimator is None:
+        with _estimator_lock:
+            if _estimator is None:
+                _estimator = ProcessingTimeEstimator()
+    return _estimator
@@ -0,0 +1,442 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+from .metrics import JOBS, QUEUE_WAIT_SECONDS, get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Worker pool and retention settings (overridable through environment variables)
+DEFAULT_JOB_WORKERS = int(os.environ.get("VOICE_SEPARATOR_JOB_WORKERS", "1"))
+DEFAULT_JOB_TTL = int(os.environ.get("VOICE_SEPARATOR_JOB_TTL", "3600"))  # seconds finished jobs are kept
+# A running job without progress updates for this long is reported as stalled
+JOB_STALL_TIMEOUT = float(os.environ.get("VOICE_SEPARATOR_JOB_STALL_TIMEOUT", "120"))
+
+# Job states
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+FINISHED_STATES = {JOB_COMPLETED, JOB_FAILED}
+
+
+class Job:
+    """State of a single background job."""
+
+    def __init__(self, kind: str, params: Optional[dict] = None, estimated_seconds: Optional[float] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.state = JOB_QUEUED
+        self.progress = 0.0
+        self.message = "Waiting in queue"
+        self.result: Optional[dict] = None
+        # Files being written while the job runs (stem -> temporary path, see final_output_path)
+        self.outputs: Dict[str, str] = {}
+        self.error: Optional[str] = None
+        # Expected run time (excluding queue wait), from the processing time estimator
+        self.estimated_seconds = estimated_seconds
+        # Identical requests sharing this job (see JobManager.submit_once)
+        self.dedup_key: Optional[str] = None
+        self.requests = 1
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.updated_at = self.created_at
+
+    @property
+    def finished(self) -> bool:
+        return self.state in FINISHED_STATES
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        """
+        Estimated seconds until completion.
+
+        Blends the upfront estimate with an extrapolation of the progress so
+        far, trusting the extrapolation more as the job advances.
+        """
+        if self.state != JOB_RUNNING or self.started_at is None:
+            return None
+        elapsed = time.time() - self.started_at
+        expected = max(self.estimated_seconds - elapsed, 0.0) if self.estimated_seconds is not None else None
+        if self.progress <= 0:
+            return expected
+        extrapolated = elapsed * (1.0 - self.progress) / self.progress
+        if expected is None:
+            return extrapolated
+        return (1.0 - self.progress) * expected + self.progress * extrapolated
+
+    @property
+    def stalled(self) -> bool:
+        """Whether a running job has stopped reporting progress."""
+        return self.state == JOB_RUNNING and time.time() - self.updated_at > JOB_STALL_TIMEOUT
+
+    def to_dict(self) -> dict:
+        """Returns a JSON-serializable view of the job."""
+        eta = self.eta_seconds
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'state': self.state,
+            'progress': round(self.progress, 4),
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+            'estimated_seconds': round(self.estimated_seconds, 1) if self.estimated_seconds is not None else None,
+            'stalled': self.stalled,
+            'requests': self.requests,
+            'message': self.message,
+            'params': self.params,
+            'outputs': list(self.outputs),
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'updated_at': self.updated_at,
+        }
+
+    def to_state(self) -> dict:
+        """What a job function needs of the job to run in another process (JSON-serializable)."""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'params': self.params,
+            'estimated_seconds': self.estimated_seconds,
+            'started_at': self.started_at or time.time(),
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'Job':
+        """Recreates a running job from Job.to_state() where its function runs."""
+        job = cls(state['kind'], state['params'], state['estimated_seconds'])
+        job.id = state['id']
+        job.state = JOB_RUNNING
+        job.started_at = state['started_at']
+        return job
+
+
+class JobBackend:
+    """
+    Where JobManager runs the job functions.
+
+    This backend calls them on the JobManager worker thread. WorkerPool
+    (local worker processes) and BrokerBackend (separation nodes pulling
+    jobs from a broker) hand them to other processes and wait for them.
+    """
+
+    name = 'threads'
+    # Whether jobs run outside this process (which then never loads a model)
+    remote = False
+
+    def run(self, job: 'Job', func: Callable[..., Any], args: tuple = (), kwargs: Optional[dict] = None) -> Any:
+        """
+        Runs func(job, *args, **kwargs) and returns its result (blocking).
+
+        Raises:
+            Exception: If the function failed
+        """
+        return func(job, *args, **(kwargs or {}))
+
+    def get_stats(self) -> dict:
+        """Returns the state of the backend (reported by /health)."""
+        return {'backend': self.name}
+
+
+class JobEventRelay:
+    """
+    Stands in for the JobManager where a job runs outside the process owning it.
+
+    Job functions report progress through get_job_manager(); installed with
+    set_job_manager(), the relay hands every update to send(job_id, event,
+    payload), which delivers it to the owning process.
+    """
+
+    def __init__(self, send: Callable[[str, str, Any], None]):
+        self._send = send
+
+    def update(
+        self,
+        job: Job,
+        progress: Optional[float] = None,
+        message: Optional[str] = None,
+        estimated_seconds: Optional[float] = None
+    ):
+        self._send(job.id, 'update', {
+            'progress': progress, 'message': message, 'estimated_seconds': estimated_seconds
+        })
+
+    def set_outputs(self, job: Job, outputs: Dict[str, str]):
+        self._send(job.id, 'outputs', dict(outputs))
+
+
+class JobManager:
+    """
+    Runs jobs on a bounded pool of worker threads.
+
+    Job functions receive the Job as first argument and may report progress
+    through JobManager.update(). Their return value becomes the job result.
+    With a remote backend, the worker threads only hand the jobs to worker
+    processes or separation nodes and wait for them (see JobBackend).
+    """
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_JOB_WORKERS,
+        ttl: int = DEFAULT_JOB_TTL,
+        backend: Optional[JobBackend] = None
+    ):
+        self.max_workers = max(1, max_workers)
+        self.ttl = ttl
+        self.backend = backend or JobBackend()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="separation-job")
+        self._jobs: Dict[str, Job] = {}
+        # Unfinished jobs by dedup key
+        self._in_flight: Dict[str, Job] = {}
+        self._coalesced = 0
+        self._lock = threading.Lock()
+
+    def submit(
+        self,
+        kind: str,
+        func: Callable[..., Any],
+        *args,
+        params: Optional[dict] = None,
+        estimated_seconds: Optional[float] = None,
+        **kwargs
+    ) -> Job:
+        """
+        Queues a job for execution.
+
+        Args:
+            kind: Job type (e.g. 'upload', 'youtube')
+            func: Callable invoked as func(job, *args, **kwargs)
+            params: Public request parameters stored with the job
+            estimated_seconds: Expected run time, used for ETAs and queue wait estimates
+
+        Returns:
+            The queued Job
+        """
+        job, _ = self.submit_once(
+            None, kind, func, *args, params=params, estimated_seconds=estimated_seconds, **kwargs
+        )
+        return job
+
+    def submit_once(
+        self,
+        dedup_key: Optional[str],
+        kind: str,
+        func: Callable[..., Any],
+        *args,
+        params: Optional[dict] = None,
+        estimated_seconds: Optional[float] = None,
+        **kwargs
+    ) -> Tuple[Job, bool]:
+        """
+        Queues a job unless an identical one is already queued or running.
+
+        Args:
+            dedup_key: Identifies identical requests (see singleflight.request_key);
+                None always queues a new job
+            kind, func, params, estimated_seconds: See submit()
+
+        Returns:
+            Tuple with (job, coalesced), coalesced being True if the request was
+            attached to an existing job
+        """
+        with self._lock:
+            existing = self._in_flight.get(dedup_key) if dedup_key is not None else None
+            if existing is not None:
+                existing.requests += 1
+                self._coalesced += 1
+            else:
+                job = Job(kind, params, estimated_seconds)
+                job.dedup_key = dedup_key
+                self._prune()
+                self._jobs[job.id] = job
+                if dedup_key is not None:
+                    self._in_flight[dedup_key] = job
+        if existing is not None:
+            logger.info(f"🔗 Request attached to job {existing.id} ({existing.requests} requests)")
+            return existing, True
+        self._executor.submit(self._run, job, func, args, kwargs)
+        logger.info(f"📥 Job {job.id} queued ({kind})")
+        return job, False
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """Returns a job by id, or None if unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find_in_flight(self, dedup_key: str) -> Optional[Job]:
+        """Returns the queued or running job submitted with a dedup key, if any."""
+        with self._lock:
+            return self._in_flight.get(dedup_key)
+
+    def list_jobs(self) -> List[Job]:
+        """Returns all known jobs, newest first."""
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def update(
+        self,
+        job: Job,
+        progress: Optional[float] = None,
+        message: Optional[str] = None,
+        estimated_seconds: Optional[float] = None
+    ):
+        """Reports job progress (0.0 - 1.0), a status message and/or a refined run time estimate."""
+        with self._lock:
+            if progress is not None:
+                job.progress = min(max(progress, job.progress), 1.0)
+            if message is not None:
+                job.message = message
+            if estimated_seconds is not None:
+                job.estimated_seconds = estimated_seconds
+            job.updated_at = time.time()
+
+    def set_outputs(self, job: Job, outputs: Dict[str, str]):
+        """Publishes the files a running job is writing (stem -> path)."""
+        with self._lock:
+            job.outputs = dict(outputs)
+            job.updated_at = time.time()
+
+    def estimate_wait_seconds(self) -> float:
+        """
+        Estimates how long a newly submitted job would wait before starting.
+
+        Adds up the remaining time of running jobs and the estimates of queued
+        jobs, spread over the worker pool.
+        """
+        with self._lock:
+            pending = [job for job in self._jobs.values() if not job.finished]
+        remaining = 0.0
+        for job in pending:
+            eta = job.eta_seconds if job.state == JOB_RUNNING else job.estimated_seconds
+            remaining += eta or 0.0
+        return remaining / self.max_workers
+
+    def get_stats(self) -> dict:
+        """Returns counts of jobs per state."""
+        with self._lock:
+            counts = {state: 0 for state in (JOB_QUEUED, JOB_RUNNING, JOB_COMPLETED, JOB_FAILED)}
+            stalled = 0
+            for job in self._jobs.values():
+                counts[job.state] += 1
+                stalled += job.stalled
+            coalesced = self._coalesced
+        return {
+            'workers': self.max_workers, 'jobs': counts, 'stalled': stalled, 'coalesced': coalesced,
+            'backend': self.backend.get_stats()
+        }
+
+    def _run(self, job: Job, func: Callable[..., Any], args: tuple, kwargs: dict):
+        with self._lock:
+            job.state = JOB_RUNNING
+            job.started_at = job.updated_at = time.time()
+            job.message = "Processing"
+        QUEUE_WAIT_SECONDS.observe(job.started_at - job.created_at, kind=job.kind)
+        logger.info(f"▶️ Job {job.id} started")
+        try:
+            result = self.backend.run(job, func, args, kwargs)
+        except Exception as e:
+            logger.error(f"❌ Job {job.id} failed: {e}")
+            with self._lock:
+                job.state = JOB_FAILED
+                job.error = str(e)
+                job.message = "Failed"
+                job.finished_at = job.updated_at = time.time()
+                self._release_dedup_key(job)
+            JOBS.inc(kind=job.kind, state=JOB_FAILED)
+            return
+        with self._lock:
+            job.state = JOB_COMPLETED
+            job.result = result
+            job.progress = 1.0
+            job.message = "Completed"
+            job.finished_at = job.updated_at = time.time()
+            self._release_dedup_key(job)
+        JOBS.inc(kind=job.kind, state=JOB_COMPLETED)
+        logger.info(f"✅ Job {job.id} completed in {job.finished_at - job.started_at:.1f}s")
+
+    def _release_dedup_key(self, job: Job):
+        """Lets new identical requests start a new job. Caller must hold the lock."""
+        if job.dedup_key is not None and self._in_flight.get(job.dedup_key) is job:
+            del self._in_flight[job.dedup_key]
+
+    def _prune(self):
+        """Drops finished jobs older than the TTL. Caller must hold the lock."""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job.finished_at and now - job.finished_at > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Global instance
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """
+    Returns the process-wide job manager.
+
+    Jobs run on separation nodes when a broker is configured, else on the
+    worker processes when enabled, else on threads of this process.
+    """
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                from .broker import BROKER_JOBS, get_broker_backend
+                from .worker_pool import WORKER_PROCESSES, get_worker_pool
+                broker = get_broker_backend()
+                pool = get_worker_pool() if broker is None else None
+                if broker is not None:
+                    # One thread per job in flight on the nodes waits for it
+                    _job_manager = JobManager(BROKER_JOBS, backend=broker)
+                elif pool is not None:
+                    # One thread per worker process waits for the job it runs
+                    _job_manager = JobManager(max(DEFAULT_JOB_WORKERS, WORKER_PROCESSES), backend=pool)
+                else:
+                    _job_manager = JobManager()
+    return _job_manager
+
+
+def set_job_manager(manager):
+    """
+    Replaces the process-wide job manager.
+
+    Worker processes and separation nodes install a JobEventRelay, which
+    forwards job progress to the process owning the jobs.
+    """
+    global _job_manager
+    with _job_manager_lock:
+        _job_manager = manager
+
+
+def _collect_metrics():
+    """Exposes the number of jobs per state (queued + running = in flight)."""
+    if not isinstance(_job_manager, JobManager):
+        # Not created yet, or a JobEventRelay in a worker process
+        return []
+    stats = _job_manager.get_stats()
+    return [
+        ("voice_separator_jobs", "gauge", "Known jobs by state",
+         [({'state': state}, count) for state, count in stats['jobs'].items()]),
+        ("voice_separator_jobs_stalled", "gauge", "Running jobs without recent progress",
+         [({}, stats['stalled'])]),
+        ("voice_separator_job_workers", "gauge", "Job worker threads",
+         [({}, stats['workers'])]),
+        ("voice_separator_jobs_coalesced_total", "counter", "Job requests attached to an identical queued or running job",
+         [({}, stats['coalesced'])]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
@@ -0,0 +1,327 @@
+"""
+Prometheus-style metrics.
+
+Counters, gauges and histograms are kept in memory and rendered in the
+Prometheus text exposition format (version 0.0.4) by the /metrics endpoint.
+Values that already live elsewhere (cache, model registry and job queue
+statistics) are read by collectors at scrape time instead of being duplicated.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, from cached requests up to multi-hour inputs
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600, 7200)
+
+# Sample produced by collectors: (labels, value)
+Sample = Tuple[Dict[str, str], float]
+
+# Set in worker processes: receives every metric update (name, operation, value, labels)
+# so it can be applied in the API process, which serves /metrics
+_forwarder: Optional[Callable[[str, str, float, Dict[str, str]], None]] = None
+
+
+def set_metrics_forwarder(forwarder: Optional[Callable[[str, str, float, Dict[str, str]], None]]):
+    """Forwards every metric update of this process (see MetricsRegistry.apply)."""
+    global _forwarder
+    _forwarder = forwarder
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class _Metric:
+    """Base class of metrics with a fixed set of label names."""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> tuple:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"Metric {self.name} expects labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def _labels(self, key: tuple) -> Dict[str, str]:
+        return dict(zip(self.label_names, key))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Iterable[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+        if _forwarder is not None:
+            _forwarder(self.name, 'inc', amount, labels)
+
+    def get(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [f"{self.name}{_format_labels(self._labels(key))} {_format_value(value)}" for key, value in values.items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down."""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+        if _forwarder is not None:
+            _forwarder(self.name, 'set', value, labels)
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[tuple, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            data = self._values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+        if _forwarder is not None:
+            _forwarder(self.name, 'observe', value, labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observes the duration of the enclosed block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get_count(self, **labels) -> float:
+        with self._lock:
+            data = self._values.get(self._key(labels))
+            return data[-1] if data else 0.0
+
+    def _render_samples(self) -> List[str]:
+        with self._lock:
+            values = {key: list(data) for key, data in self._values.items()}
+        lines = []
+        for key, data in values.items():
+            labels = self._labels(key)
+            for bound, count in zip(self.buckets, data):
+                bucket_labels = _format_labels({**labels, 'le': _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {_format_value(count)}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(data[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(data[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of the process and renders them for scraping.
+
+    Collectors are callables invoked at render time that return
+    (name, type, documentation, samples) tuples for values owned by other
+    components.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[tuple]]] = []
+        # Latest collector families of other processes (worker processes), by process
+        self._remote_families: Dict[str, List[tuple]] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: Iterable[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[tuple]]):
+        """Adds a callable returning (name, type, documentation, [(labels, value), ...]) tuples."""
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def apply(self, name: str, operation: str, value: float, labels: Dict[str, str]):
+        """Applies a metric update forwarded by another process (see set_metrics_forwarder)."""
+        with self._lock:
+            metric = self._metrics.get(name)
+        if metric is not None and operation in ('inc', 'set', 'observe'):
+            getattr(metric, operation)(value, **labels)
+
+    def collect(self) -> List[tuple]:
+        """Returns the (name, type, documentation, samples) families of the collectors of this process."""
+        with self._lock:
+            collectors = list(self._collectors)
+        families = []
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.warning(f"Metrics collector failed: {e}")
+        return families
+
+    def set_remote_families(self, source: str, families: List[tuple]):
+        """Stores the collector families of another process; render() adds them to the local ones."""
+        with self._lock:
+            self._remote_families[source] = [
+                (name, type_name, documentation, [(dict(labels), value) for labels, value in samples])
+                for name, type_name, documentation, samples in families
+            ]
+
+    def render(self) -> str:
+        """Returns all metrics in the Prometheus text format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+            remote = [family for families in self._remote_families.values() for family in families]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        # Samples with the same name and labels are added up over the processes
+        merged: Dict[str, tuple] = {}
+        for name, type_name, documentation, samples in self.collect() + remote:
+            values = merged.setdefault(name, (type_name, documentation, {}))[2]
+            for labels, value in samples:
+                key = tuple(sorted(labels.items()))
+                values[key] = values.get(key, 0.0) + value
+        for name, (type_name, documentation, values) in merged.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {type_name}")
+            for key, value in values.items():
+                lines.append(f"{name}{_format_labels(dict(key))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# Global instance
+_metrics_registry = MetricsRegistry()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    """Returns the process-wide metrics registry."""
+    return _metrics_registry
+
+
+def stem_set_label(stems: Iterable[str]) -> str:
+    """Label value for a stem selection (order independent)."""
+    return ",".join(sorted(stems))
+
+
+# Pipeline metrics
+SEPARATIONS = _metrics_registry.counter(
+    "voice_separator_separations_total",
+    "Separation requests by model, stem set and outcome (completed, cached, failed)",
+    ("model", "stems", "status"),
+)
+STAGE_SECONDS = _metrics_registry.histogram(
+    "voice_separator_stage_seconds",
+    "Time spent in each separation stage (decode, inference, encode, total)",
+    ("stage", "model", "stems"),
+)
+QUEUE_WAIT_SECONDS = _metrics_registry.histogram(
+    "voice_separator_job_queue_wait_seconds",
+    "Time jobs wait in the queue before a worker picks them up",
+    ("kind",),
+)
+JOBS = _metrics_registry.counter(
+    "voice_separator_jobs_total",
+    "Finished background jobs by kind and state",
+    ("kind", "state"),
+)
+DOWNLOAD_SECONDS = _metrics_registry.histogram(
+    "voice_separator_youtube_download_seconds",
+    "Time spent downloading audio from YouTube",
+    ("status",),
+)
+HTTP_REQUESTS = _metrics_registry.counter(
+    "voice_separator_http_requests_total",
+    "HTTP requests by method, route and status code",
+    ("method", "route", "status"),
+)
+HTTP_REQUEST_SECONDS = _metrics_registry.histogram(
+    "voice_separator_http_request_seconds",
+    "HTTP request latency by method and route",
+    ("method", "route"),
+)
@@ -0,0 +1,276 @@
+"""Micro-batching of model forward passes across concurrent separations of the same process."""
+
+import os
+import threading
+import time
+import weakref
+from contextlib import ExitStack, contextmanager
+from typing import Callable, List, Optional
+import logging
+
+import torch
+
+from .backends import sub_models
+from .metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Largest number of segments in a batched forward pass (1 disables micro-batching)
+MICRO_BATCH_SIZE = int(os.environ.get("VOICE_SEPARATOR_MICRO_BATCH_SIZE", "8"))
+# How long a segment waits for segments of the other running separations
+MICRO_BATCH_WAIT_MS = float(os.environ.get("VOICE_SEPARATOR_MICRO_BATCH_WAIT_MS", "10"))
+# Largest share of a segment that may be zero padding to batch it with longer ones
+# (0 = only segments of the same length; padding slightly changes the output)
+MICRO_BATCH_MAX_PADDING = float(os.environ.get("VOICE_SEPARATOR_MICRO_BATCH_MAX_PADDING", "0"))
+# Worker threads of idle models exit after this many seconds (and restart on demand)
+WORKER_IDLE_SECONDS = 30
+
+
+def _autocast_dtype(device_type: str) -> torch.dtype:
+    """Autocast dtype of a device type (torch.get_autocast_dtype only exists from PyTorch 2.4)."""
+    if hasattr(torch, 'get_autocast_dtype'):
+        return torch.get_autocast_dtype(device_type)
+    if device_type == 'cpu':
+        return torch.get_autocast_cpu_dtype()
+    return torch.get_autocast_gpu_dtype()
+
+
+def _context_key(mix: torch.Tensor) -> tuple:
+    """Everything besides the length that must match for segments to share a forward pass."""
+    device_type = mix.device.type
+    return (
+        mix.shape[1:-1], mix.dtype, mix.device,
+        torch.is_autocast_enabled(device_type), _autocast_dtype(device_type),
+        torch.is_inference_mode_enabled(), torch.is_grad_enabled(),
+    )
+
+
+@contextmanager
+def _forward_context(key: tuple):
+    """Recreates on the worker thread the autocast and grad mode the segments were submitted with."""
+    device = key[2]
+    autocast_enabled, autocast_dtype, inference, grad = key[3:]
+    with ExitStack() as stack:
+        if inference:
+            stack.enter_context(torch.inference_mode())
+        elif not grad:
+            stack.enter_context(torch.no_grad())
+        if autocast_enabled:
+            stack.enter_context(torch.autocast(device.type, dtype=autocast_dtype))
+        yield
+
+
+def _pad_end(mix: torch.Tensor, length: int) -> torch.Tensor:
+    """Zero-pads the last dimension to length (at the end, keeping the alignment of the model strides)."""
+    delta = length - mix.shape[-1]
+    if delta == 0:
+        return mix
+    return torch.nn.functional.pad(mix, (0, delta))
+
+
+class _Segment:
+    """A forward call waiting for its batch."""
+
+    def __init__(self, mix: torch.Tensor):
+        self.mix = mix
+        self.key = _context_key(mix)
+        self.length = mix.shape[-1]
+        self.done = threading.Event()
+        self.output: Optional[torch.Tensor] = None
+        self.error: Optional[BaseException] = None
+
+
+class MicroBatcher:
+    """
+    Runs the forward passes of one model, batching the segments of concurrent separations.
+
+    Used in place of the model's forward: callers block until the batch
+    containing their segment has run.
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[torch.Tensor], torch.Tensor],
+        max_batch: int = MICRO_BATCH_SIZE,
+        max_wait_ms: float = MICRO_BATCH_WAIT_MS,
+        max_padding: float = MICRO_BATCH_MAX_PADDING
+    ):
+        """
+        Args:
+            forward: The model's original forward
+            max_batch: Largest number of segments per forward pass
+            max_wait_ms: How long a segment waits for others
+            max_padding: Largest share of a segment that may be padding
+        """
+        self._forward = forward
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.max_padding = max_padding
+        self._cond = threading.Condition()
+        # Forward passes of the model run one at a time, batched or not
+        self._forward_lock = threading.Lock()
+        self._pending: List[_Segment] = []
+        self._sessions = 0
+        self._worker: Optional[threading.Thread] = None
+        self._stats = {'segments': 0, 'batches': 0, 'batched_segments': 0, 'largest_batch': 0}
+
+    def __call__(self, mix, *args, **kwargs):
+        if args or kwargs or not isinstance(mix, torch.Tensor) or mix.dim() != 3:
+            with self._forward_lock:
+                return self._forward(mix, *args, **kwargs)
+
+        with self._cond:
+            self._stats['segments'] += 1
+            direct = self._sessions <= 1 and not self._pending
+            if not direct:
+                segment = _Segment(mix)
+                self._pending.append(segment)
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                    self._worker.start()
+                self._cond.notify_all()
+
+        if direct:
+            with self._forward_lock:
+                return self._forward(mix)
+
+        segment.done.wait()
+        if segment.error is not None:
+            raise segment.error
+        return segment.output
+
+    @contextmanager
+    def session(self):
+        """Marks a separation as running the model, so its segments are waited for."""
+        with self._cond:
+            self._sessions += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._sessions -= 1
+                self._cond.notify_all()
+
+    def _run(self):
+        """Worker loop: collects segments into batches and runs them."""
+        while True:
+            with self._cond:
+                if not self._pending:
+                    self._cond.wait(WORKER_IDLE_SECONDS)
+                    if not self._pending:
+                        self._worker = None
+                        return
+                # Give the other running separations a moment to submit their segments
+                deadline = time.monotonic() + self.max_wait
+                while len(self._pending) < min(self._sessions, self.max_batch):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take_batch()
+            self._run_batch(batch)
+
+    def _take_batch(self) -> List[_Segment]:
+        """
+        Removes the oldest segment and the compatible ones from the queue. Caller must hold the lock.
+
+        Segments are compatible when they were submitted in the same context and
+        the shortest would not need more than max_padding of padding.
+        """
+        first = self._pending[0]
+        batch = [first]
+        shortest = longest = first.length
+        for segment in self._pending[1:]:
+            if len(batch) >= self.max_batch:
+                break
+            if segment.key != first.key:
+                continue
+            low, high = min(shortest, segment.length), max(longest, segment.length)
+            if low < (1 - self.max_padding) * high:
+                continue
+            batch.append(segment)
+            shortest, longest = low, high
+        self._pending = [segment for segment in self._pending if segment not in batch]
+        return batch
+
+    def _run_batch(self, batch: List[_Segment]):
+        """Runs one forward pass for the batch and hands every segment its slice of the output."""
+        try:
+            if len(batch) == 1:
+                with self._forward_lock, _forward_context(batch[0].key):
+                    batch[0].output = self._forward(batch[0].mix)
+            else:
+                length = max(segment.length for segment in batch)
+                mix = torch.cat([_pad_end(segment.mix, length) for segment in batch])
+                with self._forward_lock, _forward_context(batch[0].key):
+                    output = self._forward(mix)
+                offset = 0
+                for segment in batch:
+                    size = segment.mix.shape[0]
+                    segment.output = output[offset:offset + size, ..., :segment.length]
+                    offset += size
+        except BaseException as e:
+            for segment in batch:
+                segment.error = e
+        finally:
+            for segment in batch:
+                segment.done.set()
+
+        with self._cond:
+            self._stats['batches'] += 1
+            self._stats['largest_batch'] = max(self._stats['largest_batch'], len(batch))
+            if len(batch) > 1:
+                self._stats['batched_segments'] += len(batch)
+
+    def get_stats(self) -> dict:
+        """Returns segments run, forward passes and segments that shared a pass with others."""
+        with self._cond:
+            return {**self._stats, 'pending': len(self._pending), 'sessions': self._sessions}
+
+
+# Batchers of the loaded models (dropped with their model)
+_batchers: "weakref.WeakSet[MicroBatcher]" = weakref.WeakSet()
+
+
+def install_micro_batching(model: torch.nn.Module, max_batch: int = MICRO_BATCH_SIZE):
+    """
+    Routes the forward passes of every model of the bag through a MicroBatcher.
+
+    Models that already have a batcher are left unchanged.
+    """
+    if max_batch <= 1:
+        return
+    for sub_model in sub_models(model):
+        if getattr(sub_model, '_micro_batcher', None) is None:
+            batcher = MicroBatcher(sub_model.forward, max_batch)
+            sub_model._micro_batcher = batcher
+            sub_model.forward = batcher
+            _batchers.add(batcher)
+
+
+@contextmanager
+def micro_batching(model: torch.nn.Module):
+    """Context of a separation running the model (a bag or a subset of one)."""
+    with ExitStack() as stack:
+        for sub_model in sub_models(model):
+            batcher = getattr(sub_model, '_micro_batcher', None)
+            if batcher is not None:
+                stack.enter_context(batcher.session())
+        yield
+
+
+def _collect_metrics():
+    """Exposes how many segments shared a forward pass with segments of other separations."""
+    stats = [batcher.get_stats() for batcher in list(_batchers)]
+    return [
+        ("voice_separator_micro_batch_segments_total", "counter",
+         "Model segments run through micro-batchers", [({}, sum(s['segments'] for s in stats))]),
+        ("voice_separator_micro_batch_batched_segments_total", "counter",
+         "Segments that shared a forward pass with segments of other separations",
+         [({}, sum(s['batched_segments'] for s in stats))]),
+        ("voice_separator_micro_batch_forwards_total", "counter",
+         "Forward passes run by the micro-batcher workers", [({}, sum(s['batches'] for s in stats))]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
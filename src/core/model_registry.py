@@ -0,0 +1,292 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import logging
+
+from demucs import pretrained
+import torch
+
+from .backends import DEFAULT_BACKEND, prepare_model, validate_backend
+from .estimator import get_processing_time_estimator
+from .metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+# Models the application knows how to serve
+SUPPORTED_MODELS = ["mdx_extra_q", "mdx", "htdemucs", "htdemucs_ft"]
+
+# Eviction policy (overridable through environment variables)
+DEFAULT_MAX_MODELS = int(os.environ.get("VOICE_SEPARATOR_MAX_MODELS", "2"))
+DEFAULT_MAX_MEMORY_MB = float(os.environ.get("VOICE_SEPARATOR_MODEL_MEMORY_MB", "0"))  # 0 = no budget
+
+
+def estimate_model_bytes(model: torch.nn.Module) -> int:
+    """Approximates the memory held by a model (parameters + buffers)."""
+    total = 0
+    for tensor in list(model.parameters()) + list(model.buffers()):
+        total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded Demucs models keyed by (model_name, device).
+
+    Models are loaded lazily on first use. Concurrent requests for the same
+    model wait on a per-key lock so the weights are only loaded once. When the
+    number of resident models or their estimated memory exceeds the configured
+    limits, the least recently used models are evicted. Every model is
+    prepared with the registry's inference backend (see backends.py).
+    """
+
+    def __init__(
+        self,
+        max_models: int = DEFAULT_MAX_MODELS,
+        max_memory_mb: float = DEFAULT_MAX_MEMORY_MB,
+        backend: str = DEFAULT_BACKEND
+    ):
+        self.backend = validate_backend(backend)
+        self.max_models = max(1, max_models)
+        self.max_memory_bytes = int(max_memory_mb * 1024 * 1024) if max_memory_mb > 0 else 0
+        self._models: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        # Models resident in worker processes, by process (see set_remote_models)
+        self._remote_models: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'loads': 0,
+            'evictions': 0,
+            'load_errors': 0,
+            'total_load_time': 0.0,
+        }
+
+    def get_model(self, model_name: str, device: str) -> torch.nn.Module:
+        """
+        Returns the model for (model_name, device), loading it if needed.
+
+        Args:
+            model_name: Demucs pretrained model name
+            device: Torch device string ('cpu' or 'cuda')
+
+        Returns:
+            Model in eval mode on the requested device, prepared with the registry backend
+
+        Raises:
+            Exception: If the model cannot be loaded
+        """
+        key = (model_name, device)
+
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None:
+                self._touch(key, entry)
+                self._stats['hits'] += 1
+                return entry['model']
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model; the others wait and then hit the cache
+        with load_lock:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    self._touch(key, entry)
+                    self._stats['hits'] += 1
+                    return entry['model']
+                self._stats['misses'] += 1
+
+            start = time.perf_counter()
+            model, backend = prepare_model(
+                model_name, device, lambda: self._load(model_name, device)[0], self.backend
+            )
+            load_time = time.perf_counter() - start
+
+            with self._lock:
+                self._models[key] = {
+                    'model': model,
+                    'backend': backend,
+                    'bytes': estimate_model_bytes(model),
+                    'load_time': load_time,
+                    'loaded_at': time.time(),
+                    'last_used': time.time(),
+                    'hits': 0,
+                }
+                self._stats['loads'] += 1
+                self._stats['total_load_time'] += load_time
+                self._evict(protect=key)
+
+            get_processing_time_estimator().observe_load(model_name, device, load_time)
+            return model
+
+    def is_loaded(self, model_name: str, device: str) -> bool:
+        """Whether the model is resident here or in a worker process (get_model will not load it)."""
+        with self._lock:
+            if (model_name, device) in self._models:
+                return True
+            return any((model_name, device) in models for models in self._remote_models.values())
+
+    def set_remote_models(self, source: str, models):
+        """Records the (model, device) pairs resident in a worker process running this process's jobs."""
+        with self._lock:
+            self._remote_models[source] = {tuple(model) for model in models}
+
+    def get_backend(self, model_name: str, device: str) -> str:
+        """Backend a resident model runs with ('eager' if it is not loaded)."""
+        with self._lock:
+            entry = self._models.get((model_name, device))
+            return entry['backend'] if entry is not None else 'eager'
+
+    def set_backend(self, backend: str):
+        """
+        Switches the inference backend; resident models are evicted and loaded again on next use.
+
+        Raises:
+            ValueError: If the backend is unknown
+        """
+        backend = validate_backend(backend)
+        if backend != self.backend:
+            self.clear()
+            self.backend = backend
+            logger.info(f"⚡ Inference backend: {backend}")
+
+    def _load(self, model_name: str, device: str) -> Tuple[torch.nn.Module, float]:
+        """Loads a pretrained model and moves it to the device."""
+        start = time.perf_counter()
+        try:
+            logger.info(f"🔄 Loading model '{model_name}' on {device}...")
+            model = pretrained.get_model(model_name)
+            model.to(device)
+            model.eval()
+        except Exception as e:
+            with self._lock:
+                self._stats['load_errors'] += 1
+            logger.error(f"❌ Error loading model: {e}")
+            raise Exception(f"Failed to load model: {e}")
+        load_time = time.perf_counter() - start
+        logger.info(f"✅ Model loaded: {model_name} ({load_time:.1f}s)")
+        return model, load_time
+
+    def _touch(self, key: Tuple[str, str], entry: dict):
+        """Marks an entry as most recently used. Caller must hold the lock."""
+        entry['last_used'] = time.time()
+        entry['hits'] += 1
+        self._models.move_to_end(key)
+
+    def _total_bytes(self) -> int:
+        return sum(entry['bytes'] for entry in self._models.values())
+
+    def _evict(self, protect: Optional[Tuple[str, str]] = None):
+        """Evicts least recently used models over the limits. Caller must hold the lock."""
+        evicted_cuda = False
+        while True:
+            over_count = len(self._models) > self.max_models
+            over_memory = self.max_memory_bytes and self._total_bytes() > self.max_memory_bytes
+            if not (over_count or over_memory):
+                break
+            # Never evict the model that was just loaded
+            candidates = [key for key in self._models if key != protect]
+            if not candidates:
+                break
+            oldest = candidates[0]
+            self._models.pop(oldest)
+            self._stats['evictions'] += 1
+            evicted_cuda = evicted_cuda or oldest[1] == 'cuda'
+            logger.info(f"🗑️ Evicted model '{oldest[0]}' ({oldest[1]}) from registry")
+        if evicted_cuda and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict(self, model_name: str, device: Optional[str] = None) -> int:
+        """
+        Removes a model from the registry.
+
+        Args:
+            model_name: Model to evict
+            device: Only evict this device (all devices if None)
+
+        Returns:
+            Number of entries removed
+        """
+        with self._lock:
+            keys = [key for key in self._models if key[0] == model_name and (device is None or key[1] == device)]
+            for key in keys:
+                self._models.pop(key)
+                self._stats['evictions'] += 1
+        return len(keys)
+
+    def clear(self):
+        """Removes every loaded model."""
+        with self._lock:
+            self._stats['evictions'] += len(self._models)
+            self._models.clear()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def get_stats(self) -> dict:
+        """Returns registry statistics (hits, misses, load times, resident models)."""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'hit_rate': self._stats['hits'] / lookups if lookups else 0.0,
+                'average_load_time': (
+                    self._stats['total_load_time'] / self._stats['loads'] if self._stats['loads'] else 0.0
+                ),
+                'backend': self.backend,
+                'max_models': self.max_models,
+                'max_memory_bytes': self.max_memory_bytes,
+                'resident_bytes': self._total_bytes(),
+                'models': [
+                    {
+                        'model': key[0],
+                        'device': key[1],
+                        'backend': entry['backend'],
+                        'bytes': entry['bytes'],
+                        'load_time': entry['load_time'],
+                        'hits': entry['hits'],
+                        'last_used': entry['last_used'],
+                    }
+                    for key, entry in self._models.items()
+                ],
+            }
+
+
+# Global instance
+_model_registry = None
+_model_registry_lock = threading.Lock()
+
+
+def get_model_registry() -> ModelRegistry:
+    """Returns the process-wide model registry."""
+    global _model_registry
+    if _model_registry is None:
+        with _model_registry_lock:
+            if _model_registry is None:
+                _model_registry = ModelRegistry()
+    return _model_registry
+
+
+def _collect_metrics():
+    """Exposes model registry counters and the memory held by each loaded model."""
+    if _model_registry is None:
+        return []
+    stats = _model_registry.get_stats()
+    return [
+        ("voice_separator_model_lookups_total", "counter", "Model registry lookups by result (hit, miss)",
+         [({'result': 'hit'}, stats['hits']), ({'result': 'miss'}, stats['misses'])]),
+        ("voice_separator_model_loads_total", "counter", "Models loaded from disk or network",
+         [({}, stats['loads'])]),
+        ("voice_separator_model_load_errors_total", "counter", "Failed model loads",
+         [({}, stats['load_errors'])]),
+        ("voice_separator_model_evictions_total", "counter", "Models evicted from memory",
+         [({}, stats['evictions'])]),
+        ("voice_separator_model_load_seconds_total", "counter", "Total time spent loading models",
+         [({}, stats['total_load_time'])]),
+        ("voice_separator_model_memory_bytes", "gauge", "Estimated memory held by each loaded model",
+         [({'model': entry['model'], 'device': entry['device']}, entry['bytes']) for entry in stats['models']]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
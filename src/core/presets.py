@@ -0,0 +1,101 @@
+"""
+Speed/quality presets.
+
+A preset bundles the settings that trade separation quality for latency:
+model, separation mode, segment length, segment overlap, number of random
+shifts and inference precision. Settings a request does not override come
+from the preset.
+"""
+
+import os
+from typing import Dict, Optional
+import logging
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Models that run on CPU, used when a preset asks for a GPU-only model without a GPU
+CPU_MODELS = ["mdx_extra_q", "mdx"]
+
+# Inference precision: 'mixed' runs under float16 autocast on GPU, 'float32' disables it
+PRECISIONS = ['mixed', 'float32']
+
+PRESETS: Dict[str, dict] = {
+    # Cheapest tier (bulk jobs): vocals-only pass when possible, minimal overlap, no shifts
+    'preview': {
+        'model': 'mdx_extra_q',
+        'mode': 'fast',
+        'segment': 10,
+        'overlap': 0.1,
+        'shifts': 0,
+        'precision': 'mixed',
+    },
+    # All four sources with minimal overlap and no shifts
+    'fast': {
+        'model': 'mdx_extra_q',
+        'mode': 'full',
+        'segment': 10,
+        'overlap': 0.1,
+        'shifts': 0,
+        'precision': 'mixed',
+    },
+    # Default settings of the application
+    'balanced': {
+        'model': 'mdx_extra_q',
+        'mode': 'full',
+        'segment': 10,
+        'overlap': 0.25,
+        'shifts': 1,
+        'precision': 'mixed',
+    },
+    # Highest quality: fine-tuned hybrid transformer, large overlap, averaged shifts, full precision
+    'max': {
+        'model': 'htdemucs_ft',
+        'mode': 'full',
+        'segment': 10,
+        'overlap': 0.5,
+        'shifts': 2,
+        'precision': 'float32',
+    },
+}
+
+DEFAULT_PRESET = os.environ.get("VOICE_SEPARATOR_PRESET", "balanced")
+
+
+def get_preset(name: str) -> dict:
+    """
+    Returns the settings of a preset.
+
+    Raises:
+        ValueError: If the preset does not exist
+    """
+    if name not in PRESETS:
+        raise ValueError(f"Invalid preset: {name}. Available: {list(PRESETS.keys())}")
+    return dict(PRESETS[name])
+
+
+def resolve_preset_model(preset: Optional[str], model: Optional[str] = None) -> str:
+    """
+    Picks the model for a request.
+
+    An explicit model wins over the preset. GPU-only models requested by a
+    preset fall back to the best CPU model when no GPU is available.
+
+    Args:
+        preset: Preset name (None for DEFAULT_PRESET)
+        model: Model explicitly requested by the caller
+
+    Returns:
+        Model name
+
+    Raises:
+        ValueError: If the preset does not exist
+    """
+    if model:
+        return model
+    preset_model = get_preset(preset or DEFAULT_PRESET)['model']
+    if preset_model not in CPU_MODELS and not torch.cuda.is_available():
+        logger.info(f"Preset model {preset_model} requires a GPU, using {CPU_MODELS[-1]}")
+        return CPU_MODELS[-1]
+    return preset_model
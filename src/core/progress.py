@@ -0,0 +1,111 @@
+"""
+Progress reporting for the separation pipeline.
+
+Separation is split into three phases (decode, inference, encode), each owning
+a share of the overall progress. Inference progress is reported per model
+segment by handing apply_model a pool whose futures notify the reporter when
+they complete.
+"""
+
+import math
+import threading
+from typing import Callable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Share of the overall progress owned by each phase: (start, end)
+PROGRESS_PHASES = {
+    'decode': (0.0, 0.05),
+    'inference': (0.05, 0.9),
+    'encode': (0.9, 1.0),
+}
+
+PHASE_MESSAGES = {
+    'decode': "Decoding audio",
+    'inference': "Separating stems",
+    'encode': "Encoding stems",
+}
+
+# Callback signature: (overall progress 0.0 - 1.0, phase name)
+ProgressCallback = Callable[[float, str], None]
+
+
+class ProgressReporter:
+    """Maps per-phase progress to overall progress and forwards it to a callback."""
+
+    def __init__(self, callback: Optional[ProgressCallback] = None):
+        self.callback = callback
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def update(self, phase: str, fraction: float):
+        """Reports that a phase is `fraction` (0.0 - 1.0) done."""
+        if self.callback is None:
+            return
+        start, end = PROGRESS_PHASES[phase]
+        overall = start + (end - start) * min(max(fraction, 0.0), 1.0)
+        with self._lock:
+            # Progress never goes backwards
+            if overall < self._last:
+                return
+            self._last = overall
+        try:
+            self.callback(overall, phase)
+        except Exception as e:
+            logger.warning(f"Progress callback failed: {e}")
+
+
+def count_inference_segments(model, length: int, segment: float, overlap: float, shifts: int) -> int:
+    """
+    Estimates how many segments apply_model will process for an input.
+
+    Bags of models run every sub-model, and each random shift pads the input
+    by up to half a second before splitting it again.
+    """
+    samplerate = getattr(model, 'samplerate', 44100)
+    segment_length = int(samplerate * segment)
+    stride = max(1, int((1 - overlap) * segment_length))
+    padded_length = length + (int(0.5 * samplerate) if shifts else 0)
+    per_pass = math.ceil(padded_length / stride)
+    num_models = len(getattr(model, 'models', [model]))
+    return max(1, num_models * max(1, shifts) * per_pass)
+
+
+class _ProgressFuture:
+    """Deferred call that reports progress once its result has been computed."""
+
+    def __init__(self, pool: "InferenceProgressPool", func, args, kwargs):
+        self._pool = pool
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+
+    def result(self):
+        result = self._func(*self._args, **self._kwargs)
+        self._pool._segment_done()
+        return result
+
+
+class InferenceProgressPool:
+    """
+    Pool passed to apply_model(pool=...) to observe segment completion.
+
+    Like demucs' own DummyPoolExecutor, work runs lazily when the result is
+    requested, so inference stays on the calling thread.
+    """
+
+    def __init__(self, on_progress: Callable[[float], None], total_segments: int):
+        self._on_progress = on_progress
+        self._total = max(1, total_segments)
+        self._done = 0
+
+    def submit(self, func, *args, **kwargs) -> _ProgressFuture:
+        return _ProgressFuture(self, func, args, kwargs)
+
+    def shutdown(self, *args, **kwargs):
+        pass
+
+    def _segment_done(self):
+        self._done += 1
+        self._on_progress(min(self._done / self._total, 1.0))
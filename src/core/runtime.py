@@ -0,0 +1,190 @@
+"""
+Execution profile of the inference engine on CPU.
+
+PyTorch sizes its intra-op thread pool to every core of the machine. When
+several separations run at once, each of them uses that many threads, and
+the oversubscribed cores make the separations slower together than one
+after the other. The profile splits the CPUs available to the process
+(affinity mask and cgroup quota) between the separations allowed to run
+concurrently, runs inference under torch.inference_mode() and, on CPUs with
+native bfloat16 instructions, can run presets with 'mixed' precision under
+bfloat16 autocast.
+"""
+
+import math
+import os
+import threading
+from contextlib import ExitStack, contextmanager
+from typing import Optional
+import logging
+
+import torch
+
+from .admission import MAX_CONCURRENT_PER_MODEL
+from .microbatch import MICRO_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# 0 = CPUs available to the process divided by the concurrent forward passes
+TORCH_THREADS = int(os.environ.get("VOICE_SEPARATOR_TORCH_THREADS", "0"))
+# apply_model runs segments on the calling thread, so inter-op parallelism is not used
+INTEROP_THREADS = int(os.environ.get("VOICE_SEPARATOR_INTEROP_THREADS", "1"))
+# Separations expected to run inference at the same time in the process (at least two
+# with micro-batching, which batches concurrent separations of the same process)
+CONCURRENT_SEPARATIONS = int(os.environ.get("VOICE_SEPARATOR_CONCURRENT_SEPARATIONS", str(MAX_CONCURRENT_PER_MODEL)))
+# bfloat16 autocast for 'mixed' precision on CPU: 'auto' (native support only), '1' or '0'
+CPU_BFLOAT16 = os.environ.get("VOICE_SEPARATOR_CPU_BFLOAT16", "auto").lower()
+
+# /proc/cpuinfo flags of CPUs that execute bfloat16 natively (AVX512-BF16, AMX)
+BF16_CPU_FLAGS = {'avx512_bf16', 'amx_bf16'}
+
+
+def available_cpus() -> int:
+    """
+    Returns the number of CPUs the process may use.
+
+    Takes the CPU affinity mask and, in containers, the cgroup CPU quota into account.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        cpus = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max', 'r') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def native_bf16_supported() -> bool:
+    """Whether the CPU executes bfloat16 natively (emulated bfloat16 is slower than float32)."""
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return bool(BF16_CPU_FLAGS & set(line.split(':', 1)[1].split()))
+    except OSError:
+        pass
+    return False
+
+
+class RuntimeProfile:
+    """
+    Thread pools and precision used for inference.
+
+    The thread settings are process-wide, so the profile is applied once,
+    before the first model runs (see get_runtime_profile).
+    """
+
+    def __init__(
+        self,
+        threads: int = TORCH_THREADS,
+        interop_threads: int = INTEROP_THREADS,
+        concurrency: int = CONCURRENT_SEPARATIONS,
+        cpu_bfloat16: str = CPU_BFLOAT16,
+        processes: int = 1
+    ):
+        """
+        Args:
+            threads: Intra-op threads per forward pass (0 = available CPUs / concurrent forward passes)
+            interop_threads: Inter-op threads (0 = PyTorch default)
+            concurrency: Separations expected to run inference at the same time in the process
+            cpu_bfloat16: bfloat16 autocast for 'mixed' precision on CPU ('auto', '1' or '0')
+            processes: Processes sharing the CPUs, each running its own separations
+        """
+        self.cpus = available_cpus()
+        self.concurrency = max(1, concurrency)
+        self.processes = max(1, processes)
+        # With micro-batching the forward passes of a model run one at a time
+        passes = 1 if MICRO_BATCH_SIZE > 1 else self.concurrency
+        self.threads = threads or max(1, self.cpus // (passes * self.processes))
+        self.interop_threads = interop_threads
+        self.native_bf16 = native_bf16_supported()
+        if cpu_bfloat16 == 'auto':
+            self.cpu_bfloat16 = self.native_bf16
+        else:
+            self.cpu_bfloat16 = cpu_bfloat16 in ('1', 'true', 'yes', 'on')
+        self.applied_interop_threads: Optional[int] = None
+
+    def apply(self):
+        """Configures the PyTorch thread pools."""
+        torch.set_num_threads(self.threads)
+        if self.interop_threads:
+            try:
+                torch.set_num_interop_threads(self.interop_threads)
+            except RuntimeError as e:
+                # Only possible before any inter-op work has started
+                logger.warning(f"Could not set inter-op threads: {e}")
+        self.applied_interop_threads = torch.get_num_interop_threads()
+        logger.info(
+            f"⚙️ CPU profile: {self.threads} threads, {self.concurrency} concurrent separations "
+            f"({self.cpus} CPUs, {self.processes} processes), micro-batching: "
+            f"{'on' if MICRO_BATCH_SIZE > 1 else 'off'}, bfloat16 autocast: {'on' if self.cpu_bfloat16 else 'off'}"
+        )
+
+    @contextmanager
+    def inference(self, device: str, precision: str = 'mixed'):
+        """
+        Context for running a model: inference mode plus autocast for 'mixed' precision.
+
+        float16 autocast is used on GPU and, when enabled, bfloat16 autocast on CPU.
+        """
+        with ExitStack() as stack:
+            stack.enter_context(torch.inference_mode())
+            if precision == 'mixed':
+                if device == 'cuda' and torch.cuda.is_available():
+                    stack.enter_context(torch.amp.autocast('cuda'))
+                elif device == 'cpu' and self.cpu_bfloat16:
+                    stack.enter_context(torch.amp.autocast('cpu', dtype=torch.bfloat16))
+            yield
+
+    def to_dict(self) -> dict:
+        """Public description of the profile (reported by /health)."""
+        return {
+            'cpus': self.cpus,
+            'concurrent_separations': self.concurrency,
+            'torch_threads': torch.get_num_threads(),
+            'interop_threads': self.applied_interop_threads or torch.get_num_interop_threads(),
+            'inference_mode': True,
+            'cpu_bfloat16_autocast': self.cpu_bfloat16,
+            'micro_batch_size': MICRO_BATCH_SIZE,
+            'native_bfloat16': self.native_bf16,
+            'cuda_available': torch.cuda.is_available(),
+        }
+
+
+# Global instance
+_runtime_profile = None
+_runtime_profile_lock = threading.Lock()
+
+
+def configure_runtime(**kwargs) -> RuntimeProfile:
+    """
+    Creates and applies the process-wide runtime profile.
+
+    Must be called before the first separation to override the defaults
+    (e.g. the benchmark's --threads); later calls replace the thread settings
+    that can still be changed.
+
+    Args:
+        **kwargs: RuntimeProfile arguments
+    """
+    global _runtime_profile
+    with _runtime_profile_lock:
+        _runtime_profile = RuntimeProfile(**kwargs)
+        _runtime_profile.apply()
+        return _runtime_profile
+
+
+def get_runtime_profile() -> RuntimeProfile:
+    """Returns the process-wide runtime profile, applying the defaults on first use."""
+    global _runtime_profile
+    if _runtime_profile is None:
+        with _runtime_profile_lock:
+            if _runtime_profile is None:
+                _runtime_profile = RuntimeProfile()
+                _runtime_profile.apply()
+    return _runtime_profile
@@ -1,22 +1,54 @@
 import os
+import threading
+import time
 import uuid
+from contextlib import nullcontext
 from pathlib import Path
-from typing import List, Dict, Tuple, Optional
-import tempfile
+from typing import Callable, List, Dict, Tuple, Optional
 import logging
 
-from demucs import pretrained
-from demucs.apply import apply_model
-from demucs.audio import AudioFile
+from demucs.apply import BagOfModels, apply_model
+from demucs.htdemucs import HTDemucs
+import numpy as np
 import torch
-from pydub import AudioSegment
-import torchaudio
+
+from .backends import is_quantized
+from .cache import SourceWriter, get_result_cache, get_source_cache, hash_file
+from .decoder import decode_audio, is_remote_source, iter_audio_chunks, probe_duration
+from .estimator import get_processing_time_estimator
+from .encoder import StreamingEncoder, encode_stems, get_encode_executor, partial_output_path
+from .microbatch import MICRO_BATCH_SIZE, install_micro_batching, micro_batching
+from .metrics import SEPARATIONS, STAGE_SECONDS, stem_set_label
+from .model_registry import get_model_registry
+from .presets import DEFAULT_PRESET, PRECISIONS, get_preset
+from .runtime import get_runtime_profile
+from .progress import InferenceProgressPool, ProgressCallback, ProgressReporter, count_inference_segments
+from .streaming import STREAMING_THRESHOLD_SECONDS, WINDOW_SECONDS, crossfade_frames, iter_separated_windows
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
 # Use only the basic working model
 DEFAULT_MODEL = 'mdx_extra_q'
+# Separation and output settings
+SEGMENT = 10
+OVERLAP = 0.25
+OUTPUT_FORMAT = 'mp3'
+OUTPUT_BITRATE = '192k'
+# Track length assumed by time estimates when the duration is unknown
+TYPICAL_TRACK_SECONDS = 240
+# Separation modes: quality/speed trade-off, selectable per request
+# - full: all four sources, instrumental = drums + bass + other
+# - fast: vocals only (skipping bag members that do not contribute to vocals),
+#   less overlap and no random shift; instrumental = mix - vocals.
+#   Only applies when the request is limited to vocals/instrumental
+# The overlap/shifts below apply to requests that pick a mode without a preset
+SEPARATION_MODES = {
+    'full': {'overlap': OVERLAP, 'shifts': 1},
+    'fast': {'overlap': 0.1, 'shifts': 0},
+}
+# Stems the fast mode can produce, and the source layout it returns
+FAST_MODE_STEMS = ['vocals', 'instrumental']
 # Define available stems and their configurations
 AVAILABLE_STEMS = {
     'drums': {'index': 0, 'name': 'Drums', 'icon': '🥁'},
@@ -27,59 +59,205 @@ AVAILABLE_STEMS = {
 }
 
 
+def resolve_device(model_name: str) -> str:
+    """
+    Selects the torch device for a model.
+
+    Raises:
+        Exception: If the model requires a GPU and none is available
+    """
+    if model_name in ["mdx_extra_q", "mdx"]:
+        return 'cuda' if torch.cuda.is_available() else 'cpu'
+    # htdemucs and htdemucs_ft require GPU
+    if not torch.cuda.is_available():
+        raise Exception(f"Model '{model_name}' requires a GPU, but none was detected.")
+    return 'cuda'
+
+
+def resolve_separation_settings(
+    selected_stems: List[str],
+    mode: Optional[str] = None,
+    preset: Optional[str] = None,
+    max_segment: float = float('inf')
+) -> dict:
+    """
+    Resolves the settings used to separate a request.
+    
+    The preset provides segment, overlap, shifts, precision and mode. An
+    explicit mode overrides the mode of the preset; without a preset, the
+    mode also brings its own overlap and shifts (see SEPARATION_MODES).
+    
+    Args:
+        selected_stems: Stems to extract
+        mode: Separation mode
+        preset: Speed/quality preset (default DEFAULT_PRESET)
+        max_segment: Longest segment (seconds) the model accepts
+        
+    Returns:
+        Dict with preset, mode, segment, overlap, shifts and precision
+        
+    Raises:
+        ValueError: If the preset, mode or precision is invalid
+    """
+    settings = get_preset(preset or DEFAULT_PRESET)
+    settings['preset'] = preset or DEFAULT_PRESET
+    del settings['model']
+    if mode is not None:
+        if mode not in SEPARATION_MODES:
+            raise ValueError(f"Invalid mode: {mode}. Available: {list(SEPARATION_MODES.keys())}")
+        settings['mode'] = mode
+        if preset is None:
+            settings.update(SEPARATION_MODES[mode])
+    if settings['precision'] not in PRECISIONS:
+        raise ValueError(f"Invalid precision: {settings['precision']}. Available: {PRECISIONS}")
+    
+    if settings['mode'] != 'full' and not set(selected_stems) <= set(FAST_MODE_STEMS):
+        logger.info(f"Stems {selected_stems} require full separation, ignoring mode '{settings['mode']}'")
+        settings['mode'] = 'full'
+    
+    # Transformer models cannot process segments longer than they were trained on
+    if settings['segment'] > max_segment:
+        settings['segment'] = max_segment
+    return settings
+
+
+def estimate_separation_seconds(
+    model_name: str,
+    selected_stems: List[str],
+    duration: Optional[float] = None,
+    mode: Optional[str] = None,
+    preset: Optional[str] = None
+) -> float:
+    """
+    Estimates how long separating an input will take, without loading the model.
+    
+    Includes the model load time when the model is not resident yet. GPU
+    models are estimated on a GPU even on a host without one (the API of
+    separation nodes that have one).
+    
+    Args:
+        model_name: Demucs model name
+        selected_stems: Stems to extract
+        duration: Input duration in seconds (default TYPICAL_TRACK_SECONDS)
+        mode: Separation mode
+        preset: Speed/quality preset
+        
+    Returns:
+        Estimated processing time in seconds
+    """
+    if model_name in ["mdx_extra_q", "mdx"] or torch.cuda.is_available():
+        device = resolve_device(model_name)
+    else:
+        device = 'cuda'
+    settings = resolve_separation_settings(selected_stems, mode, preset)
+    return get_processing_time_estimator().estimate(
+        model_name,
+        device,
+        settings,
+        len(selected_stems),
+        duration or TYPICAL_TRACK_SECONDS,
+        include_load=not get_model_registry().is_loaded(model_name, device)
+    )
+
+
 class AudioSeparator:
-    def __init__(self, output_dir: str = "static/output", model_name: str = DEFAULT_MODEL):
+    def __init__(self, output_dir: str = "static/output", model_name: str = DEFAULT_MODEL, device: Optional[str] = None):
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
         self.model_name = model_name
+        self.result_cache = get_result_cache(str(self.output_dir))
+        self.source_cache = get_source_cache()
+        # Tracks separated concurrently with this instance (see batch.py) take turns
+        # in the model, while their decoding and encoding overlap; with micro-batching
+        # they run together and their segments share forward passes
+        self._inference_lock = threading.Lock() if MICRO_BATCH_SIZE <= 1 else nullcontext()
         # Configure GPU optimizations
         if torch.cuda.is_available():
             torch.backends.cudnn.benchmark = True
             torch.backends.cudnn.deterministic = False
-        # Device selection
-        if model_name in ["mdx_extra_q", "mdx"]:
-            self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        else:
-            # htdemucs and htdemucs_ft require GPU
-            if not torch.cuda.is_available():
-                raise Exception(f"Model '{model_name}' requires a GPU, but none was detected.")
-            self.device = 'cuda'
-        # Load the model
-        try:
-            logger.info(f"🔄 Loading model '{self.model_name}'...")
-            self.model = pretrained.get_model(self.model_name)
-            self.model.to(self.device)
-            self.model.eval()
-            logger.info(f"✅ Model loaded: {self.model_name}")
-            logger.info(f"Device: {self.device}")
-            if torch.cuda.is_available():
-                logger.info(f"GPU detected: {torch.cuda.get_device_name()}")
-        except Exception as e:
-            logger.error(f"❌ Error loading model: {e}")
-            raise Exception(f"Failed to load model: {e}")
+        # Thread pools sized for the concurrent separations, inference mode and CPU autocast
+        self.runtime = get_runtime_profile()
+        # Device selection (an explicit device, e.g. 'cpu' for benchmarks, skips the GPU requirement)
+        self.device = device or resolve_device(model_name)
+        # Get the model from the process-wide registry (loaded once, then reused)
+        self.model = get_model_registry().get_model(self.model_name, self.device)
+        # Inference backend the model was prepared with (eager, int8, compile)
+        self.backend = get_model_registry().get_backend(self.model_name, self.device)
+        # Segments of concurrent separations of this model are batched together
+        install_micro_batching(self.model)
+        logger.info(f"Model ready: {self.model_name} (device: {self.device})")
+
+    @property
+    def cache_model_id(self) -> str:
+        """Model identity in cache keys: outputs of other backends are not the eager outputs."""
+        return self.model_name if self.backend == 'eager' else f"{self.model_name}:{self.backend}"
+
+    @property
+    def samplerate(self) -> int:
+        """Sample rate the model works at."""
+        return getattr(self.model, 'samplerate', 44100)
 
     def separate_stems(
         self, 
         input_file_path: str, 
-        selected_stems: List[str] = None
+        selected_stems: List[str] = None,
+        use_cache: bool = True,
+        streaming: Optional[bool] = None,
+        window_seconds: Optional[float] = None,
+        on_outputs: Optional[Callable[[Dict[str, str]], None]] = None,
+        progress_callback: Optional[ProgressCallback] = None,
+        mode: Optional[str] = None,
+        preset: Optional[str] = None,
+        content_id: Optional[str] = None,
+        input_headers: Optional[Dict[str, str]] = None,
+        duration: Optional[float] = None,
+        input_copy_path: Optional[str] = None
     ) -> Dict[str, str]:
         """
         Separates audio into selected stems using the Demucs model.
         
+        Results are cached by input content and separation settings: stems that
+        were already produced for the same file are returned without running the model.
+        
         Args:
             input_file_path: Path to the input audio file
             selected_stems: List of stems to extract. If None, extracts only 'vocals'
+            use_cache: Whether to look up and store results in the result cache
+            streaming: Separate window by window with bounded memory. If None,
+                streaming is used for inputs longer than STREAMING_THRESHOLD_SECONDS
+            window_seconds: Window length for streaming separation (default WINDOW_SECONDS).
+                Shorter windows make the first audio available sooner
+            on_outputs: Called before encoding starts with the files being written
+                (stem -> partial path, or the final path of cached stems), so callers
+                can serve them while they are encoded (see final_output_path)
+            progress_callback: Called with (overall progress 0.0 - 1.0, phase name) as
+                decoding, inference (per model segment) and encoding advance
+            mode: Separation mode (see SEPARATION_MODES), overrides the mode of the preset.
+                'fast' falls back to 'full' when stems other than vocals/instrumental are requested
+            preset: Speed/quality preset (see PRESETS, default DEFAULT_PRESET)
+            content_id: Identifies the input content in the caches instead of hashing
+                the file (required for URLs, e.g. "youtube:<video id>")
+            input_headers: HTTP headers used to read an input URL
+            duration: Input duration in seconds, if already known
+            input_copy_path: Saves the original audio of a streamed input to this
+                file while it is decoded (not written when the result comes from cache)
             
         Returns:
-            Dict with relative paths to the generated files
+            Dict with the paths of the generated files (in output_dir)
             
         Raises:
             ValueError: If the input file is invalid or stems are invalid
             Exception: For other errors during processing
         """
+        start_time = time.perf_counter()
+        timings: Dict[str, float] = {}
+        labels = {'model': self.model_name, 'stems': stem_set_label(selected_stems or ['vocals'])}
         try:
-            # Validate input
-            if not os.path.exists(input_file_path):
+            # Validate input; URLs are decoded while they download, window by window
+            remote = is_remote_source(input_file_path)
+            if remote:
+                streaming = True
+            elif not os.path.exists(input_file_path):
                 raise ValueError(f"File not found: {input_file_path}")
             
             # If not specified, use only vocals by default
@@ -91,237 +269,629 @@ class AudioSeparator:
             if invalid_stems:
                 raise ValueError(f"Invalid stems: {invalid_stems}. Available: {list(AVAILABLE_STEMS.keys())}")
             
+            settings = self.get_separation_settings(selected_stems, mode, preset)
+            logger.info(f"Processing stems: {selected_stems} (settings: {settings})")
+            reporter = ProgressReporter(progress_callback)
+            
+            # Hash the input once; it keys both the result and the source caches
+            use_result_cache = use_cache and self.result_cache.enabled
+            use_source_cache = use_cache and self.source_cache.enabled
+            content_hash = None
+            if use_result_cache or use_source_cache:
+                content_hash = content_id or (None if remote else hash_file(input_file_path))
+                use_result_cache = use_result_cache and content_hash is not None
+                use_source_cache = use_source_cache and content_hash is not None
+            
+            # Look up previously separated stems for the same content and settings
+            result_paths = {}
+            cache_key = None
+            if use_result_cache:
+                cache_key = self.result_cache.make_key(content_hash, self.cache_model_id, self._get_output_settings(settings))
+                for stem, filename in self.result_cache.get_stems(cache_key, selected_stems).items():
+                    result_paths[stem] = str(self.output_dir / filename)
+                if len(result_paths) == len(selected_stems):
+                    logger.info(f"⚡ Result cache hit for all stems: {selected_stems}")
+                    reporter.update('encode', 1.0)
+                    SEPARATIONS.inc(status='cached', **labels)
+                    STAGE_SECONDS.observe(time.perf_counter() - start_time, stage='total', **labels)
+                    return {stem: result_paths[stem] for stem in selected_stems}
+            
+            stems_to_process = [stem for stem in selected_stems if stem not in result_paths]
+            
             # Generate unique ID for output files
             unique_id = str(uuid.uuid4())[:8]
             
-            logger.info(f"Processing stems: {selected_stems}")
+            outputs = {}
+            for stem in stems_to_process:
+                if cache_key is not None:
+                    filename = self.result_cache.filename(cache_key, stem, OUTPUT_FORMAT)
+                else:
+                    filename = f"{stem}_{unique_id}.{OUTPUT_FORMAT}"
+                outputs[stem] = str(self.output_dir / filename)
             
-            # Create temporary directory for processing
-            with tempfile.TemporaryDirectory() as temp_dir:
-                temp_path = Path(temp_dir)
-                
-                logger.info("Loading audio file...")
-                # Load the audio
-                audio_file = AudioFile(input_file_path)
-                wav_data = audio_file.read()
-                
-                # Apply model for separation
-                logger.info("Starting audio separation...")
-                
-                # Ensure wav_data is on the correct device
-                if wav_data.device != torch.device(self.device):
-                    wav_data = wav_data.to(self.device)
-                
-                logger.info(f"Input tensor: {wav_data.shape}, device: {wav_data.device}, dtype: {wav_data.dtype}")
-                
-                # Always use simple separation
-                logger.info("🔄 Processing with basic model...")
-                
-                with torch.amp.autocast('cuda', enabled=torch.cuda.is_available()):
-                    sources = apply_model(
-                        self.model, 
-                        wav_data, 
-                        device=self.device, 
-                        progress=True,
-                        segment=10,
-                        overlap=0.25
-                    )
-                
-                # Normalize tensor format simply
-                logger.info(f"Original format: {sources.shape}")
-                
-                # If tensor has 4 dimensions [batch, sources, channels, length], remove batch
-                if len(sources.shape) == 4 and sources.shape[0] == 1:
-                    sources = sources[0]
-                    logger.info(f"Batch removed: {sources.shape}")
-                
-                # Check if we have format [sources, channels, length]
-                if len(sources.shape) != 3:
-                    raise ValueError(f"Unexpected format: {sources.shape}. Expected: [sources, channels, length]")
-                
-                num_sources, num_channels, audio_length = sources.shape
-                logger.info(f"✅ Tensor processed: {num_sources} sources, {num_channels} channels, {audio_length} samples")
-                
-                # Check if we have the expected number of stems
-                if num_sources < 4:
-                    raise ValueError(f"Model returned {num_sources} sources. Expected: 4 (drums, bass, other, vocals)")
-                
-                # Process each selected stem
-                result_paths = {}
+            # Each separation encodes to its own temporary files: another one with the
+            # same content and settings may be writing the same outputs right now
+            partials = {stem: str(partial_output_path(path)) for stem, path in outputs.items()}
+            if on_outputs is not None:
+                on_outputs({**result_paths, **partials})
+            
+            # Reuse raw sources from an earlier request with a different stem selection
+            sources = None
+            source_key = None
+            if use_source_cache:
+                source_key = self.source_cache.make_key(content_hash, self.cache_model_id, self._get_inference_settings(settings))
+                sources = self.source_cache.load(source_key)
+                if sources is not None:
+                    logger.info(f"⚡ Source cache hit, skipping inference (shape: {sources.shape})")
+            
+            # Long inputs are separated window by window to keep memory flat
+            if duration is None and sources is None and not remote \
+                    and (streaming is None or (streaming and progress_callback is not None)):
+                duration = probe_duration(input_file_path)
+            if sources is None and streaming is None:
+                streaming = duration is not None and duration > STREAMING_THRESHOLD_SECONDS
+            
+            if sources is None and streaming:
+                # The windows are also written to the source cache as they are separated
+                source_writer = self.source_cache.open_writer(source_key) if source_key is not None else None
+                audio_seconds = self._separate_streaming(
+                    input_file_path, outputs, window_seconds or WINDOW_SECONDS, reporter, duration, settings, timings,
+                    input_headers, input_copy_path, source_writer, partials
+                )
+            else:
+                if sources is None:
+                    sources = self._separate_sources(input_file_path, reporter, settings, timings)
+                    if source_key is not None:
+                        self.source_cache.store(source_key, sources.cpu().numpy(), {'model': self.model_name})
                 
-                for stem in selected_stems:
-                    logger.info(f"🎵 Processing stem: {stem}")
-                    
-                    if stem == 'instrumental':
-                        # Instrumental is the combination of drums + bass + other
-                        audio_data = sources[0] + sources[1] + sources[2]
-                        filename = f"instrumental_{unique_id}.mp3"
-                    else:
-                        # Individual stem
-                        stem_index = AVAILABLE_STEMS[stem]['index']
-                        audio_data = sources[stem_index]
-                        filename = f"{stem}_{unique_id}.mp3"
-                    
-                    # Move to CPU and ensure correct format
-                    audio_data = audio_data.cpu()
-                    if audio_data.dtype == torch.float16:
-                        audio_data = audio_data.float()
-                    
-                    # Save temporary WAV file
-                    wav_path = temp_path / f"{stem}_{unique_id}.wav"
-                    sample_rate = getattr(self.model, 'samplerate', 44100)
-                    torchaudio.save(str(wav_path), audio_data, sample_rate=sample_rate)
-                    
-                    # Convert to MP3
-                    mp3_path = self.output_dir / filename
-                    audio_segment = AudioSegment.from_wav(str(wav_path))
-                    audio_segment.export(
-                        str(mp3_path), 
-                        format="mp3", 
-                        bitrate="192k",
-                        parameters=["-q:a", "4"]
+                logger.info(f"🎵 Encoding stems: {stems_to_process}")
+                encode_start = time.perf_counter()
+                if isinstance(sources, np.ndarray) and sources.shape[-1] > STREAMING_THRESHOLD_SECONDS * self.samplerate:
+                    # Long cached sources are encoded window by window, as they were separated
+                    self._encode_windows(sources, outputs, window_seconds or WINDOW_SECONDS, reporter, partials)
+                else:
+                    # Encode stems concurrently, piping PCM straight from memory to the encoder
+                    encode_stems(
+                        outputs,
+                        lambda stem: self._get_stem_audio(sources, stem),
+                        self.samplerate,
+                        OUTPUT_FORMAT,
+                        OUTPUT_BITRATE,
+                        on_progress=lambda fraction: reporter.update('encode', fraction),
+                        partials=partials
                     )
-                    
-                    # Add to result
-                    result_paths[stem] = f"static/output/{filename}"
-                    logger.info(f"✅ Stem {stem} processed: {filename}")
-                
-                logger.info("✅ Separation completed successfully!")
-                
-                # Clear GPU cache
-                if torch.cuda.is_available():
-                    torch.cuda.empty_cache()
+                timings['encode'] = time.perf_counter() - encode_start
+                audio_seconds = sources.shape[-1] / self.samplerate
+            
+            # Every file was moved into place (the encoders raise otherwise), so it can be cached
+            for stem, output_path in outputs.items():
+                if cache_key is not None:
+                    self.result_cache.put_stem(cache_key, stem, Path(output_path).name, {'model': self.model_name})
                 
-                return result_paths
+                # Add to result
+                result_paths[stem] = output_path
+            
+            logger.info("✅ Separation completed successfully!")
+            
+            # Clear GPU cache
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            
+            timings['total'] = time.perf_counter() - start_time
+            for stage, seconds in timings.items():
+                STAGE_SECONDS.observe(seconds, stage=stage, **labels)
+            SEPARATIONS.inc(status='completed', **labels)
+            get_processing_time_estimator().observe(
+                self.model_name,
+                self.device,
+                settings,
+                audio_seconds,
+                processing_seconds=(
+                    timings['decode'] + timings['inference'] if 'inference' in timings else None
+                ),
+                encode_seconds=timings.get('encode'),
+                num_stems=len(outputs)
+            )
+            
+            return {stem: result_paths[stem] for stem in selected_stems}
                 
         except Exception as e:
+            SEPARATIONS.inc(status='failed', **labels)
             logger.error(f"Error during separation: {str(e)}")
-            raise Exception(f"Error during audio separation: {str(e)}")
+            raise Exception(f"Error during audio separation: {str(e)}") from e
 
-    def _normalize_tensor_format(self, sources):
+    def _separate_sources(
+        self,
+        input_file_path: str,
+        reporter: Optional[ProgressReporter] = None,
+        settings: Optional[dict] = None,
+        timings: Optional[Dict[str, float]] = None
+    ) -> torch.Tensor:
         """
-        Normalizes tensor format - ULTRA SIMPLE version.
+        Loads an audio file and runs the model on it.
+        
+        Args:
+            input_file_path: Path to the input audio file
+            reporter: Receives decode and per-segment inference progress
+            settings: Separation settings (see get_separation_settings)
+            timings: Receives the seconds spent decoding and in inference
+            
+        Returns:
+            Tensor with format [sources, channels, length]
+            ([vocals, instrumental] in fast mode)
         """
-        logger.info(f"Tensor shape: {sources.shape}")
+        reporter = reporter or ProgressReporter()
+        timings = timings if timings is not None else {}
+        reporter.update('decode', 0.0)
+        start = time.perf_counter()
+        wav_data = self._load_audio(input_file_path)
+        timings['decode'] = time.perf_counter() - start
+        reporter.update('decode', 1.0)
         
-        # Only remove batch dimension if necessary
-        if len(sources.shape) == 4:
-            sources = sources.squeeze(0)
+        # Apply model for separation
+        logger.info("Starting audio separation...")
+        logger.info(f"Input tensor: {wav_data.shape}, device: {wav_data.device}, dtype: {wav_data.dtype}")
         
-        if len(sources.shape) != 3:
-            raise ValueError(f"Invalid tensor format: {sources.shape}")
+        start = time.perf_counter()
+        sources = self._separate(
+            wav_data,
+            settings,
+            progress=True,
+            on_progress=lambda fraction: reporter.update('inference', fraction)
+        )
+        timings['inference'] = time.perf_counter() - start
         
-        return sources
-        if len(sources.shape) != 3:
-            raise ValueError(f"Unexpected format: {sources.shape}. Expected 3D after batch removal.")
+        num_sources, num_channels, audio_length = sources.shape
+        logger.info(f"✅ Tensor processed: {num_sources} sources, {num_channels} channels, {audio_length} samples")
         
         return sources
 
-    def _needs_full_separation(self, selected_stems: List[str]) -> bool:
+    def _load_audio(self, input_file_path: str) -> torch.Tensor:
+        """Decodes an audio file into a [channels, length] tensor at the model's sample rate."""
+        logger.info("Loading audio file...")
+        channels = getattr(self.model, 'audio_channels', 2)
+        return torch.from_numpy(decode_audio(input_file_path, self.samplerate, channels))
+
+    def _separate_streaming(
+        self,
+        input_file_path: str,
+        outputs: Dict[str, str],
+        window_seconds: float = WINDOW_SECONDS,
+        reporter: Optional[ProgressReporter] = None,
+        duration: Optional[float] = None,
+        settings: Optional[dict] = None,
+        timings: Optional[Dict[str, float]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        copy_to: Optional[str] = None,
+        sources_to: Optional[SourceWriter] = None,
+        partials: Optional[Dict[str, str]] = None
+    ) -> float:
         """
-        Checks if full separation is needed or if it can be optimized.
+        Separates a long input window by window, encoding each stem incrementally.
+        
+        Memory is bounded by the window size instead of the track length. Consecutive windows overlap by overlap * segment seconds and are
+        blended with a linear crossfade.
         
+        Args:
+            input_file_path: Path to the input audio file
+            outputs: Dict of stem -> output path
+            window_seconds: Length of each window
+            reporter: Receives inference progress as frames are finalized
+            duration: Input duration in seconds, used to compute progress
+            settings: Separation settings (see get_separation_settings)
+            timings: Receives the seconds spent decoding, in inference and encoding
+            headers: HTTP headers used to read an input URL
+            copy_to: File to save the original audio stream to while decoding
+            sources_to: Source cache writer receiving the separated windows (committed at the end)
+            partials: Dict of stem -> temporary file (default: a new partial_output_path per stem)
+            
         Returns:
-            True if all 4 stems need to be separated
-            False if it can be optimized for specific stems
+            Duration of the separated audio in seconds
         """
-        # TEMPORARILY FORCE FULL SEPARATION FOR ALL MODELS
-        # This ensures maximum stability and avoids tensor errors
-        logger.info(f"🔒 Forcing full separation to ensure stability (model: {self.model_name})")
-        return True
+        reporter = reporter or ProgressReporter()
+        settings = settings or self.get_separation_settings(list(outputs))
+        timings = timings if timings is not None else {}
+        for stage in ('decode', 'inference', 'encode'):
+            timings.setdefault(stage, 0.0)
+        sample_rate = self.samplerate
+        channels = getattr(self.model, 'audio_channels', 2)
+        overlap_frames = crossfade_frames(settings['segment'], settings['overlap'], sample_rate)
+        window_frames = max(int(window_seconds * sample_rate), 2 * overlap_frames)
+        
+        logger.info(f"🌊 Streaming separation: {window_seconds:.0f}s windows, stems: {list(outputs)}")
+        
+        def run_window(window: np.ndarray) -> np.ndarray:
+            start = time.perf_counter()
+            sources = self._separate(torch.from_numpy(window), settings).float().cpu().numpy()
+            timings['inference'] += time.perf_counter() - start
+            return sources
+        
+        def timed_chunks(chunks):
+            # Decoding happens lazily, each time the next chunk is requested
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                timings['decode'] += time.perf_counter() - start
+                if chunk is None:
+                    return
+                yield chunk
+        
+        encoders = {
+            stem: StreamingEncoder(
+                path, sample_rate, channels, OUTPUT_FORMAT, OUTPUT_BITRATE, (partials or {}).get(stem)
+            )
+            for stem, path in outputs.items()
+        }
+        executor = get_encode_executor()
+        total_frames = int(duration * sample_rate) if duration else 0
+        frames_done = 0
+        # Decoding is interleaved with inference, so its phase completes up front
+        reporter.update('decode', 1.0)
+        try:
+            chunks = timed_chunks(iter_audio_chunks(input_file_path, sample_rate, channels, window_frames, headers, copy_to))
+            for block in iter_separated_windows(run_window, chunks, window_frames, overlap_frames):
+                # Feed every encoder concurrently
+                start = time.perf_counter()
+                futures = [
+                    executor.submit(encoder.write, self._get_stem_audio(block, stem))
+                    for stem, encoder in encoders.items()
+                ]
+                if sources_to is not None:
+                    sources_to.write(block)
+                for future in futures:
+                    future.result()
+                timings['encode'] += time.perf_counter() - start
+                frames_done += block.shape[-1]
+                if total_frames:
+                    reporter.update('inference', frames_done / total_frames)
+            reporter.update('inference', 1.0)
+            start = time.perf_counter()
+            for encoder in encoders.values():
+                encoder.close()
+            timings['encode'] += time.perf_counter() - start
+            reporter.update('encode', 1.0)
+        except Exception:
+            for encoder in encoders.values():
+                encoder.abort()
+            if sources_to is not None:
+                sources_to.abort()
+            raise
+        if sources_to is not None:
+            sources_to.commit({'model': self.model_name})
         
-        # The code below can be enabled in the future when optimization is 100% stable
+        logger.info(f"✅ Streaming separation finished: {list(outputs)}")
+        return frames_done / sample_rate
+
+    def _encode_windows(
+        self,
+        sources: np.ndarray,
+        outputs: Dict[str, str],
+        window_seconds: float,
+        reporter: ProgressReporter,
+        partials: Optional[Dict[str, str]] = None
+    ):
+        """Encodes long memory-mapped sources window by window, so a stem is never fully in memory."""
+        encoders = {
+            stem: StreamingEncoder(
+                path, self.samplerate, sources.shape[1], OUTPUT_FORMAT, OUTPUT_BITRATE, (partials or {}).get(stem)
+            )
+            for stem, path in outputs.items()
+        }
+        executor = get_encode_executor()
+        window_frames = int(window_seconds * self.samplerate)
+        total_frames = sources.shape[-1]
+        try:
+            for start in range(0, total_frames, window_frames):
+                block = sources[:, :, start:start + window_frames]
+                futures = [
+                    executor.submit(encoder.write, self._get_stem_audio(block, stem))
+                    for stem, encoder in encoders.items()
+                ]
+                for future in futures:
+                    future.result()
+                reporter.update('encode', min(1.0, (start + window_frames) / total_frames))
+            for encoder in encoders.values():
+                encoder.close()
+        except Exception:
+            for encoder in encoders.values():
+                encoder.abort()
+            raise
+
+    def _separate(
+        self,
+        wav_data: torch.Tensor,
+        settings: Optional[dict] = None,
+        progress: bool = False,
+        on_progress: Optional[Callable[[float], None]] = None
+    ) -> torch.Tensor:
         """
-        # More complex models always need full separation
-        complex_models = ['htdemucs', 'htdemucs_ft']
-        if self.model_name in complex_models:
-            logger.info(f"Model {self.model_name} requires full separation")
-            return True
-        
-        # For MDX models, can optimize in specific cases
-        # If only wants vocals, can optimize
-        if selected_stems == ['vocals']:
-            return False
-            
-        # If only wants instrumental, can optimize (= not vocals)
-        if selected_stems == ['instrumental']:
-            return False
-            
-        # If wants vocals + instrumental, can optimize
-        if set(selected_stems) == {'vocals', 'instrumental'}:
-            return False
-            
-        # For other cases, needs full separation
-        return True
+        Separates a [channels, length] tensor with the given settings.
+        
+        Returns:
+            Tensor with format [sources, channels, length]
+            ([vocals, instrumental] in fast mode)
         """
+        settings = settings or self.get_separation_settings(['drums', 'bass', 'other', 'vocals'])
+        with self._inference_lock:
+            if settings['mode'] == 'fast':
+                return self._separate_optimized(wav_data, settings, progress, on_progress)
+            return self._run_model(wav_data, progress, on_progress, settings=settings)
 
-    def _separate_optimized(self, wav_data, selected_stems: List[str]):
+    def _run_model(
+        self,
+        wav_data: torch.Tensor,
+        progress: bool = False,
+        on_progress: Optional[Callable[[float], None]] = None,
+        model=None,
+        settings: Optional[dict] = None
+    ) -> torch.Tensor:
         """
-        Optimized separation for specific cases using vocals-only model.
+        Runs the model on a [channels, length] tensor.
+        
+        Args:
+            wav_data: Audio with format [channels, length] or [batch, channels, length]
+            progress: Show a progress bar on the console
+            on_progress: Called with the fraction of model segments processed
+            model: Model to run instead of self.model (e.g. a subset of the bag)
+            settings: Segment, overlap, shifts and precision (default: balanced settings)
+            
+        Returns:
+            Tensor with format [sources, channels, length]
         """
-        logger.info("🚀 Using OPTIMIZED separation (vocals only)")
+        # apply_model expects [batch, channels, length]
+        if wav_data.dim() == 2:
+            wav_data = wav_data[None]
+        
+        # Ensure wav_data is on the correct device
+        if wav_data.device != torch.device(self.device):
+            wav_data = wav_data.to(self.device)
+        
+        model = model if model is not None else self.model
+        settings = settings or {'segment': SEGMENT, 'overlap': OVERLAP, 'shifts': 1, 'precision': 'mixed'}
+        
+        # Observe segment completion through the pool apply_model submits segments to
+        pool = None
+        if on_progress is not None:
+            total_segments = count_inference_segments(
+                model, wav_data.shape[-1], settings['segment'], settings['overlap'], settings['shifts']
+            )
+            pool = InferenceProgressPool(on_progress, total_segments)
         
-        # For optimized cases, use specific vocals model if available
-        # For now, use the complete model but with faster processing
-        with torch.amp.autocast('cuda', enabled=torch.cuda.is_available()):
+        precision = settings['precision']
+        if precision == 'mixed' and is_quantized(model):
+            # Dynamically quantized layers only take float32 inputs
+            precision = 'float32'
+        
+        with micro_batching(model), self.runtime.inference(self.device, precision):
             sources = apply_model(
-                self.model, 
+                model, 
                 wav_data, 
                 device=self.device, 
-                progress=True,
-                segment=15,  # Larger segments for vocals
-                overlap=0.1   # Less overlap for speed
+                shifts=settings['shifts'],
+                progress=progress,
+                segment=settings['segment'],
+                overlap=settings['overlap'],
+                pool=pool
             )
         
-        # Normalize tensor format using robust method
-        sources = self._normalize_tensor_format(sources)
+        # bfloat16 (CPU autocast) has no numpy equivalent for caching and encoding
+        if sources.dtype == torch.bfloat16:
+            sources = sources.float()
+        
+        # If tensor has 4 dimensions [batch, sources, channels, length], remove batch
+        if len(sources.shape) == 4 and sources.shape[0] == 1:
+            sources = sources[0]
+        
+        # Check if we have format [sources, channels, length]
+        if len(sources.shape) != 3:
+            raise ValueError(f"Unexpected format: {sources.shape}. Expected: [sources, channels, length]")
         
         # Check if we have the expected number of stems
-        num_sources, num_channels, audio_length = sources.shape
-        if num_sources < 4:
-            raise ValueError(f"Model returned {num_sources} sources (optimized). Expected: 4 (drums, bass, other, vocals)")
-            
+        if sources.shape[0] < 4:
+            raise ValueError(f"Model returned {sources.shape[0]} sources. Expected: 4 (drums, bass, other, vocals)")
+        
         return sources
 
+    @staticmethod
+    def _get_stem_audio(sources, stem: str) -> torch.Tensor:
+        """
+        Extracts a stem from separated sources as a float32 CPU tensor [channels, length].
+        
+        Args:
+            sources: Tensor from the model or memory-mapped array from the source cache,
+                either with the four model sources or with [vocals, instrumental] (fast mode)
+            stem: Stem name
+        """
+        if sources.shape[0] == len(FAST_MODE_STEMS):
+            data = sources[FAST_MODE_STEMS.index(stem)]
+            if isinstance(data, np.ndarray):
+                return torch.from_numpy(np.asarray(data, dtype=np.float32))
+            return data.cpu().float()
+        
+        if isinstance(sources, np.ndarray):
+            # Only the rows that are needed are read from the memory-mapped cache file
+            if stem == 'instrumental':
+                data = sources[0].astype(np.float32) + sources[1] + sources[2]
+            else:
+                data = np.asarray(sources[AVAILABLE_STEMS[stem]['index']], dtype=np.float32)
+            return torch.from_numpy(data)
+        
+        if stem == 'instrumental':
+            # Instrumental is the combination of drums + bass + other
+            audio_data = sources[0] + sources[1] + sources[2]
+        else:
+            # Individual stem
+            audio_data = sources[AVAILABLE_STEMS[stem]['index']]
+        
+        # Move to CPU and ensure correct format
+        audio_data = audio_data.cpu()
+        if audio_data.dtype == torch.float16:
+            audio_data = audio_data.float()
+        return audio_data
+
+    def get_separation_settings(
+        self,
+        selected_stems: List[str],
+        mode: Optional[str] = None,
+        preset: Optional[str] = None
+    ) -> dict:
+        """
+        Resolves the settings used to separate a request with this model.
+        
+        See resolve_separation_settings; the segment is also limited to what
+        the model accepts.
+        """
+        return resolve_separation_settings(selected_stems, mode, preset, self.max_segment)
+
+    @property
+    def max_segment(self) -> float:
+        """Longest segment (seconds) the model accepts."""
+        models = self.model.models if isinstance(self.model, BagOfModels) else [self.model]
+        segments = [float(model.segment) for model in models if isinstance(model, HTDemucs)]
+        return min(segments, default=float('inf'))
+
+    @staticmethod
+    def _get_inference_settings(settings: dict) -> dict:
+        """Settings that change the model output (part of the source cache key)."""
+        return {
+            'mode': settings['mode'],
+            'segment': settings['segment'],
+            'overlap': settings['overlap'],
+            'shifts': settings['shifts'],
+            'precision': settings['precision'],
+        }
+
+    @staticmethod
+    def _get_output_settings(settings: dict) -> dict:
+        """Settings that change the generated files (part of the result cache key)."""
+        return {
+            **AudioSeparator._get_inference_settings(settings),
+            'format': OUTPUT_FORMAT,
+            'bitrate': OUTPUT_BITRATE,
+        }
+
+    def _needs_full_separation(self, selected_stems: List[str]) -> bool:
+        """
+        Checks if full separation is needed or if it can be optimized.
+        
+        Returns:
+            True if all 4 stems need to be separated
+            False if only vocals/instrumental are requested (fast mode applies)
+        """
+        return not set(selected_stems) <= set(FAST_MODE_STEMS)
+
+    def _get_vocals_model(self):
+        """
+        Returns the part of the model needed to estimate vocals.
+        
+        Bags of models that weight sources per sub-model (e.g. htdemucs_ft, one
+        specialist per source) only need the sub-models with a vocals weight.
+        """
+        if not isinstance(self.model, BagOfModels):
+            return self.model
+        
+        vocals_index = self.model.sources.index('vocals')
+        members = [
+            (model, weights[vocals_index])
+            for model, weights in zip(self.model.models, self.model.weights)
+            if weights[vocals_index] > 0
+        ]
+        if len(members) == len(self.model.models):
+            return self.model
+        if len(members) == 1:
+            return members[0][0]
+        # Every source is weighted like vocals so the other (unused) estimates stay finite
+        return BagOfModels(
+            [model for model, _ in members],
+            weights=[[weight] * len(self.model.sources) for _, weight in members]
+        )
+
+    def _separate_optimized(
+        self,
+        wav_data: torch.Tensor,
+        settings: Optional[dict] = None,
+        progress: bool = False,
+        on_progress: Optional[Callable[[float], None]] = None
+    ) -> torch.Tensor:
+        """
+        Fast separation for vocals/instrumental requests.
+        
+        Only the vocals estimate is used: the instrumental is the residual
+        mix - vocals, so it keeps everything the model did not assign to vocals.
+        Compared to full mode this skips bag members that do not contribute to
+        vocals (segment, overlap and shifts come from the settings).
+        
+        Returns:
+            Tensor with format [2, channels, length] ([vocals, instrumental])
+        """
+        logger.info("🚀 Using OPTIMIZED separation (vocals + residual instrumental)")
+        
+        settings = settings or self.get_separation_settings(FAST_MODE_STEMS, mode='fast')
+        sources = self._run_model(
+            wav_data,
+            progress,
+            on_progress,
+            model=self._get_vocals_model(),
+            settings=settings
+        )
+        vocals = sources[AVAILABLE_STEMS['vocals']['index']]
+        
+        mix = wav_data[0] if wav_data.dim() == 3 else wav_data
+        mix = mix.to(device=vocals.device, dtype=vocals.dtype)
+        return torch.stack([vocals, mix - vocals])
+
     @staticmethod
     def get_available_stems() -> Dict[str, Dict[str, str]]:
         """Returns information about available stems."""
         return AVAILABLE_STEMS
 
-    def estimate_processing_time(self, selected_stems: List[str]) -> str:
-        """
-        Estimates processing time based on selected stems and current model.
+    def estimate_processing_seconds(
+        self,
+        selected_stems: List[str],
+        duration: Optional[float] = None,
+        mode: Optional[str] = None,
+        preset: Optional[str] = None
+    ) -> float:
         """
-        # Factors based on model
-        model_speed_factor = {
-            'mdx_extra_q': 1.0,    # Faster
-            'mdx': 1.5,            # Moderate
-            'htdemucs': 2.5,       # Slow
-            'htdemucs_ft': 4.0     # Very slow
-        }
+        Estimates processing time in seconds for an input.
         
-        # Factor based on device
-        device_factor = 1.0 if torch.cuda.is_available() else 2.0
-        
-        # Factor based on stem selection
-        stem_factor = 1.0
-        if len(selected_stems) == 1 and selected_stems[0] == 'vocals':
-            stem_factor = 1.0  # Optimized
-        elif len(selected_stems) == 1 and selected_stems[0] == 'instrumental':
-            stem_factor = 1.0  # Optimized
-        elif len(selected_stems) == 2 and 'vocals' in selected_stems and 'instrumental' in selected_stems:
-            stem_factor = 1.2  # Karaoke
-        elif len(selected_stems) <= 2:
-            stem_factor = 1.5  # Few stems
-        else:
-            stem_factor = 2.0  # Multiple stems
+        Uses the real-time factors observed for this model, device and mode
+        (see ProcessingTimeEstimator), scaled by the cost of the settings.
         
-        # Calculate estimated time in seconds
-        base_time = 30  # Base time for mdx_extra_q + GPU + vocals
-        total_factor = model_speed_factor.get(self.model_name, 2.0) * device_factor * stem_factor
-        estimated_seconds = base_time * total_factor
+        Args:
+            selected_stems: Stems to extract
+            duration: Input duration in seconds (default TYPICAL_TRACK_SECONDS)
+            mode: Separation mode
+            preset: Speed/quality preset
+        """
+        settings = self.get_separation_settings(selected_stems, mode, preset)
+        return get_processing_time_estimator().estimate(
+            self.model_name, self.device, settings, len(selected_stems), duration or TYPICAL_TRACK_SECONDS
+        )
+    
+    def estimate_processing_time(
+        self,
+        selected_stems: List[str],
+        duration: Optional[float] = None,
+        mode: Optional[str] = None,
+        preset: Optional[str] = None
+    ) -> str:
+        """
+        Describes the estimated processing time (see estimate_processing_seconds).
         
-        # Convert to friendly description
+        Args:
+            selected_stems: Stems to extract
+            duration: Input duration in seconds (default TYPICAL_TRACK_SECONDS)
+            mode: Separation mode
+            preset: Speed/quality preset
+        """
+        return self._describe_processing_time(
+            self.estimate_processing_seconds(selected_stems, duration, mode, preset)
+        )
+    
+    @staticmethod
+    def _describe_processing_time(estimated_seconds: float) -> str:
+        """Converts an estimate in seconds to a friendly description."""
         if estimated_seconds <= 60:
             return "very fast (30-60 seconds)"
         elif estimated_seconds <= 120:
@@ -340,9 +910,11 @@ class AudioSeparator:
             torch.cuda.synchronize()
 
 
-# Global separator instance (singleton)
-def get_audio_separator(model_name=DEFAULT_MODEL):
-    """Returns an instance of AudioSeparator for the given model."""
+# Separators are lightweight: the loaded model is shared through the model registry
+def get_audio_separator(model_name=DEFAULT_MODEL, output_dir: Optional[str] = None):
+    """Returns an AudioSeparator for the given model, reusing the already loaded weights."""
+    if output_dir is not None:
+        return AudioSeparator(output_dir=output_dir, model_name=model_name)
     return AudioSeparator(model_name=model_name)
 
 # Compatibility - removed global instance to avoid initialization during import
@@ -0,0 +1,178 @@
+"""
+Coalescing of identical in-flight requests.
+
+When the same track is requested several times at once (e.g. a popular
+YouTube video), only the first request does the work; the others wait for it
+and receive the same result. Requests are identified by the input (video id
+or content hash) and everything that changes the output: model, separation
+settings and stems.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from .cache import make_cache_key
+from .metrics import get_metrics_registry
+
+logger = logging.getLogger(__name__)
+
+
+def request_key(source_id: str, model_name: str, settings: dict, stems: Iterable[str], **extra) -> str:
+    """
+    Builds the key identifying a separation request.
+
+    Args:
+        source_id: YouTube video id or SHA-256 of the uploaded file
+        model_name: Model used
+        settings: Separation settings (see resolve_separation_settings)
+        stems: Requested stems (order independent)
+        **extra: Other options that change the response (e.g. progressive)
+
+    Returns:
+        Hex key
+    """
+    return make_cache_key(source_id, model_name, settings, sorted(stems), extra)
+
+
+class _Call:
+    """A function call shared by concurrent callers."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        # Followers waiting on an event loop
+        self.futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def outcome(self) -> Any:
+        """Returns the result of the finished call, or raises its exception."""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def _wake(future: asyncio.Future):
+    if not future.done():
+        future.set_result(None)
+
+
+class SingleFlight:
+    """
+    Runs a function at most once at a time per key.
+
+    Callers that arrive while a call with the same key is running wait for it
+    and get its result (or its exception) instead of running it again.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'coalesced': 0}
+
+    def do(self, key: str, func: Callable[..., Any], *args, **kwargs) -> Tuple[Any, bool]:
+        """
+        Runs func(*args, **kwargs), or waits for the running call with the same key.
+
+        Returns:
+            Tuple with (result, coalesced), coalesced being True if the result
+            was produced by another caller
+
+        Raises:
+            Exception: Whatever the shared call raised
+        """
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            return call.outcome(), True
+        return self._lead(key, call, func, *args, **kwargs), False
+
+    async def do_async(
+        self,
+        key: str,
+        func: Callable[..., Any],
+        *args,
+        run_in_thread: Optional[Callable[..., Awaitable[Any]]] = None
+    ) -> Tuple[Any, bool]:
+        """
+        Coroutine version of do(): only the caller that runs func takes a thread.
+
+        Callers joining a running call wait on the event loop, so a burst of
+        identical requests holds a single worker thread.
+
+        Args:
+            run_in_thread: Runs a blocking function off the event loop
+                (default asyncio.to_thread; the API passes Starlette's threadpool)
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        call, leader = self._join(key, (loop, future))
+        if not leader:
+            await future
+            return call.outcome(), True
+        run_in_thread = run_in_thread or asyncio.to_thread
+        return await run_in_thread(self._lead, key, call, func, *args), False
+
+    def _join(self, key: str, waiter: Optional[tuple] = None) -> Tuple[_Call, bool]:
+        """Returns the call running for key, or a new call the caller must run (leader = True)."""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self._stats['calls'] += 1
+                return call, True
+            call.waiters += 1
+            self._stats['coalesced'] += 1
+            if waiter is not None:
+                call.futures.append(waiter)
+        logger.info(f"🔗 Joining in-flight request {key[:12]}")
+        return call, False
+
+    def _lead(self, key: str, call: _Call, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Runs the shared call and wakes the callers waiting for it."""
+        try:
+            call.result = func(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            # No follower can join once the call is gone from _calls
+            call.done.set()
+            for loop, future in call.futures:
+                try:
+                    loop.call_soon_threadsafe(_wake, future)
+                except RuntimeError:
+                    # The loop of that caller is closed
+                    pass
+
+    def get_stats(self) -> dict:
+        """Returns the number of calls run, requests coalesced and calls in flight."""
+        with self._lock:
+            return {**self._stats, 'in_flight': len(self._calls)}
+
+
+# Global instance
+_single_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Returns the process-wide single-flight group used by the API."""
+    return _single_flight
+
+
+def _collect_metrics():
+    """Exposes how many requests were served by another in-flight request."""
+    stats = _single_flight.get_stats()
+    return [
+        ("voice_separator_coalesced_requests_total", "counter",
+         "Requests that joined an identical in-flight separation instead of running their own",
+         [({}, stats['coalesced'])]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
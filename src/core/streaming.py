@@ -0,0 +1,90 @@
+"""
+Windowed (streaming) separation for long inputs.
+
+The input is decoded window by window, each window is separated on its own
+and consecutive windows overlap by `overlap * segment` seconds. The overlapping
+region is blended with a linear crossfade, the same transition length
+apply_model uses between its own segments, so memory stays bounded by the
+window size instead of the track length.
+"""
+
+import os
+from typing import Callable, Iterable, Iterator
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Duration limits (overridable through environment variables)
+# Inputs longer than the threshold are separated window by window
+STREAMING_THRESHOLD_SECONDS = float(os.environ.get("VOICE_SEPARATOR_STREAMING_THRESHOLD", "600"))
+MAX_DURATION_SECONDS = float(os.environ.get("VOICE_SEPARATOR_MAX_DURATION", "14400"))
+# Length of each window (a multiple of the model segment keeps segment boundaries aligned)
+WINDOW_SECONDS = float(os.environ.get("VOICE_SEPARATOR_WINDOW_SECONDS", "60"))
+# Shorter windows for progressive jobs, so the first audio is ready within seconds
+PROGRESSIVE_WINDOW_SECONDS = float(os.environ.get("VOICE_SEPARATOR_PROGRESSIVE_WINDOW_SECONDS", "20"))
+
+
+def crossfade_frames(segment: float, overlap: float, sample_rate: int) -> int:
+    """Returns the crossfade length between windows, in frames."""
+    return max(1, int(segment * overlap * sample_rate))
+
+
+def iter_separated_windows(
+    run_model: Callable[[np.ndarray], np.ndarray],
+    chunks: Iterable[np.ndarray],
+    window_frames: int,
+    overlap_frames: int
+) -> Iterator[np.ndarray]:
+    """
+    Separates a stream of audio chunks window by window.
+
+    Args:
+        run_model: Callable mapping a [channels, frames] window to [sources, channels, frames]
+        chunks: Decoded audio chunks with format [channels, frames]
+        window_frames: Frames per model call
+        overlap_frames: Frames shared (and crossfaded) by consecutive windows
+
+    Yields:
+        Finalized blocks with format [sources, channels, frames], in order.
+        Concatenated, they cover exactly the input length.
+    """
+    if overlap_frames >= window_frames:
+        raise ValueError("Window must be longer than the crossfade")
+
+    chunks = iter(chunks)
+    buffer = None
+    exhausted = False
+    tail = None
+    fade_in = np.linspace(0.0, 1.0, overlap_frames, dtype=np.float32)
+
+    while True:
+        # Fill the buffer up to one window
+        while not exhausted and (buffer is None or buffer.shape[1] < window_frames):
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                exhausted = True
+                break
+            buffer = chunk if buffer is None else np.concatenate([buffer, chunk], axis=1)
+
+        if buffer is None or buffer.shape[1] == 0:
+            break
+
+        window = buffer[:, :window_frames]
+        frames = window.shape[1]
+        out = np.asarray(run_model(window), dtype=np.float32)
+
+        if tail is not None:
+            # The window starts with the frames already covered by the previous tail
+            n = min(tail.shape[-1], frames)
+            out[..., :n] = tail[..., :n] * (1.0 - fade_in[:n]) + out[..., :n] * fade_in[:n]
+
+        if exhausted and buffer.shape[1] <= window_frames:
+            yield out
+            break
+
+        yield out[..., :frames - overlap_frames]
+        tail = out[..., frames - overlap_frames:].copy()
+        buffer = buffer[:, window_frames - overlap_frames:]
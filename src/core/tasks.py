@@ -0,0 +1,309 @@
+"""
+Separation tasks executed by background jobs.
+"""
+
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import logging
+
+from .admission import estimate_request_bytes, get_admission_controller
+from .decoder import DecodeError, probe_duration
+from .jobs import Job, get_job_manager
+from .progress import PHASE_MESSAGES
+from .separator import AVAILABLE_STEMS, get_audio_separator
+from .streaming import PROGRESSIVE_WINDOW_SECONDS, WINDOW_SECONDS
+from .youtube_downloader import YouTubeDownloader, YouTubeSource
+
+logger = logging.getLogger(__name__)
+
+# Share of the job progress reserved for loading the model and downloading the input
+SEPARATION_PROGRESS_START = 0.1
+# URL path under which the web output directory (static/output) is served
+OUTPUT_URL_PATH = "static/output/"
+
+
+def build_stem_files(result_paths: Dict[str, str], base_url: str = "/") -> Dict[str, dict]:
+    """
+    Builds the public description (URL, filename, name, icon) of separated stems.
+
+    Args:
+        result_paths: Dict of stem -> path returned by separate_stems (in the web output directory)
+        base_url: Prefix used to build URLs
+
+    Returns:
+        Dict of stem -> file information
+    """
+    files_data = {}
+    for stem, path in result_paths.items():
+        stem_info = AVAILABLE_STEMS[stem]
+        filename = Path(path).name
+        files_data[stem] = {
+            "url": f"{base_url}{OUTPUT_URL_PATH}{filename}",
+            "filename": filename,
+            "name": stem_info["name"],
+            "icon": stem_info["icon"]
+        }
+    return files_data
+
+
+def _decode_error(error: Optional[BaseException]) -> Optional[DecodeError]:
+    """Returns the ffmpeg input error a separation failed with, if that is what failed."""
+    while error is not None:
+        if isinstance(error, DecodeError):
+            return error
+        error = error.__cause__
+    return None
+
+
+def separate_youtube(
+    separator,
+    downloader: YouTubeDownloader,
+    source: YouTubeSource,
+    selected_stems: List[str],
+    **kwargs
+) -> Dict[str, str]:
+    """
+    Separates a resolved YouTube video, overlapping download and separation.
+    
+    Audio downloaded by a previous request is read from the cache. Otherwise,
+    when the selected audio format can be read progressively, ffmpeg decodes
+    it straight from the media URL (saving a copy for the cache) and the first
+    window is separated as soon as it has been downloaded. Other formats, or
+    a stream ffmpeg fails to read, are downloaded to a file first; the media
+    URL is resolved again if the server refused it (signed URLs expire).
+    Other errors are raised.
+    
+    Args:
+        separator: AudioSeparator to use
+        downloader: Downloader the source was resolved with
+        source: Video returned by YouTubeDownloader.resolve
+        selected_stems: Stems to extract
+        **kwargs: Other separate_stems arguments (mode, preset, progress_callback...)
+        
+    Returns:
+        Dict of stem -> path of the separated file (in the separator output_dir)
+    """
+    duration = source.duration or None
+    # The video id identifies the content, so cached results are reused without downloading
+    content_id = f"youtube:{source.video_id}"
+    streaming = kwargs.pop('streaming', None)
+    input_path = downloader.get_cached_audio(source)
+    stream = downloader.open_stream(source) if input_path is None else None
+    if stream is not None:
+        stream_url, headers = stream
+        # The audio is saved while it is decoded, so the next request for the video skips the download
+        copy_path = downloader.audio_copy_path(source)
+        try:
+            result_paths = separator.separate_stems(
+                stream_url,
+                selected_stems,
+                streaming=True,
+                content_id=content_id,
+                input_headers=headers,
+                duration=duration,
+                input_copy_path=copy_path,
+                **kwargs
+            )
+            if copy_path is not None:
+                downloader.cache_audio(source, copy_path)
+            return result_paths
+        except Exception as e:
+            if copy_path is not None and os.path.exists(copy_path):
+                os.unlink(copy_path)
+            decode_error = _decode_error(e)
+            if decode_error is None:
+                raise
+            logger.warning(f"Streaming separation failed, downloading the audio first: {e}")
+            if decode_error.http_error:
+                source = downloader.refresh(source)
+    
+    if input_path is None:
+        input_path, _ = downloader.download_audio(source.url, source, check_cache=False)
+    try:
+        return separator.separate_stems(
+            input_path, selected_stems, streaming=streaming, content_id=content_id, duration=duration, **kwargs
+        )
+    finally:
+        downloader.cleanup_file(input_path)
+
+
+def run_separation_job(
+    job: Job,
+    selected_stems: List[str],
+    model: str,
+    input_path: Optional[str] = None,
+    url: Optional[str] = None,
+    progressive: bool = False,
+    mode: Optional[str] = None,
+    preset: Optional[str] = None
+) -> dict:
+    """
+    Separates an uploaded file or a YouTube video inside a job.
+
+    Args:
+        job: Job being executed (used for progress reporting)
+        selected_stems: Stems to extract
+        model: Demucs model name
+        input_path: Path of an uploaded file (removed when done)
+        url: YouTube URL to separate (used when input_path is None); the audio
+            is decoded while it downloads when the format allows it
+        progressive: Separate in short windows and publish the files while they
+            are written, so they can be streamed before the job completes
+        mode: Separation mode (see SEPARATION_MODES)
+        preset: Speed/quality preset (see PRESETS)
+
+    Returns:
+        Dict with the separated files and, for YouTube jobs, video information
+    """
+    manager = get_job_manager()
+    youtube_downloader = YouTubeDownloader()
+    video_data = None
+
+    try:
+        manager.update(job, progress=0.02, message="Loading model")
+        separator = get_audio_separator(model)
+        settings = separator.get_separation_settings(selected_stems, mode, preset)
+
+        source = None
+        if input_path is None:
+            manager.update(job, progress=0.05, message="Fetching video information")
+            source = youtube_downloader.resolve(url)
+            video_data = source.video_info
+            # The duration is only known once the video information was fetched
+            manager.update(
+                job,
+                estimated_seconds=time.time() - job.started_at + separator.estimate_processing_seconds(
+                    selected_stems, video_data.get('duration'), mode, preset
+                )
+            )
+
+        duration = video_data.get('duration') if video_data else probe_duration(input_path)
+        if progressive:
+            window_seconds = PROGRESSIVE_WINDOW_SECONDS
+        elif source is not None and source.stream_url is not None:
+            # Streamed videos are separated window by window while they download
+            window_seconds = WINDOW_SECONDS
+        else:
+            window_seconds = None
+        memory_bytes = estimate_request_bytes(model, separator.device, duration, window_seconds)
+        estimated_seconds = separator.estimate_processing_seconds(selected_stems, duration, mode, preset)
+
+        def report_progress(progress: float, phase: str):
+            manager.update(
+                job,
+                progress=SEPARATION_PROGRESS_START + (1.0 - SEPARATION_PROGRESS_START) * progress,
+                message=PHASE_MESSAGES[phase]
+            )
+
+        options = {'progress_callback': report_progress, 'mode': mode, 'preset': preset}
+        if progressive:
+            options.update(
+                streaming=True,
+                window_seconds=PROGRESSIVE_WINDOW_SECONDS,
+                on_outputs=lambda outputs: manager.set_outputs(job, outputs)
+            )
+
+        # Wait for a free slot of the model and enough memory (see admission.py)
+        manager.update(job, message="Waiting for a free slot")
+        with get_admission_controller().slot(model, memory_bytes, estimated_seconds, reject=False):
+            manager.update(job, progress=SEPARATION_PROGRESS_START, message="Separating stems")
+            if source is not None:
+                result_paths = separate_youtube(separator, youtube_downloader, source, selected_stems, **options)
+            else:
+                result_paths = separator.separate_stems(input_path, selected_stems, **options)
+    finally:
+        if input_path is not None:
+            try:
+                os.unlink(input_path)
+            except OSError as e:
+                logger.warning(f"Error removing temporary file: {e}")
+
+    result = {
+        "files": build_stem_files(result_paths),
+        "stems_processed": selected_stems,
+        "model": model,
+        "settings": settings,
+        "progressive": progressive,
+    }
+    if video_data is not None:
+        result["video_info"] = video_data
+    return result
+
+
+def run_batch_job(
+    job: Job,
+    items: List[dict],
+    selected_stems: List[str],
+    model: str,
+    mode: Optional[str] = None,
+    preset: Optional[str] = None
+) -> dict:
+    """
+    Separates a batch of uploaded files and YouTube videos inside a job.
+
+    Args:
+        job: Job being executed (used for progress reporting)
+        items: Batch items (see batch.make_items); uploaded files carry their
+            original 'filename' and are removed when done
+        selected_stems: Stems to extract from every track
+        model: Demucs model name
+        mode: Separation mode (see SEPARATION_MODES)
+        preset: Speed/quality preset (see PRESETS)
+
+    Returns:
+        Results manifest (see BatchSeparator.run) with the public description
+        of the files of every track
+    """
+    from .batch import BatchSeparator
+
+    manager = get_job_manager()
+    uploads = [item['source'] for item in items if 'filename' in item]
+    try:
+        manager.update(job, progress=0.02, message="Loading model")
+        batch = BatchSeparator(model, selected_stems, mode, preset)
+        separator = batch.separator
+
+        estimated_seconds = sum(
+            separator.estimate_processing_seconds(selected_stems, item.get('duration'), mode, preset)
+            for item in items
+        )
+        # Every worker holds one track in memory
+        memory_bytes = sum(
+            estimate_request_bytes(model, separator.device, item.get('duration'))
+            for item in items[:batch.workers]
+        )
+
+        def on_result(entry: dict, done: int, total: int):
+            if 'filename' in entry:
+                try:
+                    os.unlink(entry['source'])
+                except OSError as e:
+                    logger.warning(f"Error removing temporary file: {e}")
+            manager.update(
+                job,
+                progress=SEPARATION_PROGRESS_START + (1.0 - SEPARATION_PROGRESS_START) * done / total,
+                message=f"Separated {done}/{total} tracks"
+            )
+
+        # The batch holds one slot of the model for its whole run (see admission.py)
+        manager.update(job, message="Waiting for a free slot")
+        with get_admission_controller().slot(model, memory_bytes, estimated_seconds, reject=False):
+            manager.update(job, progress=SEPARATION_PROGRESS_START, message="Separating tracks")
+            manifest = batch.run(items, on_result)
+    finally:
+        for path in uploads:
+            if os.path.exists(path):
+                try:
+                    os.unlink(path)
+                except OSError as e:
+                    logger.warning(f"Error removing temporary file: {e}")
+
+    for entry in manifest['items']:
+        if 'filename' in entry:
+            # Temporary paths are meaningless to clients
+            entry['source'] = entry.pop('filename')
+        if 'files' in entry:
+            entry['files'] = build_stem_files(entry['files'])
+    return manifest
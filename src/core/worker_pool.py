@@ -0,0 +1,402 @@
+"""Separation worker processes forked from a supervisor, sharing the preloaded model weights copy-on-write."""
+
+import atexit
+import gc
+import logging
+import os
+import queue
+import threading
+from multiprocessing import get_context, parent_process
+from typing import Any, Callable, Dict, List, Optional
+
+from .jobs import Job, JobBackend, JobEventRelay, set_job_manager
+from .metrics import get_metrics_registry, set_metrics_forwarder
+from .presets import DEFAULT_PRESET, get_preset
+
+logger = logging.getLogger(__name__)
+
+# Worker processes for background jobs (0 = run jobs on threads of the API process)
+WORKER_PROCESSES = int(os.environ.get("VOICE_SEPARATOR_WORKER_PROCESSES", "0"))
+# Models loaded once by the supervisor and shared by every worker (comma separated)
+PRELOAD_MODELS = [
+    name.strip()
+    for name in os.environ.get("VOICE_SEPARATOR_PRELOAD_MODELS", get_preset(DEFAULT_PRESET)['model']).split(",")
+    if name.strip()
+]
+# Seconds between checks of the worker processes
+SUPERVISOR_INTERVAL = 1.0
+
+
+def _send_state(events):
+    """Sends the collector metrics and resident models of this worker to the API process."""
+    from .model_registry import get_model_registry
+
+    models = [(model['model'], model['device']) for model in get_model_registry().get_stats()['models']]
+    events.put((None, 'state', {
+        'source': str(os.getpid()), 'metrics': get_metrics_registry().collect(), 'models': models
+    }))
+
+
+def _worker_main(tasks, events, processes: int):
+    """Worker process: runs job functions taken from the task queue."""
+    from .admission import configure_admission, get_admission_controller
+    from .estimator import get_processing_time_estimator
+    from .runtime import configure_runtime
+
+    supervisor_pid = os.getppid()
+    # The CPUs and the memory budget are split between the workers, each running one separation at a time
+    configure_runtime(concurrency=1, processes=processes)
+    configure_admission(memory_budget_bytes=get_admission_controller().memory_budget_bytes // processes)
+    # Job progress, metrics and processing time observations are forwarded to the
+    # API process, which owns the job state and serves /metrics and the estimates
+    set_job_manager(JobEventRelay(lambda *event: events.put(event)))
+    set_metrics_forwarder(lambda *update: events.put((None, 'metric', update)))
+    estimator = get_processing_time_estimator()
+    estimator.persist = False
+    estimator.forwarder = lambda method, arguments: events.put((None, 'estimate', (method, arguments)))
+    _send_state(events)
+    logger.info(f"👷 Worker {os.getpid()} ready")
+
+    while os.getppid() == supervisor_pid:
+        try:
+            task = tasks.get(timeout=SUPERVISOR_INTERVAL)
+        except queue.Empty:
+            continue
+        if task is None:
+            break
+        task_id, func, args, kwargs, job_state = task
+        events.put((task_id, 'started', os.getpid()))
+        job = Job.from_state(job_state)
+        try:
+            events.put((task_id, 'result', func(job, *args, **kwargs)))
+        except Exception as e:
+            events.put((task_id, 'error', str(e)))
+        _send_state(events)
+
+
+def _supervisor_main(tasks, events, stop, processes: int, preload: List[str]):
+    """Supervisor process: loads the shared models, then forks and watches the workers."""
+    from .model_registry import get_model_registry
+    from .separator import resolve_device
+
+    logging.basicConfig(level=logging.INFO)
+    registry = get_model_registry()
+    registry.max_models = max(registry.max_models, len(preload))
+    preloaded = []
+    for model_name in preload:
+        try:
+            device = resolve_device(model_name)
+            if device != 'cpu':
+                logger.warning(f"⚠️ Not preloading {model_name}: only CPU models can be shared by forked workers")
+                continue
+            registry.get_model(model_name, device)
+            preloaded.append(model_name)
+        except Exception as e:
+            logger.error(f"❌ Could not preload {model_name}: {e}")
+    # Keep the garbage collector from touching (and so copying) the inherited objects
+    gc.freeze()
+
+    fork = get_context('fork')
+
+    def start_worker():
+        worker = fork.Process(target=_worker_main, args=(tasks, events, processes), daemon=True)
+        worker.start()
+        return worker
+
+    workers = [start_worker() for _ in range(processes)]
+    events.put((None, 'ready', {'pids': [worker.pid for worker in workers], 'preloaded': preloaded}))
+
+    parent = parent_process()
+    while not stop.wait(SUPERVISOR_INTERVAL):
+        if parent is not None and not parent.is_alive():
+            break
+        for index, worker in enumerate(workers):
+            if not worker.is_alive():
+                logger.error(f"❌ Worker {worker.pid} exited with code {worker.exitcode}, restarting it")
+                workers[index] = start_worker()
+                events.put((None, 'worker_exit', {
+                    'pid': worker.pid, 'exitcode': worker.exitcode, 'replacement': workers[index].pid
+                }))
+
+    for _ in workers:
+        tasks.put(None)
+    for worker in workers:
+        worker.join(timeout=5)
+        if worker.is_alive():
+            worker.terminate()
+
+
+class _Task:
+    """A job running in a worker process, as seen from the API process."""
+
+    def __init__(self, job: Job):
+        self.job = job
+        self.pid: Optional[int] = None
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[str] = None
+
+
+class WorkerPool(JobBackend):
+    """
+    Runs job functions in worker processes that share the preloaded model weights.
+
+    Job functions and their arguments must be picklable (module-level
+    functions such as tasks.run_separation_job).
+    """
+
+    name = 'processes'
+    remote = True
+
+    def __init__(self, processes: int = WORKER_PROCESSES, preload: Optional[List[str]] = None):
+        """
+        Args:
+            processes: Number of worker processes
+            preload: Models loaded before forking the workers (default PRELOAD_MODELS)
+        """
+        self.processes = max(1, processes)
+        self.preload = list(PRELOAD_MODELS if preload is None else preload)
+        self._tasks: Dict[str, _Task] = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._pids: List[int] = []
+        self._preloaded: List[str] = []
+        self._stats = {'completed': 0, 'failed': 0, 'worker_restarts': 0, 'supervisor_restarts': 0}
+        self._supervisor = None
+        # Set when the supervisor died before its workers were ready: restarting it would not help
+        self._error: Optional[str] = None
+        self._exit_registered = False
+
+    def start(self):
+        """Starts the supervisor, which loads the shared models and forks the workers."""
+        with self._lock:
+            if self._error is not None:
+                raise Exception(self._error)
+            if self._supervisor is not None:
+                return
+            self._start_supervisor()
+            if not self._exit_registered:
+                atexit.register(self.stop)
+                self._exit_registered = True
+        logger.info(f"🏭 Starting {self.processes} worker processes (shared models: {', '.join(self.preload) or '-'})")
+
+    def _start_supervisor(self):
+        """Starts the supervisor and the threads reading its events and watching it (lock held)."""
+        # spawn: the supervisor must not inherit the threads of the API process before it forks
+        spawn = get_context('spawn')
+        self._task_queue = spawn.Queue()
+        # Written by the supervisor and by workers it forks later: a SimpleQueue has no
+        # feeder thread, which the forked workers would inherit without it running
+        self._events = spawn.SimpleQueue()
+        self._stop = spawn.Event()
+        self._ready.clear()
+        self._supervisor = spawn.Process(
+            target=_supervisor_main,
+            args=(self._task_queue, self._events, self._stop, self.processes, self.preload),
+            name="separation-supervisor"
+        )
+        self._supervisor.start()
+        threading.Thread(target=self._listen, args=(self._events,), name="worker-pool-events", daemon=True).start()
+        threading.Thread(target=self._watch, args=(self._supervisor,), name="worker-pool-watchdog", daemon=True).start()
+
+    def stop(self):
+        """Stops the workers (running jobs are interrupted and fail)."""
+        with self._lock:
+            supervisor = self._supervisor
+            if supervisor is None:
+                return
+            self._supervisor = None
+        self._stop.set()
+        supervisor.join(timeout=10)
+        if supervisor.is_alive():
+            supervisor.terminate()
+        self._abandon(self._events, "Worker processes were stopped")
+
+    def _abandon(self, events, error: str):
+        """Fails every pending job and stops the thread reading the events of a gone supervisor."""
+        with self._lock:
+            pending = list(self._tasks.values())
+            self._stats['failed'] += len(pending)
+            self._pids = []
+        for task in pending:
+            task.error = error
+            task.done.set()
+        events.put((None, 'closed', None))
+
+    def _watch(self, supervisor):
+        """Fails the pending jobs if the supervisor dies, and restarts it."""
+        while True:
+            supervisor.join(SUPERVISOR_INTERVAL)
+            with self._lock:
+                if self._supervisor is not supervisor:
+                    return
+                if supervisor.is_alive():
+                    continue
+                self._supervisor = None
+                events = self._events
+                if not self._ready.is_set():
+                    self._error = f"Worker processes could not start (supervisor exit code {supervisor.exitcode})"
+            logger.error(f"❌ Worker supervisor exited with code {supervisor.exitcode}")
+            self._abandon(events, f"Worker processes exited unexpectedly (exit code {supervisor.exitcode})")
+            with self._lock:
+                if self._error is not None or self._supervisor is not None:
+                    return
+                self._stats['supervisor_restarts'] += 1
+                self._start_supervisor()
+            logger.info("🔄 Worker supervisor restarted")
+            return
+
+    def run(self, job: Job, func: Callable[..., Any], args: tuple = (), kwargs: Optional[dict] = None) -> Any:
+        """
+        Runs func(job, *args, **kwargs) in a worker and waits for it (blocking).
+
+        Progress and outputs reported by the function are applied to the job
+        through the JobManager of this process.
+
+        Returns:
+            The value returned by the function
+
+        Raises:
+            Exception: If the function failed or its worker died
+        """
+        self.start()
+        task = _Task(job)
+        task_id = job.id
+        # Under the lock: a task is either sent to the running supervisor or failed with the one that died
+        with self._lock:
+            if self._supervisor is None:
+                raise Exception(self._error or "Worker processes are not running")
+            self._tasks[task_id] = task
+            self._task_queue.put((task_id, func, args, kwargs or {}, job.to_state()))
+        try:
+            task.done.wait()
+        finally:
+            with self._lock:
+                self._tasks.pop(task_id, None)
+        if task.error is not None:
+            raise Exception(task.error)
+        return task.result
+
+    def _listen(self, events):
+        """Applies the events sent by the workers and the supervisor."""
+        from .jobs import get_job_manager
+
+        while True:
+            try:
+                task_id, event, payload = events.get()
+            except (EOFError, OSError):
+                return
+            if event == 'closed':
+                return
+            if event == 'ready':
+                self._pids, self._preloaded = payload['pids'], payload['preloaded']
+                self._ready.set()
+                logger.info(f"✅ Worker processes ready: {self._pids}")
+                continue
+            if event == 'worker_exit':
+                self._worker_exited(payload)
+                continue
+            if event in ('metric', 'estimate', 'state'):
+                self._apply_observations(event, payload)
+                continue
+
+            with self._lock:
+                task = self._tasks.get(task_id)
+            if task is None:
+                continue
+            if event == 'started':
+                task.pid = payload
+            elif event == 'update':
+                get_job_manager().update(task.job, **payload)
+            elif event == 'outputs':
+                get_job_manager().set_outputs(task.job, payload)
+            elif event in ('result', 'error'):
+                if event == 'result':
+                    task.result = payload
+                else:
+                    task.error = payload
+                with self._lock:
+                    self._stats['completed' if event == 'result' else 'failed'] += 1
+                task.done.set()
+
+    @staticmethod
+    def _apply_observations(event: str, payload):
+        """Applies the metrics, processing times and resident models reported by a worker."""
+        from .estimator import get_processing_time_estimator
+        from .model_registry import get_model_registry
+
+        if event == 'metric':
+            get_metrics_registry().apply(*payload)
+        elif event == 'estimate':
+            method, arguments = payload
+            if method in ('observe', 'observe_load'):
+                getattr(get_processing_time_estimator(), method)(**arguments)
+        else:
+            get_metrics_registry().set_remote_families(payload['source'], payload['metrics'])
+            get_model_registry().set_remote_models(payload['source'], payload['models'])
+
+    def _worker_exited(self, payload: dict):
+        """Fails the job the dead worker was running."""
+        from .model_registry import get_model_registry
+
+        # Its models are gone; its metrics are kept so the counters do not go back
+        get_model_registry().set_remote_models(str(payload['pid']), [])
+        with self._lock:
+            self._stats['worker_restarts'] += 1
+            self._pids = [payload['replacement'] if pid == payload['pid'] else pid for pid in self._pids]
+            orphaned = [task for task in self._tasks.values() if task.pid == payload['pid']]
+            self._stats['failed'] += len(orphaned)
+        for task in orphaned:
+            task.error = f"Worker process exited unexpectedly (exit code {payload['exitcode']})"
+            task.done.set()
+
+    def get_stats(self) -> dict:
+        """Returns the worker processes, the shared models and job counts."""
+        with self._lock:
+            return {
+                **self._stats,
+                'backend': self.name,
+                'processes': self.processes,
+                'ready': self._ready.is_set(),
+                'error': self._error,
+                'pids': list(self._pids),
+                'shared_models': list(self._preloaded),
+                'running': sum(task.pid is not None for task in self._tasks.values()),
+                'queued': sum(task.pid is None for task in self._tasks.values()),
+            }
+
+
+# Global instance
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> Optional[WorkerPool]:
+    """Returns the process-wide worker pool, or None when jobs run in the API process."""
+    global _worker_pool
+    if WORKER_PROCESSES <= 0:
+        return None
+    if _worker_pool is None:
+        with _worker_pool_lock:
+            if _worker_pool is None:
+                _worker_pool = WorkerPool()
+                _worker_pool.start()
+    return _worker_pool
+
+
+def _collect_metrics():
+    """Exposes the worker processes and how often they had to be replaced."""
+    if _worker_pool is None:
+        return []
+    stats = _worker_pool.get_stats()
+    return [
+        ("voice_separator_worker_processes", "gauge", "Separation worker processes",
+         [({}, stats['processes'])]),
+        ("voice_separator_worker_restarts_total", "counter", "Worker processes that died and were replaced",
+         [({}, stats['worker_restarts'])]),
+        ("voice_separator_worker_supervisor_restarts_total", "counter", "Times the worker supervisor died and was restarted",
+         [({}, stats['supervisor_restarts'])]),
+    ]
+
+
+get_metrics_registry().register_collector(_collect_metrics)
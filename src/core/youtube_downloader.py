@@ -1,17 +1,111 @@
 import os
 import tempfile
+import time
 import uuid
 from pathlib import Path
-from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+from typing import Callable, Dict, Optional, Tuple
 import yt_dlp
 import logging
 
+from .cache import YouTubeCache, get_youtube_cache
+from .metrics import DOWNLOAD_SECONDS
+from .streaming import MAX_DURATION_SECONDS
+
 logger = logging.getLogger(__name__)
 
+# Decode YouTube audio while it downloads instead of downloading the whole file first
+YOUTUBE_STREAMING = os.environ.get("VOICE_SEPARATOR_YOUTUBE_STREAMING", "1").lower() not in ("0", "false", "no")
+# Cached video information is fetched again when its media URL expires sooner than this (seconds)
+MEDIA_URL_MARGIN = 1800
+
+# Protocols whose media URL ffmpeg can read directly while it downloads
+STREAMABLE_PROTOCOLS = {'http', 'https', 'm3u8', 'm3u8_native', 'file'}
+
+# Extractor signature: (url, yt-dlp options) -> info dict as returned by YoutubeDL.extract_info
+Extractor = Callable[[str, dict], dict]
+
+
+def extract_with_yt_dlp(url: str, options: dict) -> dict:
+    """Extracts video metadata and the selected format's media URL with yt-dlp, without downloading."""
+    with yt_dlp.YoutubeDL(options) as ydl:
+        return ydl.sanitize_info(ydl.extract_info(url, download=False))
+
+
+class YouTubeSource:
+    """
+    A video resolved once: its metadata and the media URL of the selected audio format.
+    
+    Downloading or streaming from a resolved source does not contact YouTube
+    for metadata again.
+    """
+
+    def __init__(self, url: str, info: dict):
+        self.url = url
+        self.info = info
+
+    @property
+    def video_id(self) -> str:
+        return self.info.get('id') or self.url
+
+    @property
+    def duration(self) -> float:
+        return self.info.get('duration', 0) or 0
+
+    @property
+    def video_info(self) -> dict:
+        """Public description of the video."""
+        return {
+            'title': self.info.get('title', 'Unknown'),
+            'duration': self.duration,
+            'uploader': self.info.get('uploader', 'Unknown'),
+            'view_count': self.info.get('view_count', 0),
+            'id': self.info.get('id', ''),
+        }
+
+    @property
+    def stream_url(self) -> Optional[str]:
+        """Media URL ffmpeg can decode while downloading, or None (e.g. DASH fragments)."""
+        if self.info.get('protocol') in STREAMABLE_PROTOCOLS and self.info.get('url'):
+            return self.info['url']
+        return None
+
+    @property
+    def http_headers(self) -> Dict[str, str]:
+        """Headers the media URL must be requested with."""
+        return dict(self.info.get('http_headers') or {})
+
+    @property
+    def url_expires_at(self) -> Optional[float]:
+        """When the signed media URL expires (Unix time), if it says so."""
+        media_url = self.info.get('url') or ''
+        expire = parse_qs(urlparse(media_url).query).get('expire')
+        if not expire:
+            # Manifest URLs carry it as a path segment: .../expire/<time>/...
+            parts = urlparse(media_url).path.split('/')
+            expire = [parts[parts.index('expire') + 1]] if 'expire' in parts[:-1] else None
+        try:
+            return float(expire[0]) if expire else None
+        except ValueError:
+            return None
+
 
 class YouTubeDownloader:
-    def __init__(self, temp_dir: str = None):
+    def __init__(
+        self,
+        temp_dir: str = None,
+        extractor: Optional[Extractor] = None,
+        cache: Optional[YouTubeCache] = None
+    ):
+        """
+        Args:
+            temp_dir: Directory for downloaded files (default: system temp dir)
+            extractor: Replaces yt-dlp metadata extraction (e.g. a local stand-in)
+            cache: Cache of video information and audio (default: the process-wide cache)
+        """
         self.temp_dir = Path(temp_dir) if temp_dir else Path(tempfile.gettempdir())
+        self.extractor = extractor or extract_with_yt_dlp
+        self._cache = cache
         
         # ULTRA OPTIMIZED yt-dlp configuration for MAXIMUM SPEED
         self.ydl_opts = {
@@ -72,6 +166,126 @@ class YouTubeDownloader:
         except Exception:
             return False
 
+    def extract_video_id(self, url: str) -> Optional[str]:
+        """
+        Extracts the video id from a YouTube URL without network access.
+        
+        Args:
+            url: YouTube URL (watch, youtu.be, shorts, embed or live links)
+            
+        Returns:
+            Video id, or None if the URL does not contain one
+        """
+        try:
+            parsed = urlparse(url.strip())
+        except ValueError:
+            return None
+        host = (parsed.hostname or '').lower()
+        parts = [part for part in parsed.path.split('/') if part]
+        if host == 'youtu.be':
+            return parts[0] if parts else None
+        video_ids = parse_qs(parsed.query).get('v')
+        if video_ids:
+            return video_ids[0]
+        if len(parts) >= 2 and parts[0] in ('shorts', 'embed', 'live', 'v'):
+            return parts[1]
+        return None
+
+    @property
+    def cache(self) -> YouTubeCache:
+        """Cache of video information and downloaded audio, keyed by video id."""
+        if self._cache is None:
+            self._cache = get_youtube_cache()
+        return self._cache
+
+    def resolve(self, url: str) -> YouTubeSource:
+        """
+        Extracts video metadata and the audio media URL in a single request.
+        
+        Information fetched in the last few hours is served from the cache
+        without contacting YouTube.
+        
+        Args:
+            url: YouTube URL
+            
+        Returns:
+            YouTubeSource to pass to download_audio or to stream from
+            
+        Raises:
+            Exception: If the video information cannot be extracted
+        """
+        video_id = self.extract_video_id(url)
+        info = self.cache.get_info(video_id) if video_id else None
+        if info is not None:
+            expires_at = YouTubeSource(url, info).url_expires_at
+            if expires_at is not None and expires_at - time.time() < MEDIA_URL_MARGIN:
+                logger.info(f"Cached media URL of {video_id} is about to expire, fetching it again")
+                info = None
+            else:
+                logger.info(f"⚡ Video information cache hit: {video_id}")
+        if info is None:
+            info = self.extractor(url, self.ydl_opts)
+            if info.get('id'):
+                self.cache.put_info(info['id'], info)
+        source = YouTubeSource(url, info)
+        # Check duration (long videos are separated in streaming mode)
+        if source.duration > MAX_DURATION_SECONDS:
+            logger.warning(f"Video too long: {source.duration}s")
+        return source
+
+    def refresh(self, source: YouTubeSource) -> YouTubeSource:
+        """
+        Fetches the information of a video again, replacing the cached copy (its media URL was refused).
+
+        Raises:
+            Exception: If the video information cannot be extracted
+        """
+        info = self.extractor(source.url, self.ydl_opts)
+        if info.get('id'):
+            self.cache.put_info(info['id'], info)
+        return YouTubeSource(source.url, info)
+
+    def open_stream(self, source: YouTubeSource) -> Optional[Tuple[str, Dict[str, str]]]:
+        """
+        Returns what is needed to decode the audio while it downloads.
+        
+        Args:
+            source: Resolved video
+            
+        Returns:
+            Tuple with (media_url, http_headers), or None if the selected format
+            cannot be streamed (or streaming is disabled) and must be downloaded first
+            
+        Raises:
+            Exception: If the video exceeds the duration limit
+        """
+        if source.duration > MAX_DURATION_SECONDS:
+            raise Exception(f"Video too long ({source.duration}s). Limit: {MAX_DURATION_SECONDS / 60:.0f} minutes")
+        if not YOUTUBE_STREAMING or source.stream_url is None:
+            return None
+        logger.info(f"📡 Streaming audio: {source.video_info['title']} ({source.info.get('protocol')})")
+        return source.stream_url, source.http_headers
+
+    def get_cached_audio(self, source: YouTubeSource) -> Optional[str]:
+        """Returns the path of the previously downloaded audio of a video, or None."""
+        path = self.cache.get_audio(source.video_id)
+        if path is not None:
+            logger.info(f"⚡ Audio cache hit: {source.video_id}")
+        return path
+
+    def audio_copy_path(self, source: YouTubeSource) -> Optional[str]:
+        """Returns where to save the audio of a video while it is streamed, or None if audio is not cached."""
+        return self.cache.audio_path(source.video_id, source.info.get('ext') or 'm4a')
+
+    def cache_audio(self, source: YouTubeSource, file_path: str) -> str:
+        """
+        Keeps the downloaded audio of a video for later requests.
+        
+        Returns:
+            Path of the cached file (file_path if it could not be cached)
+        """
+        return self.cache.store_audio(source.video_id, file_path)
+
     def get_video_info(self, url: str) -> Optional[dict]:
         """
         Gets video information without downloading.
@@ -83,31 +297,27 @@ class YouTubeDownloader:
             Dictionary with video information or None if error
         """
         try:
-            with yt_dlp.YoutubeDL({'quiet': True}) as ydl:
-                info = ydl.extract_info(url, download=False)
-                
-                # Check duration (10 minute limit for optimization)
-                duration = info.get('duration', 0)
-                if duration > 600:  # 10 minutes
-                    logger.warning(f"Video too long: {duration}s")
-                
-                return {
-                    'title': info.get('title', 'Unknown'),
-                    'duration': duration,
-                    'uploader': info.get('uploader', 'Unknown'),
-                    'view_count': info.get('view_count', 0),
-                    'id': info.get('id', ''),
-                }
+            return self.resolve(url).video_info
         except Exception as e:
             logger.error(f"Error getting video information: {e}")
             return None
 
-    def download_audio(self, url: str) -> Tuple[str, dict]:
+    def download_audio(
+        self,
+        url: str,
+        source: Optional[YouTubeSource] = None,
+        check_cache: bool = True
+    ) -> Tuple[str, dict]:
         """
         Downloads audio from a YouTube video QUICKLY.
         
+        Downloaded audio is kept in the cache: the returned file must be
+        released with cleanup_file, which leaves cached files in place.
+        
         Args:
             url: YouTube URL
+            source: Already resolved video (skips the metadata request)
+            check_cache: Look up the audio cache first (False if the caller already did)
             
         Returns:
             Tuple with (file_path, video_info)
@@ -118,15 +328,24 @@ class YouTubeDownloader:
         if not self.validate_youtube_url(url):
             raise ValueError("Invalid YouTube URL")
         
-        # Get video information first (faster)
-        video_info = self.get_video_info(url)
-        if not video_info:
-            raise Exception("Could not get video information")
+        if source is None:
+            try:
+                source = self.resolve(url)
+            except Exception as e:
+                logger.error(f"Error getting video information: {e}")
+                raise Exception("Could not get video information")
+        video_info = source.video_info
         
-        # Check duration (10 minute limit)
-        if video_info['duration'] > 600:
-            raise Exception(f"Video too long ({video_info['duration']}s). Limit: 10 minutes")
+        # Check duration limit
+        if video_info['duration'] > MAX_DURATION_SECONDS:
+            raise Exception(f"Video too long ({video_info['duration']}s). Limit: {MAX_DURATION_SECONDS / 60:.0f} minutes")
         
+        if check_cache:
+            cached_file = self.get_cached_audio(source)
+            if cached_file is not None:
+                return cached_file, video_info
+        
+        start_time = time.perf_counter()
         try:
             logger.info(f"🚀 FAST Download: {video_info['title']}")
             
@@ -143,15 +362,15 @@ class YouTubeDownloader:
             with yt_dlp.YoutubeDL(ydl_opts) as ydl:
                 logger.info("⚡ Starting optimized download...")
                 
-                # DIRECT download without extra processing
-                info = ydl.extract_info(url, download=True)
+                # DIRECT download of the already selected format, without extracting again
+                info = ydl.process_ie_result(dict(source.info), download=True)
                 actual_filename = ydl.prepare_filename(info)
                 
                 if os.path.exists(actual_filename):
                     downloaded_file = actual_filename
                 else:
                     # Search for downloaded file by common extensions
-                    for ext in ['m4a', 'webm', 'mp4', 'wav', 'mp3']:
+                    for ext in ['m4a', 'webm', 'opus', 'mp4', 'wav', 'mp3']:
                         potential_file = self.temp_dir / f"{video_id}.{ext}"
                         if potential_file.exists():
                             downloaded_file = str(potential_file)
@@ -160,24 +379,15 @@ class YouTubeDownloader:
                 if not downloaded_file:
                     raise Exception("Downloaded file not found")
                 
-                # If not a direct audio format, convert QUICKLY
-                if not downloaded_file.lower().endswith(('.mp3', '.wav', '.m4a', '.aac')):
-                    logger.info("🔄 Quick conversion to WAV...")
-                    converted_file = str(self.temp_dir / f"{video_id}_converted.wav")
-                    
-                    # Use pydub for quick conversion
-                    from pydub import AudioSegment
-                    audio = AudioSegment.from_file(downloaded_file)
-                    audio.export(converted_file, format="wav")
-                    
-                    # Remove original file and use converted one
-                    os.unlink(downloaded_file)
-                    downloaded_file = converted_file
+                # Any container (webm/opus, m4a...) is decoded directly by the separator,
+                # so the file is kept as downloaded, without an intermediate WAV
                 
                 logger.info(f"✅ Download completed: {os.path.basename(downloaded_file)}")
-                return downloaded_file, video_info
+                DOWNLOAD_SECONDS.observe(time.perf_counter() - start_time, status='success')
+                return self.cache_audio(source, downloaded_file), video_info
                 
         except Exception as e:
+            DOWNLOAD_SECONDS.observe(time.perf_counter() - start_time, status='failure')
             logger.error(f"❌ Download error: {e}")
             raise Exception(f"Error downloading audio from YouTube: {str(e)}")
 
@@ -185,9 +395,14 @@ class YouTubeDownloader:
         """
         Removes temporary file.
         
+        Files kept in the audio cache are left in place (they are removed by
+        the cache when they expire or are evicted).
+        
         Args:
             file_path: Path of the file to remove
         """
+        if self.cache.contains(file_path):
+            return
         try:
             if os.path.exists(file_path):
                 os.unlink(file_path)
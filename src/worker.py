@@ -0,0 +1,64 @@
+"""
+Separation node.
+
+Pulls separation jobs from the broker shared with the API
+(VOICE_SEPARATOR_BROKER_URL) and runs them on this host. Start as many
+nodes as needed, on any hosts that reach the broker and share the upload
+directory and static/output with the API. Stop a node with Ctrl+C or
+SIGTERM: it finishes its running jobs first.
+
+Usage:
+    python -m src.worker --broker redis://broker-host:6379/0 --workers 2
+    python -m src.worker --broker redis://127.0.0.1:6379 --local-broker   # development, no Redis needed
+"""
+
+import argparse
+import signal
+import sys
+from typing import List, Optional
+from urllib.parse import urlparse
+import logging
+
+logger = logging.getLogger("voice-separator")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from src.core import (
+        BROKER_URL, DEFAULT_JOB_WORKERS, WORKER_PROCESSES, LocalBrokerServer, SeparationNode, connect_broker
+    )
+
+    parser = argparse.ArgumentParser(description="Run separation jobs pulled from the broker shared with the API.")
+    parser.add_argument("--broker", default=BROKER_URL,
+                        help="Broker URL, redis://[:password@]host[:port][/db] (default: VOICE_SEPARATOR_BROKER_URL)")
+    parser.add_argument("--workers", type=int, default=max(DEFAULT_JOB_WORKERS, WORKER_PROCESSES),
+                        help="Jobs run at the same time (default: the worker processes, or VOICE_SEPARATOR_JOB_WORKERS)")
+    parser.add_argument("--local-broker", action="store_true",
+                        help="Also serve an in-memory stand-in broker at the broker address (development only)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.broker:
+        parser.error("no broker (pass --broker or set VOICE_SEPARATOR_BROKER_URL)")
+
+    try:
+        broker = connect_broker(args.broker)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.local_broker:
+        address = urlparse(args.broker)
+        LocalBrokerServer(address.hostname or '127.0.0.1', address.port or 6379).start()
+
+    node = SeparationNode(broker, args.workers)
+
+    def stop(*_):
+        logger.info("Finishing the running jobs...")
+        node.stop()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    node.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+import threading
+import time
+
+import pytest
+
+from src.core.admission import (
+    DEFAULT_MODEL_BYTES, AdmissionController, AdmissionRejected, estimate_request_bytes
+)
+
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not reached"
+        time.sleep(0.01)
+
+
+def _acquire_in_thread(controller: AdmissionController, model: str, memory: int = 0, estimated: float = 0.0):
+    started = threading.Event()
+
+    def run():
+        with controller.slot(model, memory, estimated):
+            started.set()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, started
+
+
+def test_separations_of_a_model_wait_for_a_free_slot():
+    controller = AdmissionController(max_concurrent=1, memory_budget_bytes=0)
+    ticket = controller.acquire("a", 0, 1.0)
+
+    waiting, started = _acquire_in_thread(controller, "a")
+    other, other_started = _acquire_in_thread(controller, "b")
+    # Other models have their own slots
+    assert other_started.wait(5)
+    _wait_for(lambda: controller.get_stats()["waiting"] == 1)
+    assert not started.is_set()
+
+    controller.release(ticket)
+    assert started.wait(5)
+    waiting.join(5)
+    other.join(5)
+    assert controller.get_stats()["admitted"] == 3
+
+
+def test_a_full_queue_is_rejected_with_429():
+    controller = AdmissionController(max_concurrent=1, max_queue=1, memory_budget_bytes=0)
+    ticket = controller.acquire("a", 0, 10.0)
+    _acquire_in_thread(controller, "a", estimated=10.0)
+    _wait_for(lambda: controller.get_stats()["waiting"] == 1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("a", 0, 10.0)
+    assert rejected.value.status_code == 429
+    assert rejected.value.retry_after > 0
+    with pytest.raises(AdmissionRejected):
+        controller.check("a")
+    controller.release(ticket)
+
+
+def test_long_estimated_waits_are_rejected_with_503():
+    controller = AdmissionController(max_concurrent=1, max_wait=5, memory_budget_bytes=0)
+    ticket = controller.acquire("a", 0, 60.0)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("a", 0, 60.0)
+    assert rejected.value.status_code == 503
+    assert rejected.value.retry_after_header == "60"
+    controller.release(ticket)
+
+
+def test_waiting_too_long_times_out():
+    controller = AdmissionController(max_concurrent=1, max_wait=0.2, memory_budget_bytes=0)
+    ticket = controller.acquire("a", 0, 0.0)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.acquire("a", 0, 0.0)
+    assert rejected.value.status_code == 503
+    assert controller.get_stats()["timeouts"] == 1
+    controller.release(ticket)
+
+
+def test_memory_budget_is_shared_by_all_models():
+    controller = AdmissionController(max_concurrent=4, memory_budget_bytes=100)
+    ticket = controller.acquire("a", 60, 1.0)
+
+    waiting, started = _acquire_in_thread(controller, "b", memory=60)
+    _wait_for(lambda: controller.get_stats()["waiting"] == 1)
+    assert controller.get_stats()["reserved_bytes"] == 60
+
+    controller.release(ticket)
+    assert started.wait(5)
+    waiting.join(5)
+
+
+def test_a_separation_larger_than_the_budget_runs_alone():
+    controller = AdmissionController(memory_budget_bytes=100)
+    with controller.slot("a", 500, 1.0):
+        assert controller.get_stats()["running"] == 1
+
+
+def test_background_jobs_are_not_rejected():
+    controller = AdmissionController(max_concurrent=1, max_queue=0, max_wait=0.1, memory_budget_bytes=0)
+    ticket = controller.acquire("a", 0, 60.0)
+
+    job = threading.Thread(target=lambda: controller.release(controller.acquire("a", 0, 60.0, reject=False)))
+    job.start()
+    time.sleep(0.3)
+    controller.release(ticket)
+    job.join(5)
+    assert not job.is_alive()
+
+
+def test_job_queue_limit():
+    controller = AdmissionController(max_queued_jobs=2)
+    controller.check_job_queue(1, 10.0)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.check_job_queue(2, 10.0)
+    assert rejected.value.status_code == 429
+
+
+def test_long_inputs_are_budgeted_by_window():
+    short = estimate_request_bytes("not-loaded", "cpu", duration=60)
+    long = estimate_request_bytes("not-loaded", "cpu", duration=3 * 3600)
+    assert long <= estimate_request_bytes("not-loaded", "cpu", duration=600)
+    assert short >= DEFAULT_MODEL_BYTES
+    assert estimate_request_bytes("not-loaded", "cpu", duration=3 * 3600, window_seconds=20) < long
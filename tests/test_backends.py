@@ -0,0 +1,46 @@
+import torch
+from demucs.demucs import Demucs
+
+from src.core import backends
+
+
+def _model(seed: int) -> Demucs:
+    torch.manual_seed(seed)
+    return Demucs(sources=['drums', 'bass', 'other', 'vocals'], channels=8, depth=4, lstm_layers=2, samplerate=44100, segment=11).eval()
+
+
+def test_int8_weights_are_stored_and_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, 'BACKEND_CACHE_DIR', str(tmp_path))
+
+    first, backend = backends.prepare_model('tiny', 'cpu', lambda: _model(0), 'int8')
+    assert backend == 'int8'
+    assert backends.is_quantized(first)
+    path = backends.artifact_path('tiny', 'int8')
+    # Weights only: loadable without unpickling code
+    with torch.serialization.safe_globals([torch.ScriptObject]):
+        assert isinstance(torch.load(path, weights_only=True), dict)
+
+    # Different eager weights: the stored quantized ones must win
+    second, backend = backends.prepare_model('tiny', 'cpu', lambda: _model(1), 'int8')
+    assert backend == 'int8'
+    mix = torch.randn(1, 2, 44100)
+    with torch.no_grad():
+        assert torch.equal(first(mix), second(mix))
+
+
+def test_unreadable_weights_are_rebuilt(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, 'BACKEND_CACHE_DIR', str(tmp_path))
+    path = backends.artifact_path('tiny', 'int8')
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"not a checkpoint")
+
+    model, backend = backends.prepare_model('tiny', 'cpu', lambda: _model(0), 'int8')
+    assert backend == 'int8'
+    assert path.stat().st_size > len(b"not a checkpoint")
+
+
+def test_int8_falls_back_to_eager_off_cpu(tmp_path, monkeypatch):
+    monkeypatch.setattr(backends, 'BACKEND_CACHE_DIR', str(tmp_path))
+    model, backend = backends.prepare_model('tiny', 'cuda', lambda: _model(0), 'int8')
+    assert backend == 'eager'
+    assert not backends.is_quantized(model)
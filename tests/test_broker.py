@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from src.core import tasks
+from src.core.broker import JOB_FUNCTIONS, _function_name, _resolve_function
+
+
+@pytest.mark.parametrize("name", JOB_FUNCTIONS)
+def test_job_functions_round_trip(name):
+    func = getattr(tasks, name)
+    assert _function_name(func) == name
+    assert _resolve_function(name) is func
+
+
+def test_only_registered_functions_are_sent():
+    with pytest.raises(ValueError):
+        _function_name(tasks.build_stem_files)
+    with pytest.raises(ValueError):
+        _function_name(os.system)
+
+
+@pytest.mark.parametrize("name", ["system", "os.system", "build_stem_files", "src.core.tasks.run_batch_job", ""])
+def test_unknown_names_are_rejected(name):
+    with pytest.raises(ValueError):
+        _resolve_function(name)
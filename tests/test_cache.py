@@ -0,0 +1,56 @@
+from src.core.cache import DiskCache
+
+
+def _store(cache: DiskCache, key: str, size: int = 10) -> dict:
+    name = f"{key}.bin"
+    cache.path(name).write_bytes(b"x" * size)
+    return cache.put(key, [name])
+
+
+def test_entries_are_shared_between_instances(tmp_path):
+    first = DiskCache(str(tmp_path), "index.json", max_bytes=1000)
+    second = DiskCache(str(tmp_path), "index.json", max_bytes=1000)
+
+    _store(first, "a")
+    _store(second, "b")
+
+    # Each instance merges the other's entries instead of overwriting them
+    assert first.get("b") is not None
+    assert second.get("a") is not None
+    assert set(DiskCache(str(tmp_path), "index.json", max_bytes=1000)._entries) == {"a", "b"}
+
+
+def test_hits_are_written_in_batches(tmp_path):
+    cache = DiskCache(str(tmp_path), "index.json", max_bytes=1000)
+    stored = _store(cache, "a")
+    version = cache._version()
+
+    assert cache.get("a") is not None
+    assert cache._version() == version
+
+    cache.flush()
+    reloaded = DiskCache(str(tmp_path), "index.json", max_bytes=1000)
+    assert reloaded._entries["a"]["last_access"] >= stored["last_access"]
+    assert cache._version() != version
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache(str(tmp_path), "index.json", max_bytes=25)
+    _store(cache, "a")
+    _store(cache, "b")
+    cache.get("a")
+    _store(cache, "c")
+
+    assert cache.get("b") is None
+    assert not cache.path("b.bin").exists()
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_entries_with_missing_files_are_dropped(tmp_path):
+    cache = DiskCache(str(tmp_path), "index.json", max_bytes=1000)
+    _store(cache, "a")
+    cache.path("a.bin").unlink()
+
+    assert cache.get("a") is None
+    assert "a" not in DiskCache(str(tmp_path), "index.json", max_bytes=1000)._entries
@@ -0,0 +1,153 @@
+import threading
+
+import pytest
+import torch
+
+from src.core import runtime
+from src.core.microbatch import MicroBatcher, _context_key, install_micro_batching, micro_batching
+
+
+class Recorder:
+    """Forward that records the batch size of each call; each sample only depends on itself."""
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, mix):
+        self.batches.append(mix.shape[0])
+        if self.fail:
+            raise RuntimeError("forward failed")
+        return (mix * 2 + mix.mean(dim=(1, 2), keepdim=True)).unsqueeze(1).repeat(1, 2, 1, 1)
+
+
+def _expected(mix):
+    return Recorder()(mix)
+
+
+def _run_sessions(batcher, segments_per_session, sessions: int = 4):
+    """Runs the segments of several concurrent separations; returns (inputs, outputs) per session."""
+    barrier = threading.Barrier(sessions)
+    results = [None] * sessions
+    errors = []
+
+    def separation(index):
+        try:
+            with batcher.session():
+                barrier.wait(5)
+                pairs = []
+                for mix in segments_per_session(index):
+                    pairs.append((mix, batcher(mix)))
+                results[index] = pairs
+        except BaseException as e:
+            errors.append(e)
+            barrier.abort()
+
+    threads = [threading.Thread(target=separation, args=(index,)) for index in range(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results, errors
+
+
+def test_a_lone_separation_runs_directly():
+    forward = Recorder()
+    batcher = MicroBatcher(forward, max_batch=8, max_wait_ms=1000)
+    mix = torch.randn(1, 2, 100)
+    with batcher.session():
+        output = batcher(mix)
+
+    assert torch.equal(output, _expected(mix))
+    assert forward.batches == [1]
+    assert batcher._worker is None
+
+
+def test_segments_of_concurrent_separations_share_forward_passes():
+    forward = Recorder()
+    batcher = MicroBatcher(forward, max_batch=8, max_wait_ms=500)
+    results, errors = _run_sessions(batcher, lambda index: [torch.randn(1, 2, 100) for _ in range(3)])
+
+    assert not errors
+    for pairs in results:
+        for mix, output in pairs:
+            assert torch.allclose(output, _expected(mix))
+    assert sum(forward.batches) == 12
+    assert max(forward.batches) > 1
+    stats = batcher.get_stats()
+    assert stats['segments'] == 12 and stats['batches'] < 12
+
+
+def test_segments_of_different_lengths_are_only_batched_with_padding_allowed():
+    lengths = lambda index: [torch.randn(1, 2, 100 - index)]
+
+    forward = Recorder()
+    results, errors = _run_sessions(MicroBatcher(forward, max_batch=8, max_wait_ms=300), lengths)
+    assert not errors
+    assert forward.batches == [1, 1, 1, 1]
+
+    forward = Recorder()
+    results, errors = _run_sessions(MicroBatcher(forward, max_batch=8, max_wait_ms=300, max_padding=0.1), lengths)
+    assert not errors
+    assert max(forward.batches) > 1
+    for pairs in results:
+        mix, output = pairs[0]
+        # Each separation gets its own length back
+        assert output.shape[-1] == mix.shape[-1]
+
+
+def test_errors_reach_every_segment_of_the_batch():
+    batcher = MicroBatcher(Recorder(fail=True), max_batch=8, max_wait_ms=300)
+    results, errors = _run_sessions(batcher, lambda index: [torch.randn(1, 2, 100)])
+
+    assert len(errors) == 4
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_segments_run_under_autocast_are_not_batched_with_others():
+    mix = torch.randn(1, 2, 100)
+    plain = _context_key(mix)
+    with torch.autocast('cpu', dtype=torch.bfloat16):
+        assert _context_key(mix) != plain
+    with torch.inference_mode():
+        assert _context_key(mix) != plain
+
+
+def test_installed_batching_keeps_the_model_output():
+    from demucs.demucs import Demucs
+
+    torch.manual_seed(0)
+    model = Demucs(sources=['drums', 'bass', 'other', 'vocals'], channels=8, depth=4, samplerate=44100, segment=11)
+    model.eval()
+    mixes = [torch.randn(1, 2, 44100) for _ in range(3)]
+    with torch.no_grad():
+        expected = [model(mix) for mix in mixes]
+
+    install_micro_batching(model, max_batch=4)
+    outputs = [None] * 3
+    barrier = threading.Barrier(3)
+
+    def separation(index):
+        with torch.no_grad(), micro_batching(model):
+            barrier.wait(5)
+            outputs[index] = model(mixes[index])
+
+    threads = [threading.Thread(target=separation, args=(index,)) for index in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    for output, reference in zip(outputs, expected):
+        assert torch.allclose(output, reference, atol=1e-5)
+    assert model._micro_batcher.get_stats()['batched_segments'] > 0
+
+
+@pytest.mark.parametrize("micro_batch_size, threads", [(8, 8), (1, 2)])
+def test_cpus_are_split_between_concurrent_forward_passes(monkeypatch, micro_batch_size, threads):
+    monkeypatch.setattr(runtime, 'MICRO_BATCH_SIZE', micro_batch_size)
+    monkeypatch.setattr(runtime, 'available_cpus', lambda: 8)
+
+    # With micro-batching the forward passes of a model run one at a time
+    assert runtime.RuntimeProfile(threads=0, concurrency=4).threads == threads
+    assert runtime.RuntimeProfile(threads=0, concurrency=1, processes=4).threads == 2
@@ -0,0 +1,78 @@
+import threading
+import time
+
+import pytest
+import torch
+
+from src.core import model_registry
+from src.core.estimator import ProcessingTimeEstimator
+from src.core.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def loads(monkeypatch, tmp_path):
+    """Replaces the pretrained weights with small modules and records each load."""
+    calls = []
+    estimator = ProcessingTimeEstimator(str(tmp_path / "estimates.json"))
+    estimator.persist = False
+
+    def get_model(name):
+        calls.append(name)
+        if name == "broken":
+            raise RuntimeError("no such model")
+        time.sleep(0.05)
+        return torch.nn.Linear(4, 4)
+
+    monkeypatch.setattr(model_registry.pretrained, "get_model", get_model)
+    monkeypatch.setattr(model_registry, "get_processing_time_estimator", lambda: estimator)
+    return calls
+
+
+def test_concurrent_requests_load_a_model_once(loads):
+    registry = ModelRegistry(backend="eager")
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(registry.get_model("a", "cpu"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert loads == ["a"]
+    assert len(models) == 8 and all(model is models[0] for model in models)
+    assert not models[0].training
+    stats = registry.get_stats()
+    assert stats["loads"] == 1
+    assert stats["hits"] + stats["misses"] == 8
+
+
+def test_least_recently_used_models_are_evicted(loads):
+    registry = ModelRegistry(max_models=2, backend="eager")
+    registry.get_model("a", "cpu")
+    registry.get_model("b", "cpu")
+    registry.get_model("a", "cpu")
+    registry.get_model("c", "cpu")
+
+    assert registry.is_loaded("a", "cpu")
+    assert not registry.is_loaded("b", "cpu")
+    assert registry.is_loaded("c", "cpu")
+    assert registry.get_stats()["evictions"] == 1
+
+
+def test_models_of_worker_processes_count_as_loaded(loads):
+    registry = ModelRegistry(backend="eager")
+    registry.set_remote_models("1234", [("a", "cpu")])
+
+    assert registry.is_loaded("a", "cpu")
+    registry.set_remote_models("1234", [])
+    assert not registry.is_loaded("a", "cpu")
+    assert loads == []
+
+
+def test_failed_loads_are_retried(loads):
+    registry = ModelRegistry(backend="eager")
+    for _ in range(2):
+        with pytest.raises(Exception, match="Failed to load model"):
+            registry.get_model("broken", "cpu")
+
+    assert loads == ["broken", "broken"]
+    assert registry.get_stats()["load_errors"] == 2
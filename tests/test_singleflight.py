@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from src.core.singleflight import SingleFlight
+
+
+def test_concurrent_calls_run_once():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.get_stats()['coalesced'] < 3:
+        assert time.monotonic() < deadline, "followers did not join the running call"
+        time.sleep(0.01)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results, key=lambda item: item[1]) == [("result", False)] + [("result", True)] * 3
+    assert flight.get_stats() == {'calls': 1, 'coalesced': 3, 'in_flight': 0}
+
+
+def test_async_followers_share_the_result_and_the_error():
+    flight = SingleFlight()
+    release = threading.Event()
+    threads = set()
+
+    def work(value):
+        threads.add(threading.get_ident())
+        release.wait(5)
+        if value == "fail":
+            raise RuntimeError("boom")
+        return value
+
+    async def run(value):
+        tasks = [asyncio.create_task(flight.do_async(value, work, value)) for _ in range(20)]
+        await asyncio.sleep(0.1)
+        release.set()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    results = asyncio.run(run("ok"))
+    assert results.count(("ok", False)) == 1
+    assert results.count(("ok", True)) == 19
+    # Followers wait on the event loop, not on threads of their own
+    assert len(threads) == 1
+
+    release.clear()
+    errors = asyncio.run(run("fail"))
+    assert all(isinstance(error, RuntimeError) for error in errors)
+
+
+def test_calls_after_completion_run_again():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == (1, False)
+    assert flight.do("key", lambda: 2) == (2, False)
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("x"))
+    assert flight.get_stats()['in_flight'] == 0
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from src.core.streaming import crossfade_frames, iter_separated_windows
+
+
+def _sources(window: np.ndarray) -> np.ndarray:
+    """Stand-in model returning two copies of the input as its sources."""
+    return np.stack([window, window * 0.5])
+
+
+def _chunks(audio: np.ndarray, size: int):
+    for start in range(0, audio.shape[1], size):
+        yield audio[:, start:start + size]
+
+
+@pytest.mark.parametrize("frames", [1, 99, 100, 101, 250, 1000, 1234])
+@pytest.mark.parametrize("chunk_size", [7, 100, 5000])
+def test_windows_cover_the_input_exactly(frames, chunk_size):
+    audio = np.random.default_rng(0).standard_normal((2, frames)).astype(np.float32)
+
+    blocks = list(iter_separated_windows(_sources, _chunks(audio, chunk_size), window_frames=100, overlap_frames=20))
+    out = np.concatenate(blocks, axis=-1)
+
+    assert out.shape == (2, 2, frames)
+    # Crossfading two identical separations gives the separation back
+    np.testing.assert_allclose(out[0], audio, atol=1e-5)
+    np.testing.assert_allclose(out[1], audio * 0.5, atol=1e-5)
+
+
+def test_windows_are_crossfaded():
+    calls = []
+
+    def run_model(window):
+        calls.append(window.shape[1])
+        return np.full((1, 1, window.shape[1]), float(len(calls)), dtype=np.float32)
+
+    audio = np.zeros((1, 150), dtype=np.float32)
+    out = np.concatenate(list(iter_separated_windows(run_model, [audio], 100, 20)), axis=-1)[0, 0]
+
+    assert calls == [100, 70]
+    assert out.shape == (150,)
+    assert np.all(out[:80] == 1.0)
+    assert np.all(out[100:] == 2.0)
+    # Linear transition from the first window to the second over the overlap
+    assert np.all(np.diff(out[80:100]) > 0)
+
+
+def test_window_must_be_longer_than_the_crossfade():
+    with pytest.raises(ValueError):
+        list(iter_separated_windows(_sources, [np.zeros((2, 10), dtype=np.float32)], 20, 20))
+
+
+def test_crossfade_frames():
+    assert crossfade_frames(7.8, 0.25, 44100) == 85995
+    assert crossfade_frames(7.8, 0.0, 44100) == 1
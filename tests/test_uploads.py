@@ -0,0 +1,83 @@
+import asyncio
+import os
+import struct
+import tempfile
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from starlette.datastructures import UploadFile
+
+from src.api import routes
+from src.core import sniff_audio_format
+
+LIMIT = 100_000
+
+
+def _wav(size: int) -> bytes:
+    """A WAV header followed by silence, size bytes in total."""
+    header = b"RIFF" + struct.pack("<I", size - 8) + b"WAVE"
+    return header + b"\0" * (size - len(header))
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(routes, "MAX_UPLOAD_BYTES", LIMIT)
+    monkeypatch.setattr(routes, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _save(data: bytes, filename: str) -> str:
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(data)
+    spooled.seek(0)
+    return asyncio.run(routes._save_upload(UploadFile(spooled, size=len(data), filename=filename)))
+
+
+@pytest.mark.parametrize("header, expected", [
+    (_wav(64)[:12], ".wav"),
+    (b"ID3\x04\0\0\0\0\0\0\0\0", ".mp3"),
+    (b"\xff\xfb\x90\x00" + b"\0" * 8, ".mp3"),
+    (b"\xff\xf1\x50\x80" + b"\0" * 8, ".aac"),
+    (b"fLaC\0\0\0\x22\0\0\0\0", ".flac"),
+    (b"\0\0\0\x20ftypM4A ", ".m4a"),
+    (b"OggS\0\x02\0\0\0\0\0\0", ".ogg"),
+    (b"<html><body>", None),
+    (b"", None),
+])
+def test_audio_formats_are_recognized_by_content(header, expected):
+    assert sniff_audio_format(header) == expected
+
+
+def test_uploads_are_copied_with_the_detected_extension(upload_dir):
+    data = _wav(LIMIT)
+    path = _save(data, "track.bin")
+
+    assert path.startswith(str(upload_dir)) and path.endswith(".wav")
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+
+@pytest.mark.parametrize("data, status", [(b"not audio at all", 400), (_wav(LIMIT + 1), 413)])
+def test_rejected_uploads_leave_no_file(upload_dir, data, status):
+    with pytest.raises(HTTPException) as rejected:
+        _save(data, "track.wav")
+    assert rejected.value.status_code == status
+    assert os.listdir(upload_dir) == []
+
+
+def test_bodies_over_the_limit_are_rejected_before_they_are_read(upload_dir):
+    client = TestClient(routes.app)
+    response = client.post("/api/separate", files={"file": ("a.wav", _wav(3 * LIMIT), "audio/wav")})
+    assert response.status_code == 413
+
+
+def test_the_limit_applies_to_each_file_of_a_batch(upload_dir):
+    client = TestClient(routes.app)
+    files = [("files", (f"{name}.wav", _wav(LIMIT // 2), "audio/wav")) for name in "abc"]
+    files.append(("files", ("big.wav", _wav(LIMIT + 1), "audio/wav")))
+
+    # Larger than one file may be, but each file is checked on its own
+    response = client.post("/api/batch", files=files)
+    assert response.status_code == 413
+    assert os.listdir(upload_dir) == []